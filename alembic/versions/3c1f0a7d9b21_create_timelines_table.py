@@ -0,0 +1,52 @@
+"""create timelines table
+
+Revision ID: 3c1f0a7d9b21
+Revises: f9b8f7b3cd8a
+Create Date: 2026-10-18 09:12:44.102311
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c1f0a7d9b21'
+down_revision = 'f9b8f7b3cd8a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'timelines',
+        sa.Column('user_id', sa.Integer, sa.ForeignKey(
+            "users.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column('tweet_id', sa.Integer, sa.ForeignKey(
+            "tweets.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column('author_id', sa.Integer, sa.ForeignKey(
+            "users.id", ondelete="CASCADE"), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False)
+    )
+    op.create_index('ix_timelines_user_id_created_at_tweet_id',
+                    'timelines', ['user_id', 'created_at', 'tweet_id'])
+    op.create_index('ix_timelines_user_id_author_id',
+                    'timelines', ['user_id', 'author_id'])
+    # Tweets are looked up by author when fanning out and back-filling
+    op.create_index('ix_tweets_user_id_created_at',
+                    'tweets', ['user_id', 'created_at'])
+
+    # Materialize the timelines for the follow relationships that already exist
+    op.execute(
+        """
+        INSERT INTO timelines (user_id, tweet_id, author_id, created_at)
+        SELECT DISTINCT follows.user_id, tweets.id, tweets.user_id, tweets.created_at
+        FROM follows
+        JOIN tweets ON tweets.user_id = follows.follows_user_id
+        WHERE follows.user_id IS NOT NULL
+        """
+    )
+
+
+def downgrade():
+    op.drop_index('ix_tweets_user_id_created_at', table_name='tweets')
+    op.drop_table('timelines')
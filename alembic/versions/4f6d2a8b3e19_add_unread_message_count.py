@@ -0,0 +1,37 @@
+"""add unread message count
+
+Revision ID: 4f6d2a8b3e19
+Revises: 7e2b4c9a1d58
+Create Date: 2026-10-18 18:37:25.184096
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f6d2a8b3e19'
+down_revision = '7e2b4c9a1d58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column(
+        'unread_message_count', sa.Integer, nullable=False, server_default='0'))
+    op.execute(
+        """
+        UPDATE users SET unread_message_count = counts.count
+        FROM (
+            SELECT user_to_id AS id, count(*) AS count
+            FROM messages
+            WHERE is_read IS NOT TRUE
+            GROUP BY user_to_id
+        ) AS counts
+        WHERE users.id = counts.id
+        """
+    )
+
+
+def downgrade():
+    op.drop_column('users', 'unread_message_count')
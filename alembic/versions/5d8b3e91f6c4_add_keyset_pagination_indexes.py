@@ -0,0 +1,51 @@
+"""add keyset pagination indexes
+
+Revision ID: 5d8b3e91f6c4
+Revises: a47e2c5b8d10
+Create Date: 2026-10-18 11:20:05.318472
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d8b3e91f6c4'
+down_revision = 'a47e2c5b8d10'
+branch_labels = None
+depends_on = None
+
+# (index name, table, columns) - every list query orders by, and seeks on,
+# the trailing columns of one of these
+INDEXES = [
+    ('ix_tweets_created_at_id', 'tweets', ['created_at', 'id']),
+    ('ix_tweets_user_id_created_at_id', 'tweets',
+     ['user_id', 'created_at', 'id']),
+    ('ix_comments_user_id_created_at_id', 'comments',
+     ['user_id', 'created_at', 'id']),
+    ('ix_comments_tweet_id_created_at_id', 'comments',
+     ['tweet_id', 'created_at', 'id']),
+    ('ix_tweet_likes_user_id_id', 'tweet_likes', ['user_id', 'id']),
+    ('ix_tweet_likes_tweet_id_id', 'tweet_likes', ['tweet_id', 'id']),
+    ('ix_comment_likes_comment_id_id', 'comment_likes', ['comment_id', 'id']),
+    ('ix_follows_user_id_id', 'follows', ['user_id', 'id']),
+    ('ix_follows_follows_user_id_id', 'follows', ['follows_user_id', 'id']),
+    ('ix_messages_user_from_id_created_at_id', 'messages',
+     ['user_from_id', 'created_at', 'id']),
+    ('ix_messages_user_to_id_created_at_id', 'messages',
+     ['user_to_id', 'created_at', 'id']),
+]
+
+
+def upgrade():
+    # Superseded by ix_tweets_user_id_created_at_id
+    op.drop_index('ix_tweets_user_id_created_at', table_name='tweets')
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
+    op.create_index('ix_tweets_user_id_created_at',
+                    'tweets', ['user_id', 'created_at'])
@@ -0,0 +1,31 @@
+"""add messages conversation index
+
+Revision ID: 7e2b4c9a1d58
+Revises: d3a91c5e7f20
+Create Date: 2026-10-18 18:06:47.912035
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7e2b4c9a1d58'
+down_revision = 'd3a91c5e7f20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Both directions of a conversation share the same (least, greatest)
+    # prefix, so a page of it is a single index range scan
+    op.create_index('ix_messages_conversation_created_at_id', 'messages', [
+        sa.text('least(user_from_id, user_to_id)'),
+        sa.text('greatest(user_from_id, user_to_id)'),
+        'created_at',
+        'id',
+    ])
+
+
+def downgrade():
+    op.drop_index('ix_messages_conversation_created_at_id', table_name='messages')
@@ -0,0 +1,32 @@
+"""add users pull author
+
+Revision ID: 9c3e5a7b1f42
+Revises: 4f6d2a8b3e19
+Create Date: 2026-10-18 21:12:47.503218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from api.core.config import settings
+
+
+# revision identifiers, used by Alembic.
+revision = '9c3e5a7b1f42'
+down_revision = '4f6d2a8b3e19'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column(
+        'pull_author', sa.Boolean, nullable=False, server_default='false'))
+    # Tweets of the users above the threshold were not pushed to timelines
+    op.execute(
+        sa.text("UPDATE users SET pull_author = true WHERE follower_count > :threshold")
+        .bindparams(threshold=settings.TIMELINE_FANOUT_FOLLOWER_THRESHOLD)
+    )
+
+
+def downgrade():
+    op.drop_column('users', 'pull_author')
@@ -0,0 +1,27 @@
+"""add follows follower index
+
+Revision ID: a47e2c5b8d10
+Revises: 3c1f0a7d9b21
+Create Date: 2026-10-18 10:03:27.551920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a47e2c5b8d10'
+down_revision = '3c1f0a7d9b21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Used to count followers when deciding between push and pull, and to
+    # find the followers of an author during fan-out
+    op.create_index('ix_follows_follows_user_id_user_id',
+                    'follows', ['follows_user_id', 'user_id'])
+
+
+def downgrade():
+    op.drop_index('ix_follows_follows_user_id_user_id', table_name='follows')
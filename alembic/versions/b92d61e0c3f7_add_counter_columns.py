@@ -0,0 +1,47 @@
+"""add counter columns
+
+Revision ID: b92d61e0c3f7
+Revises: 5d8b3e91f6c4
+Create Date: 2026-10-18 13:41:52.904117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b92d61e0c3f7'
+down_revision = '5d8b3e91f6c4'
+branch_labels = None
+depends_on = None
+
+# (table, counter column, counted table, foreign key on counted table)
+COUNTERS = [
+    ('tweets', 'like_count', 'tweet_likes', 'tweet_id'),
+    ('tweets', 'comment_count', 'comments', 'tweet_id'),
+    ('users', 'follower_count', 'follows', 'follows_user_id'),
+    ('users', 'following_count', 'follows', 'user_id'),
+    ('comments', 'like_count', 'comment_likes', 'comment_id'),
+]
+
+
+def upgrade():
+    for table, column, counted_table, foreign_key in COUNTERS:
+        op.add_column(table, sa.Column(
+            column, sa.Integer, nullable=False, server_default='0'))
+        op.execute(
+            f"""
+            UPDATE {table} SET {column} = counts.count
+            FROM (
+                SELECT {foreign_key} AS id, count(*) AS count
+                FROM {counted_table}
+                GROUP BY {foreign_key}
+            ) AS counts
+            WHERE {table}.id = counts.id
+            """
+        )
+
+
+def downgrade():
+    for table, column, _, _ in reversed(COUNTERS):
+        op.drop_column(table, column)
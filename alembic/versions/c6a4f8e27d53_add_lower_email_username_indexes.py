@@ -0,0 +1,29 @@
+"""add lower(email) and lower(username) indexes
+
+Revision ID: c6a4f8e27d53
+Revises: b92d61e0c3f7
+Create Date: 2026-10-18 15:02:39.660218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c6a4f8e27d53'
+down_revision = 'b92d61e0c3f7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Users are looked up case-insensitively, which cannot use the plain
+    # indexes on email and username
+    op.create_index('ix_users_lower_email', 'users', [sa.text('lower(email)')])
+    op.create_index('ix_users_lower_username', 'users',
+                    [sa.text('lower(username)')])
+
+
+def downgrade():
+    op.drop_index('ix_users_lower_username', table_name='users')
+    op.drop_index('ix_users_lower_email', table_name='users')
@@ -0,0 +1,27 @@
+"""add messages unread index
+
+Revision ID: d3a91c5e7f20
+Revises: c6a4f8e27d53
+Create Date: 2026-10-18 17:41:12.504318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3a91c5e7f20'
+down_revision = 'c6a4f8e27d53'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Partial index: the conversation list counts unread messages per
+    # sender, and read messages (the vast majority) are left out of it
+    op.create_index('ix_messages_unread', 'messages', ['user_to_id', 'user_from_id'],
+                    postgresql_where=sa.text('is_read IS NOT TRUE'))
+
+
+def downgrade():
+    op.drop_index('ix_messages_unread', table_name='messages')
@@ -0,0 +1,194 @@
+# SQLAlchemy
+from sqlalchemy import inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+# Types
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+# Custom Modules
+from . import crud, models, schemas
+from .database import Base
+
+#
+# Async equivalents of the crud functions used by async routes.
+#
+# Each one runs the crud function of the same name through
+# AsyncSession.run_sync: the query code is shared with crud, but every
+# statement is awaited on asyncpg, so the event loop is never blocked.
+#
+# Lazy loading is not possible once a result is back on the event loop, so
+# every relationship the caller reads must be listed in load.
+#
+
+
+def _load(row: Any, path: str):
+    """Load the expired columns of row and the relationships on path (eg. "tweet.user")
+    """
+    if not isinstance(row, Base):
+        return
+    state = inspect(row)
+    # Only columns: refreshing a relationship would expire one loaded by an
+    # earlier path (unloaded relationships also count as expired)
+    expired_columns = [
+        key for key in state.expired_attributes if key in state.mapper.column_attrs]
+    if state.persistent and expired_columns:
+        state.session.refresh(row, attribute_names=expired_columns)
+    if path:
+        attribute, _, rest = path.partition(".")
+        _load(getattr(row, attribute), rest)
+
+
+async def run(db: AsyncSession, fn: Callable[..., Any], *args: Any, load: Sequence[str] = (), **kwargs: Any) -> Any:
+    """Call the sync crud function fn with db, then load the relationships in load
+    """
+    def call(session: Session):
+        result = fn(session, *args, **kwargs)
+        if isinstance(result, dict):
+            rows = list(result.values())
+        elif isinstance(result, (list, tuple)):
+            rows = result
+        else:
+            rows = [result]
+        for row in rows:
+            _load(row, "")
+            for path in load:
+                _load(row, path)
+        return result
+    return await db.run_sync(call)
+
+
+#################
+#     Users     #
+#################
+
+async def get_user_by_id(db: AsyncSession, user_id: int) -> Union[models.User, None]:
+    return await run(db, crud.get_user_by_id, user_id)
+
+
+async def get_user_by_email(db: AsyncSession, email: str) -> Union[models.User, None]:
+    return await run(db, crud.get_user_by_email, email)
+
+
+async def get_user_by_email_or_username(db: AsyncSession, email: str) -> Union[models.User, None]:
+    return await run(db, crud.get_user_by_email_or_username, email)
+
+
+async def get_user_by_confirmation_key(db: AsyncSession, confirmation_key: str) -> Union[models.User, None]:
+    return await run(db, crud.get_user_by_confirmation_key, confirmation_key)
+
+
+async def create_user(db: AsyncSession, user: schemas.UserCreate, hashed_password: str, confirmation_key: str) -> models.User:
+    return await run(db, crud.create_user, user, hashed_password, confirmation_key)
+
+
+async def verify_account(db: AsyncSession, user_id: int) -> models.User:
+    return await run(db, crud.verify_account, user_id)
+
+
+#################
+#    Comments   #
+#################
+
+def _create_tweet_comment(db: Session, user_id: int, comment: schemas.CommentCreate) -> models.Comments:
+    db_comment = crud.create_tweet_comment(db, user_id, comment)
+    # Load the commenter and the tweet owner in one query, so the load
+    # paths below are served from the identity map
+    crud.get_users_by_ids(db, [db_comment.user_id, db_comment.tweet.user_id])
+    return db_comment
+
+
+async def create_tweet_comment(db: AsyncSession, user_id: int, comment: schemas.CommentCreate) -> models.Comments:
+    return await run(db, _create_tweet_comment, user_id, comment, load=["user", "tweet.user"])
+
+
+async def get_comment_by_id(db: AsyncSession, comment_id: int) -> models.Comments:
+    return await run(db, crud.get_comment_by_id, comment_id)
+
+
+async def update_comment(db: AsyncSession, user_id: int, comment: schemas.CommentUpdate) -> models.Comments:
+    return await run(db, crud.update_comment, user_id, comment, load=["user"])
+
+
+async def delete_comment(db: AsyncSession, user_id: int, comment: schemas.CommentDelete):
+    return await run(db, crud.delete_comment, user_id, comment)
+
+
+#################
+#    Follows    #
+#################
+
+async def create_follow_relationship(db: AsyncSession, user_id: int, follow_user_id: int):
+    return await run(db, crud.create_follow_relationship, user_id, follow_user_id)
+
+
+async def delete_follow_relationship(db: AsyncSession, user_id: int, follow_user_id: int):
+    return await run(db, crud.delete_follow_relationship, user_id, follow_user_id)
+
+
+async def get_presence_audiences(db: AsyncSession, user_ids: List[int], viewer_ids: List[int]) -> Dict[int, List[int]]:
+    return await run(db, crud.get_presence_audiences, user_ids, viewer_ids)
+
+
+#################
+#  Tweet Likes  #
+#################
+
+async def get_tweet_like_by_tweet_id_and_user_id(db: AsyncSession, user_id: int, tweet_id: int) -> models.TweetLikes:
+    return await run(db, crud.get_tweet_like_by_tweet_id_and_user_id, user_id, tweet_id, load=["user"])
+
+
+async def get_all_tweet_likes(db: AsyncSession, skip: int = 0, limit: int = 2, cursor: Optional[str] = None) -> List[models.TweetLikes]:
+    return await run(db, crud.get_all_tweet_likes, skip=skip, limit=limit, cursor=cursor, load=["user"])
+
+
+async def get_all_tweet_likes_for_tweet(db: AsyncSession, tweet_id: int, skip: int = 0, limit: Optional[int] = None, cursor: Optional[str] = None) -> List[models.TweetLikes]:
+    return await run(db, crud.get_all_tweet_likes_for_tweet, tweet_id, skip=skip, limit=limit, cursor=cursor, load=["user"])
+
+
+async def create_tweet_like_for_tweet(db: AsyncSession, tweet_id: int, user_id: int) -> models.TweetLikes:
+    return await run(db, crud.create_tweet_like_for_tweet, tweet_id, user_id, load=["user"])
+
+
+async def delete_tweet_like(db: AsyncSession, user_id: int, tweet_id: int):
+    return await run(db, crud.delete_tweet_like, user_id, tweet_id)
+
+
+#################
+# Comment Likes #
+#################
+
+async def get_comment_like_by_comment_id_and_user_id(db: AsyncSession, user_id: int, comment_id: int) -> models.CommentLikes:
+    return await run(db, crud.get_comment_like_by_comment_id_and_user_id, user_id, comment_id, load=["user", "comment"])
+
+
+async def create_comment_like_for_comment(db: AsyncSession, comment_id: int, user_id: int) -> models.CommentLikes:
+    return await run(db, crud.create_comment_like_for_comment, comment_id, user_id, load=["user", "comment"])
+
+
+async def delete_comment_like_by_user_and_comment_id(db: AsyncSession, user_id: int, comment_id: int):
+    return await run(db, crud.delete_comment_like_by_user_and_comment_id, user_id, comment_id)
+
+
+#################
+#    Messages   #
+#################
+
+async def get_message_by_id(db: AsyncSession, message_id: int) -> models.Messages:
+    return await run(db, crud.get_message_by_id, message_id)
+
+
+async def create_message(db: AsyncSession, user_id: int, body: schemas.MessageCreateRequestBody) -> models.Messages:
+    return await run(db, crud.create_message, user_id, body, load=["user_to"])
+
+
+async def mark_conversation_read(db: AsyncSession, user_id: int, other_user_id: int, up_to_message_id: int) -> int:
+    return await run(db, crud.mark_conversation_read, user_id, other_user_id, up_to_message_id)
+
+
+async def get_unread_message_count(db: AsyncSession, user_id: int) -> int:
+    return await run(db, crud.get_unread_message_count, user_id)
+
+
+async def delete_message(db: AsyncSession, user_id: int, message: schemas.MessageDeleteRequestBody):
+    return await run(db, crud.delete_message, user_id, message)
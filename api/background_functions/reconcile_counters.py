@@ -0,0 +1,44 @@
+# Standard Library
+import asyncio
+
+# Types
+from typing import Dict
+
+# Starlette
+from starlette.concurrency import run_in_threadpool
+
+# Custom Modules
+from .. import crud
+from ..database import SessionLocal
+
+# Repairs drift in the denormalized counter columns (like_count,
+# comment_count, follower_count, ...). Runs periodically inside the app when
+# COUNTER_RECONCILE_INTERVAL_SECONDS is set, or once from the command line:
+#
+#   python -m api.background_functions.reconcile_counters
+#
+# tweets.like_count is included when LIKE_COUNTER_FLUSH_INTERVAL_MS buffers
+# it: the buffer recounts rows instead of adding deltas, so it never
+# undoes a repair.
+
+
+def reconcile_counters() -> Dict[str, int]:
+    db = SessionLocal()
+    try:
+        return crud.reconcile_counters(db)
+    finally:
+        db.close()
+
+
+async def reconcile_counters_periodically(interval_seconds: int):
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            repaired = await run_in_threadpool(reconcile_counters)
+            print("Reconciled counters", repaired)
+        except Exception as e:
+            print("Error reconciling counters", e)
+
+
+if __name__ == "__main__":
+    print(reconcile_counters())
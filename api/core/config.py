@@ -1,5 +1,6 @@
 # Standard Library
 import os
+import re
 
 # Types
 from typing import Any, Dict, List, Optional, Union
@@ -48,6 +49,81 @@ class Settings(BaseSettings):
     FIRST_SUPERUSER_PASSWORD: str = os.environ.get("FIRST_SUPERUSER_PASSWORD")
     USERS_OPEN_REGISTRATION: bool = False
 
+    # Number of recent tweets copied into a user's home timeline when they
+    # start following someone
+    TIMELINE_BACKFILL_SIZE: int = 100
+    # Authors with more followers than this are not fanned out on write. Their
+    # tweets are merged into home timelines at read time instead.
+    TIMELINE_FANOUT_FOLLOWER_THRESHOLD: int = 10000
+
+    # How often each worker recounts the denormalized counter columns and
+    # repairs drift. 0 disables it (run the job from cron instead).
+    COUNTER_RECONCILE_INTERVAL_SECONDS: int = 0
+    # Liked and unliked tweets are recounted in batches this often (see
+    # CounterBuffer). 0 updates tweets.like_count in the same transaction as the like.
+    LIKE_COUNTER_FLUSH_INTERVAL_MS: int = 500
+
+    # Serve the /metrics endpoints (pool, cache and connection internals).
+    # Off by default: they are not authenticated, so only enable them where
+    # the app is not reachable from the internet (or the path is blocked).
+    METRICS_ENABLED: bool = False
+
+    # Authenticated users are cached per worker for this long, so most
+    # requests authenticate without touching the database
+    PRINCIPAL_CACHE_TTL_SECONDS: int = 60
+    PRINCIPAL_CACHE_MAX_SIZE: int = 10000
+
+    # bcrypt runs in its own thread pool so logins cannot stall the event loop.
+    # Once PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_SIZE hashes are in
+    # flight, new ones are rejected with a 503 and Retry-After.
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_QUEUE_SIZE: int = 32
+    PASSWORD_HASH_RETRY_AFTER_SECONDS: int = 1
+
+    # Connection pool, per engine and per worker process
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 5
+    DB_POOL_TIMEOUT: int = 10
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # Set when connecting through PgBouncer, along with its pool_mode
+    # ("session" or "transaction"). In transaction mode the engines keep no
+    # connections of their own and nothing prepared outlives a transaction.
+    DB_PGBOUNCER: bool = False
+    DB_PGBOUNCER_POOL_MODE: str = "session"
+
+    # How WebSocket events reach users connected to other workers:
+    # "memory" (single worker), "postgres" (LISTEN/NOTIFY) or "redis"
+    WS_BROKER: str = "memory"
+    # Defaults to the database url for postgres, redis://localhost:6379/0 for redis
+    WS_BROKER_URL: Optional[str] = None
+    WS_BROKER_CHANNEL: str = "ws_events"
+    # Workers not heard from for 3 heartbeats are treated as gone
+    WS_PRESENCE_HEARTBEAT_SECONDS: int = 15
+
+    # Each WebSocket has its own outbound queue. When a client falls this far
+    # behind, new messages are dropped ("drop") or it is disconnected
+    # ("disconnect"). A single write taking longer than the timeout also
+    # disconnects it.
+    WS_SEND_QUEUE_SIZE: int = 256
+    WS_SLOW_CONSUMER_POLICY: str = "drop"
+    WS_SEND_TIMEOUT_SECONDS: int = 10
+    # Topics (tweet:1, user:2, ...) a single WebSocket may subscribe to
+    WS_MAX_TOPICS_PER_CONNECTION: int = 200
+    # Presence changes are collected and sent as one diff per interval, only
+    # to the user's followers and conversation partners
+    WS_PRESENCE_FLUSH_MS: int = 1000
+    # At most one typing event per (sender, recipient) per interval
+    WS_TYPING_THROTTLE_MS: int = 2000
+    # Events kept per user for clients reconnecting with lastEventId, and
+    # how long they are kept after the user's last connection closes
+    WS_REPLAY_BUFFER_SIZE: int = 100
+    WS_RESUME_WINDOW_SECONDS: int = 120
+    # Comment line sent on idle /events/stream responses, so proxies keep
+    # them open, and the reconnect delay suggested to EventSource clients
+    SSE_HEARTBEAT_SECONDS: int = 15
+    SSE_RETRY_MS: int = 3000
+
     class Config:
         case_sensitive = True
 
@@ -71,3 +147,12 @@ def get_db_connection_url():
 
     elif env == "production":
         return os.environ.get("PRODUCTION_POSTGRES_URL")
+
+
+def get_async_db_connection_url():
+    """get_db_connection_url for the asyncpg driver (used by the AsyncSession)
+    """
+    url = get_db_connection_url()
+    if not url:
+        return url
+    return re.sub(r"^postgres(ql)?(\+\w+)?://", "postgresql+asyncpg://", url)
@@ -0,0 +1,106 @@
+# Standard Library
+import asyncio
+import threading
+
+# Types
+from typing import List, Set
+
+# SQLAlchemy
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+# Starlette
+from starlette.concurrency import run_in_threadpool
+
+# Custom Modules
+from .. import models
+from ..database import SessionLocal
+from .config import settings
+
+
+class CounterBuffer:
+    """Batches the writes to a counter column (eg. models.Tweet.like_count).
+
+    Every like on a viral tweet would otherwise update (and lock) the same
+    tweets row. Instead the rows whose source rows changed are marked, and
+    every flush_interval_ms each marked row is recounted from source (eg.
+    models.TweetLikes.tweet_id), so the row is locked once per interval per
+    worker.
+
+    A flush writes the true count rather than adding deltas, so it cannot
+    drift, and reconcile_counters can repair the column at any time. Rows
+    still marked when a worker dies are fixed by their next like or by the
+    reconciliation job.
+    """
+
+    def __init__(self, counter, source, flush_interval_ms: int):
+        self.counter = counter
+        self.source = source
+        self.flush_interval_ms = flush_interval_ms
+        self.pending: Set[int] = set()
+        # mark() is called from sync routes in the threadpool and from the event loop
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.flush_interval_ms > 0
+
+    def mark(self, row_id: int):
+        """Recount row_id on the next flush. Call it after the change to the
+        source rows is committed.
+        """
+        with self.lock:
+            self.pending.add(row_id)
+
+    def drain(self) -> List[int]:
+        with self.lock:
+            pending, self.pending = self.pending, set()
+        return sorted(pending)
+
+    def flush(self, db: Session) -> int:
+        """Recount every marked row in one transaction. Returns the number of rows updated.
+        """
+        row_ids = self.drain()
+        if not row_ids:
+            return 0
+        model = self.counter.class_
+        actual = select(func.count()).select_from(self.source.class_).where(
+            self.source == model.id).scalar_subquery()
+        try:
+            # Lock in id order first, so concurrent flushes from other
+            # workers cannot deadlock on each other's rows. The count is then
+            # taken after any flush we waited for, and never overwrites a
+            # newer one.
+            db.execute(select(model.id).where(model.id.in_(row_ids)).order_by(
+                model.id).with_for_update())
+            db.execute(update(model).where(model.id.in_(row_ids)).values(
+                {self.counter: actual}).execution_options(synchronize_session=False))
+            db.commit()
+        except Exception:
+            db.rollback()
+            # Mark the rows again so the next flush retries them
+            for row_id in row_ids:
+                self.mark(row_id)
+            raise
+        return len(row_ids)
+
+    def flush_with_new_session(self) -> int:
+        db = SessionLocal()
+        try:
+            return self.flush(db)
+        finally:
+            db.close()
+
+    async def run(self):
+        """Flush every flush_interval_ms until cancelled
+        """
+        while True:
+            await asyncio.sleep(self.flush_interval_ms / 1000)
+            try:
+                await run_in_threadpool(self.flush_with_new_session)
+            except Exception as e:
+                print("Error flushing counters", e)
+
+
+tweet_like_counter = CounterBuffer(
+    models.Tweet.like_count, models.TweetLikes.tweet_id, settings.LIKE_COUNTER_FLUSH_INTERVAL_MS)
@@ -0,0 +1,90 @@
+# Standard Library
+import threading
+import time
+
+# Types
+from typing import Dict
+
+# SQLAlchemy
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+
+class PoolStats:
+    """Checkout counters for one connection pool.
+
+    size/checked out/overflow come from the pool itself. The wait numbers
+    tell whether requests are queueing for a connection (pool too small) or
+    timing out (DB_POOL_TIMEOUT reached).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def record(self, wait_seconds: float, timed_out: bool = False):
+        with self.lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            # Anything over a millisecond had to wait for a connection
+            if wait_seconds > 0.001:
+                self.waits += 1
+            self.total_wait_seconds += wait_seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+
+    def snapshot(self, pool: QueuePool) -> Dict[str, float]:
+        with self.lock:
+            return {
+                "size": pool.size(),
+                "checkedIn": pool.checkedin(),
+                "checkedOut": pool.checkedout(),
+                "overflow": pool.overflow(),
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "timeouts": self.timeouts,
+                "totalWaitSeconds": round(self.total_wait_seconds, 6),
+                "maxWaitSeconds": round(self.max_wait_seconds, 6),
+            }
+
+
+class InstrumentedPoolMixin:
+    """Times every checkout from the pool's queue into self.stats
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except TimeoutError:
+            self.stats.record(time.perf_counter() - start, timed_out=True)
+            raise
+        self.stats.record(time.perf_counter() - start)
+        return connection
+
+
+class InstrumentedQueuePool(InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def get_pool_stats(engine) -> Dict[str, float]:
+    """Live statistics for engine's pool (a sync Engine or an AsyncEngine)
+    """
+    # AsyncEngine wraps a sync Engine, which owns the pool
+    pool = getattr(engine, "sync_engine", engine).pool
+    if not isinstance(pool, InstrumentedPoolMixin):
+        return {}
+    return pool.stats.snapshot(pool)
@@ -0,0 +1,65 @@
+# Types
+from typing import Dict, Iterable, Optional
+
+# SQLAlchemy
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.util import identity_key
+
+
+class Loader:
+    """Batches and memoizes primary key lookups of one model, in the style of DataLoader.
+
+    The memo is the session's identity map, so a loader is scoped to the
+    session (one per request, see dependencies.get_db) and never returns rows
+    that were deleted through that session. load_many collapses every id it
+    has not seen yet into a single WHERE id IN (...) query.
+    """
+
+    def __init__(self, db: Session, model):
+        self.db = db
+        self.model = model
+        # The identity map only holds weak references: rows nobody else
+        # refers to would drop out of it and be loaded again
+        self.loaded = []
+
+    def _cached(self, row_id: int):
+        return self.db.identity_map.get(identity_key(self.model, row_id))
+
+    def load(self, row_id: int):
+        """Get a single row by id, or None
+        """
+        if row_id is None:
+            return None
+        # Session.get only emits a SELECT if the row is not already loaded
+        row = self.db.get(self.model, row_id)
+        if row is not None:
+            self.loaded.append(row)
+        return row
+
+    def load_many(self, row_ids: Iterable[int]) -> Dict[int, object]:
+        """Get many rows by id, as a dict of id => row. Missing ids are left out.
+        """
+        found = {}
+        missing = set()
+        for row_id in row_ids:
+            if row_id is None:
+                continue
+            row = self._cached(row_id)
+            if row is None:
+                missing.add(row_id)
+            else:
+                found[row_id] = row
+        if missing:
+            for row in self.db.query(self.model).filter(self.model.id.in_(missing)).all():
+                found[row.id] = row
+                self.loaded.append(row)
+        return found
+
+
+def get_loader(db: Session, model) -> Loader:
+    """Get the loader for model that belongs to db, creating it on first use
+    """
+    loaders = db.info.setdefault("loaders", {})
+    if model not in loaders:
+        loaders[model] = Loader(db, model)
+    return loaders[model]
@@ -0,0 +1,95 @@
+# Standard Library
+import base64
+import json
+from datetime import datetime
+
+# Types
+from typing import Any, Callable, List, Optional, Sequence
+
+# FastAPI
+from fastapi import status, HTTPException
+from starlette.responses import Response
+
+# SQLAlchemy
+from sqlalchemy import DateTime, tuple_
+from sqlalchemy.orm import Query
+
+# Response header that carries the cursor for the next page of a list endpoint.
+# List endpoints keep returning a plain array so existing clients are unaffected.
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(*values: Any) -> str:
+    """Encode the sort key of the last row on a page into an opaque cursor
+    """
+    raw = json.dumps([
+        value.isoformat() if isinstance(value, datetime) else value for value in values
+    ])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str, columns: Sequence[Any]) -> List[Any]:
+    """Decode a cursor created by encode_cursor back into values for columns
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError(cursor)
+        return [
+            datetime.fromisoformat(value) if isinstance(
+                column.type, DateTime) else int(value)
+            for column, value in zip(columns, values)
+        ]
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def keyset_filter(columns: Sequence[Any], cursor: str, descending: bool = True):
+    """Build the WHERE clause that selects the rows after cursor
+    """
+    values = decode_cursor(cursor, columns)
+    if len(columns) == 1:
+        key, bound = columns[0], values[0]
+    else:
+        key, bound = tuple_(*columns), tuple_(*values)
+    return key < bound if descending else key > bound
+
+
+def paginate(
+    query: Query,
+    columns: Sequence[Any],
+    cursor: Optional[str] = None,
+    skip: int = 0,
+    limit: Optional[int] = 100,
+    descending: bool = True
+) -> Query:
+    """Order query by columns and apply either keyset (cursor) or offset (skip) pagination.
+
+    columns must uniquely identify a row, eg. (created_at, id) or (id,), and
+    should be covered by an index so the cursor is a range scan.
+    """
+    if cursor:
+        query = query.filter(keyset_filter(columns, cursor, descending))
+    elif skip:
+        query = query.offset(skip)
+    query = query.order_by(
+        *[column.desc() if descending else column.asc() for column in columns])
+    if limit:
+        query = query.limit(limit)
+    return query
+
+
+def created_at_key(row: Any):
+    return (row.created_at, row.id)
+
+
+def id_key(row: Any):
+    return (row.id,)
+
+
+def set_next_cursor(response: Response, rows: Sequence[Any], limit: Optional[int], key: Callable[[Any], Sequence[Any]] = created_at_key):
+    """Send the cursor for the page after rows, if rows was a full page
+    """
+    if limit and rows and len(rows) >= limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(*key(rows[-1]))
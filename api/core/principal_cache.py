@@ -0,0 +1,80 @@
+# Standard Library
+import threading
+import time
+from collections import OrderedDict
+
+# Types
+from typing import Dict, Optional, Tuple
+
+# Custom Modules
+from .. import schemas
+from .config import settings
+
+
+class PrincipalCache:
+    """Bounded LRU + TTL cache of authenticated users, keyed by user id.
+
+    Lets dependencies.get_current_user skip the database once a user has been
+    seen. Entries are snapshots (schemas.UserWithPassword), not ORM objects, so
+    they can be shared between requests and threads.
+
+    Invalidation is per worker process. Other workers pick up changes once
+    their entry expires, so keep the TTL short.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: int):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.entries: "OrderedDict[int, Tuple[float, schemas.UserWithPassword]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, user_id: int) -> Optional[schemas.UserWithPassword]:
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, user = entry
+            if expires_at < time.monotonic():
+                del self.entries[user_id]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(user_id)
+            self.hits += 1
+            return user
+
+    def set(self, user_id: int, user: schemas.UserWithPassword):
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.entries[user_id] = (
+                time.monotonic() + self.ttl_seconds, user)
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_id: int):
+        with self.lock:
+            if self.entries.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                "size": len(self.entries),
+                "maxSize": self.max_size,
+                "ttlSeconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+principal_cache = PrincipalCache(
+    settings.PRINCIPAL_CACHE_MAX_SIZE, settings.PRINCIPAL_CACHE_TTL_SECONDS)
@@ -1,11 +1,18 @@
 # Standard Library
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
 
 # Types
-from typing import Any, Union, Optional
+from typing import Any, Callable, Union, Optional
+
+# FastAPI
+from fastapi import status, HTTPException
 
 # SQLAlchemy
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 # JWT
 from jose import jwt, JWTError
@@ -16,13 +23,20 @@ from passlib.context import CryptContext
 # Custom Modules
 from .config import settings
 from ..schemas import User
-from .. import crud
+from .. import crud, async_crud
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
 ALGORITHM = "HS256"
 
+# bcrypt releases the GIL, so a small thread pool gives real parallelism
+# without sharing the default threadpool used by sync routes
+password_hash_pool = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+password_hash_slots = threading.BoundedSemaphore(
+    settings.PASSWORD_HASH_WORKERS + settings.PASSWORD_HASH_QUEUE_SIZE)
+
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create a JWT (access token) based on the provided data
@@ -50,6 +64,46 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+def submit_password_hash_job(fn: Callable[..., Any], *args: Any) -> Future:
+    """Run fn (verify_password or get_password_hash) in the password hash pool.
+
+    Raises a 503 straight away when the pool and its queue are full, rather
+    than letting requests pile up behind a login spike.
+    """
+    if not password_hash_slots.acquire(blocking=False):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy. Please try again.",
+            headers={"Retry-After": str(
+                settings.PASSWORD_HASH_RETRY_AFTER_SECONDS)}
+        )
+    try:
+        future = password_hash_pool.submit(fn, *args)
+    except Exception:
+        password_hash_slots.release()
+        raise
+    future.add_done_callback(lambda _: password_hash_slots.release())
+    return future
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password without blocking the event loop
+    """
+    return await asyncio.wrap_future(submit_password_hash_job(verify_password, plain_password, hashed_password))
+
+
+async def get_password_hash_async(password: str) -> str:
+    """get_password_hash without blocking the event loop
+    """
+    return await asyncio.wrap_future(submit_password_hash_job(get_password_hash, password))
+
+
+def verify_password_bounded(plain_password: str, hashed_password: str) -> bool:
+    """verify_password through the password hash pool, for sync routes
+    """
+    return submit_password_hash_job(verify_password, plain_password, hashed_password).result()
+
+
 def decode_token(token: str):
     """Return a dictionary that represents the decoded JWT.
     """
@@ -68,3 +122,16 @@ def authenticate_user(db: Session, email: str, password: str) -> Union[bool, Use
         # The user exists but the password was incorrect
         return False
     return user
+
+
+async def authenticate_user_async(db: AsyncSession, email: str, password: str) -> Union[bool, User]:
+    """authenticate_user for async routes. Neither the query nor bcrypt block the event loop.
+    """
+    user = await async_crud.get_user_by_email_or_username(db, email)
+    if not user:
+        # No user with that email exists in the database
+        return False
+    if not await verify_password_async(password, user.hashed_password):
+        # The user exists but the password was incorrect
+        return False
+    return user
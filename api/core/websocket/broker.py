@@ -0,0 +1,201 @@
+# Standard Library
+import asyncio
+from abc import ABC, abstractmethod
+import json
+import re
+
+# Types
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+# asyncpg
+import asyncpg
+
+# Custom Modules
+from ..config import settings, get_db_connection_url
+
+EventHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+ConnectHandler = Callable[[], Awaitable[None]]
+
+# Seconds to wait before reconnecting a lost broker connection
+RECONNECT_DELAY_SECONDS = 3
+
+
+class Broker(ABC):
+    """Pub/sub channel shared by every worker process.
+
+    The ConnectionManager publishes events (messages for users on other
+    workers, presence changes) and start() delivers every event published by
+    any worker to on_event. on_connect is called each time the subscription
+    is (re)established, since events published while it was down are lost.
+    """
+    # False when there are no other workers to talk to
+    distributed = True
+
+    @abstractmethod
+    async def start(self, on_event: EventHandler, on_connect: ConnectHandler):
+        """Subscribe, then deliver every event to on_event until stop()
+        """
+
+    @abstractmethod
+    async def stop(self):
+        """Unsubscribe and close the connection
+        """
+
+    @abstractmethod
+    async def publish(self, event: Dict[str, Any]):
+        """Send event to every worker, this one included
+        """
+
+
+class InMemoryBroker(Broker):
+    """Single process only. Every connection is local, so there is nothing to publish.
+    """
+    distributed = False
+
+    async def start(self, on_event: EventHandler, on_connect: ConnectHandler):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def publish(self, event: Dict[str, Any]):
+        pass
+
+
+class PostgresBroker(Broker):
+    """Postgres LISTEN/NOTIFY. Needs no extra infrastructure.
+
+    LISTEN needs a session-level connection: when the app goes through
+    PgBouncer in transaction pooling mode, point WS_BROKER_URL at Postgres
+    directly. NOTIFY payloads are limited to 8000 bytes.
+    """
+    MAX_PAYLOAD_BYTES = 7999
+
+    def __init__(self, dsn: str, channel: str):
+        self.dsn = dsn
+        self.channel = channel
+        self.listen_task: Optional[asyncio.Task] = None
+        # NOTIFY goes through a small pool: an asyncpg connection runs one
+        # query at a time, and the listening connection must stay free
+        self.publish_pool: Optional[asyncpg.pool.Pool] = None
+
+    async def start(self, on_event: EventHandler, on_connect: ConnectHandler):
+        self.on_event = on_event
+        self.on_connect = on_connect
+        self.publish_pool = await asyncpg.create_pool(self.dsn, min_size=1, max_size=2)
+        self.listen_task = asyncio.ensure_future(self.listen())
+
+    async def stop(self):
+        if self.listen_task:
+            self.listen_task.cancel()
+        if self.publish_pool:
+            await self.publish_pool.close()
+
+    async def listen(self):
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(self.dsn)
+                await connection.add_listener(self.channel, self.notified)
+                await self.on_connect()
+                # Notifications arrive through the callback. Ping now and
+                # then so a dropped connection is noticed and replaced.
+                while True:
+                    await asyncio.sleep(settings.WS_PRESENCE_HEARTBEAT_SECONDS)
+                    await connection.execute("SELECT 1")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print("WebSocket broker connection lost", e)
+            finally:
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+            await asyncio.sleep(RECONNECT_DELAY_SECONDS)
+
+    def notified(self, connection, pid: int, channel: str, payload: str):
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            print("Invalid WebSocket broker event", payload)
+            return
+        asyncio.ensure_future(self.on_event(event))
+
+    async def publish(self, event: Dict[str, Any]):
+        payload = json.dumps(event)
+        if len(payload.encode()) > self.MAX_PAYLOAD_BYTES:
+            print("WebSocket broker event too large for NOTIFY, dropped", event.get("type"))
+            return
+        try:
+            await self.publish_pool.execute("SELECT pg_notify($1, $2)", self.channel, payload)
+        except Exception as e:
+            print("Error publishing WebSocket broker event", e)
+
+
+class RedisBroker(Broker):
+    """Redis pub/sub. Optional: needs the redis package (pip install "redis>=4.2").
+    """
+
+    def __init__(self, url: str, channel: str):
+        self.url = url
+        self.channel = channel
+        self.redis = None
+        self.listen_task: Optional[asyncio.Task] = None
+
+    async def start(self, on_event: EventHandler, on_connect: ConnectHandler):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError(
+                'WS_BROKER=redis needs the redis package: pip install "redis>=4.2"')
+        self.on_event = on_event
+        self.on_connect = on_connect
+        self.redis = redis.from_url(self.url)
+        self.listen_task = asyncio.ensure_future(self.listen())
+
+    async def stop(self):
+        if self.listen_task:
+            self.listen_task.cancel()
+        if self.redis:
+            await self.redis.close()
+
+    async def listen(self):
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                await self.on_connect()
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    try:
+                        event = json.loads(message["data"])
+                    except ValueError:
+                        print("Invalid WebSocket broker event", message["data"])
+                        continue
+                    await self.on_event(event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print("WebSocket broker connection lost", e)
+            finally:
+                await pubsub.close()
+            await asyncio.sleep(RECONNECT_DELAY_SECONDS)
+
+    async def publish(self, event: Dict[str, Any]):
+        try:
+            await self.redis.publish(self.channel, json.dumps(event))
+        except Exception as e:
+            print("Error publishing WebSocket broker event", e)
+
+
+def get_broker() -> Broker:
+    """Build the broker selected by the WS_BROKER setting
+    """
+    if settings.WS_BROKER == "postgres":
+        # asyncpg wants a plain postgresql:// url, without a driver name
+        dsn = settings.WS_BROKER_URL or re.sub(
+            r"^postgres(ql)?(\+\w+)?://", "postgresql://", get_db_connection_url())
+        return PostgresBroker(dsn, settings.WS_BROKER_CHANNEL)
+    if settings.WS_BROKER == "redis":
+        return RedisBroker(settings.WS_BROKER_URL or "redis://localhost:6379/0", settings.WS_BROKER_CHANNEL)
+    return InMemoryBroker()
@@ -0,0 +1,124 @@
+# FastAPI
+from fastapi import WebSocket
+
+# Standard Library
+from typing import AsyncIterator, Optional, Set
+import asyncio
+
+from ..config import settings
+from .frame import Frame
+
+# Close code sent to clients that cannot keep up (policy violation)
+SLOW_CONSUMER_CLOSE_CODE = 1008
+
+
+class Connection:
+    """One client receiving events, and its outbound queue.
+
+    Senders only enqueue (send never blocks), so a slow client delays nobody
+    but itself. A client whose queue is full is too slow: the message is
+    dropped or the client is disconnected, depending on
+    WS_SLOW_CONSUMER_POLICY.
+    """
+
+    def __init__(self, user_id: int, connection_id: int):
+        self.user_id = user_id
+        # Unique on this worker. A user may have several connections.
+        self.id = connection_id
+        self.queue: asyncio.Queue = asyncio.Queue(
+            maxsize=settings.WS_SEND_QUEUE_SIZE)
+        self.closed = False
+        # Topics this connection is subscribed to (see ConnectionManager.subscribe)
+        self.topics: Set[str] = set()
+
+    def send(self, frame: Frame) -> bool:
+        """Queue frame for this client. Returns False if it was dropped.
+        """
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except asyncio.QueueFull:
+            if settings.WS_SLOW_CONSUMER_POLICY == "disconnect":
+                print(f"Disconnecting slow client: {self.user_id}")
+                asyncio.ensure_future(self.close(SLOW_CONSUMER_CLOSE_CODE))
+            return False
+
+    async def close(self, code: int = 1000):
+        self.closed = True
+
+    @property
+    def queued(self) -> int:
+        return self.queue.qsize()
+
+
+class WebSocketConnection(Connection):
+    """An accepted WebSocket. A writer task per connection does the actual writes.
+    """
+
+    def __init__(self, websocket: WebSocket, user_id: int, connection_id: int):
+        super().__init__(user_id, connection_id)
+        self.websocket = websocket
+        self.writer_task: Optional[asyncio.Task] = asyncio.ensure_future(
+            self.write())
+
+    async def write(self):
+        try:
+            while True:
+                frame: Frame = await self.queue.get()
+                await asyncio.wait_for(
+                    self.websocket.send_text(frame.text),
+                    settings.WS_SEND_TIMEOUT_SECONDS
+                )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Timed out or the client is gone
+            print(f"could not send to user: {self.user_id}", e)
+            await self.close(SLOW_CONSUMER_CLOSE_CODE)
+
+    async def close(self, code: int = 1000):
+        if self.closed:
+            return
+        self.closed = True
+        if self.writer_task is not asyncio.current_task():
+            self.writer_task.cancel()
+        try:
+            await self.websocket.close(code)
+        except Exception:
+            # Already closed by the client
+            pass
+
+
+class EventStreamConnection(Connection):
+    """A Server-Sent Events response (GET /events/stream).
+
+    Receive only, and lighter than a WebSocket: there is no writer task or
+    socket object, the streaming response itself reads the queue (see events).
+    """
+
+    async def close(self, code: int = 1000):
+        if self.closed:
+            return
+        self.closed = True
+        # Wake up events() if it is waiting. A full queue wakes it anyway.
+        try:
+            self.queue.put_nowait(None)
+        except asyncio.QueueFull:
+            pass
+
+    async def events(self) -> AsyncIterator[str]:
+        """The queued frames as SSE text, with a comment line whenever the
+        stream was idle for SSE_HEARTBEAT_SECONDS
+        """
+        while not self.closed:
+            try:
+                frame: Optional[Frame] = await asyncio.wait_for(
+                    self.queue.get(), settings.SSE_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            if frame is None or self.closed:
+                break
+            yield frame.sse
@@ -1,62 +1,542 @@
 # FastAPI
 from fastapi import WebSocket
-from fastapi.encoders import jsonable_encoder
 
 # Standard Library
-from typing import Union, Dict, Any
-import json
+from typing import Union, Dict, Any, Iterable, List, Optional, Set, Tuple
+import asyncio
+import itertools
+import time
+import uuid
 from datetime import date, datetime
 
-from ...schemas.websockets import WSMessage, WSMessageAction
+from ..config import settings
+from ... import async_crud, database
+from .broker import Broker, get_broker
+from .connection import Connection, EventStreamConnection, WebSocketConnection
+from .event_buffer import EventBuffer
+from .frame import Frame
+from .topics import can_subscribe, conversation_topic, user_topic
+from ...schemas.websockets import EventsResyncBody, EventsResyncReason, WSMessage, WSMessageAction
+from ...schemas.chat import ChatUsersPresenceBody
+
+# Presence is re-sent in chunks of this many user ids (keeps events under
+# the NOTIFY payload limit)
+PRESENCE_SYNC_CHUNK_SIZE = 500
 
 
 class ConnectionManager:
-    def __init__(self):
-        # Map user id to a websocket
-        self.active_connections: Dict[int, WebSocket] = {}
+    """Tracks the WebSockets and event streams connected to this worker, and
+    (through the broker) which users are connected to every other worker.
+
+    Each message is serialized once into a Frame, which is queued on local
+    connections (see Connection) and published
+    to the broker only when the recipient is connected somewhere else.
+    Nothing here waits for a client, so callers only pay for enqueueing.
+
+    Events sent to users get an eventId ("<worker id>:<seq>", the sequence is
+    per worker) and are kept in a small EventBuffer per user. A client that
+    reconnects with lastEventId gets the events it missed replayed, or an
+    events.resync message saying why they are not available (eg. the id
+    was issued by another worker).
+    """
+
+    def __init__(self, broker: Broker):
+        # Map user id to that user's connections (by connection id). A user
+        # with several tabs or devices has several. Users without any
+        # connection are removed, so membership means online.
+        self.active_connections: Dict[int, Dict[int, Connection]] = {}
+        self.connection_ids = itertools.count(1)
+        # Map topic to the connections subscribed to it
+        self.topic_subscribers: Dict[str, Set[Connection]] = {}
+        # Messages dropped because a client's queue was full
+        self.dropped_messages = 0
+        self.broker = broker
+        # Identifies this worker's events on the broker
+        self.node_id = uuid.uuid4().hex
+        # Users connected to other workers, and when each worker was last heard from
+        self.remote_presence: Dict[str, Set[int]] = {}
+        # Map user id to the number of other workers they are connected to
+        self.remote_users: Dict[int, int] = {}
+        self.remote_last_seen: Dict[str, float] = {}
+        self.heartbeat_task: Optional[asyncio.Task] = None
+        # Presence changes not sent yet: user id => whether they were online
+        # before the first change. A user who reconnects within the same
+        # interval produces no update at all.
+        self.pending_presence: Dict[int, bool] = {}
+        self.presence_task: Optional[asyncio.Task] = None
+        # When each (sender, recipient) pair last sent a typing event
+        self.typing_sent_at: Dict[Tuple[int, int], float] = {}
+        # First part of every event id, so the worker a resuming client's
+        # lastEventId came from is known
+        self.worker_id = self.node_id[:12]
+        self.event_seq = itertools.count(1)
+        self.last_event_seq = 0
+        # Replay buffers of connected users, and of users disconnected less
+        # than WS_RESUME_WINDOW_SECONDS ago
+        self.event_buffers: Dict[int, EventBuffer] = {}
+        # Map topic to the disconnected users whose buffer still records it
+        self.detached_subscribers: Dict[str, Set[int]] = {}
+
+    async def start(self):
+        """Subscribe to the broker. Called on application startup
+        """
+        await self.broker.start(self.handle_event, self.broker_connected)
+        self.presence_task = asyncio.ensure_future(self.send_presence_periodically())
+        if self.broker.distributed:
+            self.heartbeat_task = asyncio.ensure_future(self.heartbeat())
 
-    async def connect(self, websocket: WebSocket, user_id: int):
+    async def stop(self):
+        if self.heartbeat_task:
+            self.heartbeat_task.cancel()
+        if self.presence_task:
+            self.presence_task.cancel()
+        await self.publish({"type": "bye"})
+        await self.broker.stop()
+
+    async def connect(self, websocket: WebSocket, user_id: int, last_event_id: Optional[str] = None) -> Optional[Connection]:
         try:
             await websocket.accept()
-            self.active_connections[user_id] = websocket
         except Exception as e:
             print("Error connecting", e)
+            return None
+        connection = WebSocketConnection(websocket, user_id, next(self.connection_ids))
+        await self.add_connection(connection, last_event_id)
+        return connection
 
-    async def disconnect(self, user_id: int):
-        try:
-            await self.active_connections[user_id].close()
-            self.active_connections.pop(user_id)
-        except:
-            print("Error disconnecting...")
+    async def connect_stream(self, user_id: int, topics: Iterable[str] = (), last_event_id: Optional[str] = None) -> EventStreamConnection:
+        """Register a Server-Sent Events client, subscribed to topics
+        """
+        connection = EventStreamConnection(user_id, next(self.connection_ids))
+        await self.add_connection(connection, last_event_id, topics)
+        return connection
 
-    async def send_personal_message(self, message: Union[Dict, str], user_id: int):
-        # TODO: I need to work out a better way to send proper json
-        # print("user is online? ", user_id in self.active_connections)
-        if user_id not in self.active_connections:
+    async def add_connection(self, connection: Connection, last_event_id: Optional[str] = None, topics: Iterable[str] = ()):
+        user_id = connection.user_id
+        # Replay before the connection is registered (nothing is awaited in
+        # between), so no new event can overtake the missed ones
+        self.resume(connection, last_event_id)
+        self.subscribe(connection, topics)
+        was_online = self.user_is_online(user_id)
+        user_connections = self.active_connections.setdefault(user_id, {})
+        user_connections[connection.id] = connection
+        self.subscribe(connection, [user_topic(user_id)])
+        self.presence_changed(user_id, was_online)
+        if len(user_connections) == 1:
+            # First connection of this user on this worker
+            await self.publish({"type": "presence", "userId": user_id, "online": True})
+
+    async def disconnect(self, connection: Connection):
+        user_connections = self.active_connections.get(connection.user_id, {})
+        if user_connections.pop(connection.id, None) is None:
             return
+        for topic in connection.topics:
+            self.remove_subscriber(topic, connection)
+        await connection.close()
+        if not user_connections:
+            # That was the user's last connection on this worker
+            del self.active_connections[connection.user_id]
+            self.detach_buffer(connection)
+            self.presence_changed(connection.user_id, True)
+            await self.publish({"type": "presence", "userId": connection.user_id, "online": False})
+
+    def connection_count(self, user_id: int) -> int:
+        """Number of connections user_id has on this worker
+        """
+        return len(self.active_connections.get(user_id, ()))
+
+    async def send_personal_message(self, message: Union[Dict, str, WSMessage[Any], Frame], user_id: int):
+        # TODO: I need to work out a better way to send proper json
         if type(message) is str:
             message = {"message": message}
-        try:
-            await self.active_connections[user_id].send_text(json.dumps(jsonable_encoder(message)))
-        except:
-            print("Error Sending Message")
-
-    async def broadcast(self, message: Union[Dict, WSMessage[Any]], current_user_id: int):
-        for user_id, connection in self.active_connections.items():
-            if(current_user_id != user_id):
-                try:
-                    await connection.send_json(jsonable_encoder(message))
-                except:
-                    print(f"could not send to user: {user_id}")
+        frame = Frame.encode(message)
+        self.send_local(self.stamp(frame), user_id)
+        if self.user_is_online_remotely(user_id):
+            await self.publish({"type": "user", "userId": user_id, "frame": frame.text})
+
+    async def send_typing(self, sender_id: int, recipient_id: int, message: Union[Dict, WSMessage[Any]]) -> bool:
+        """Forward a typing event, at most once per WS_TYPING_THROTTLE_MS for
+        each (sender, recipient). Returns False if it was throttled.
+        """
+        now = time.monotonic()
+        key = (sender_id, recipient_id)
+        sent_at = self.typing_sent_at.get(key)
+        if sent_at is not None and now - sent_at < settings.WS_TYPING_THROTTLE_MS / 1000:
+            return False
+        self.typing_sent_at[key] = now
+        await self.send_to_conversation(sender_id, recipient_id, message, sender_id)
+        return True
+
+    async def send_to_conversation(self, sender_id: int, recipient_id: int, message: Union[Dict, WSMessage[Any], Frame], current_user_id: Optional[int] = None):
+        """Send a direct message event to recipient_id and to every connection
+        subscribed to the conversation (eg. the sender's other tabs), except current_user_id
+        """
+        await self.publish_to_topics([conversation_topic(sender_id, recipient_id)], message, current_user_id, [recipient_id])
+
+    def send_to_connection(self, connection: Connection, message: Union[Dict, WSMessage[Any], Frame]):
+        """Reply on a single connection (not the user's other tabs)
+        """
+        if not connection.send(Frame.encode(message)):
+            self.dropped_messages += 1
+
+    async def broadcast(self, message: Union[Dict, WSMessage[Any], Frame], current_user_id: int):
+        frame = Frame.encode(message)
+        self.broadcast_local(self.stamp(frame), current_user_id)
+        if self.remote_users:
+            await self.publish({"type": "broadcast", "excludeUserId": current_user_id, "frame": frame.text})
+
+    async def publish_to_topics(self, topics: List[str], message: Union[Dict, WSMessage[Any], Frame], current_user_id: Optional[int] = None, user_ids: Iterable[int] = ()):
+        """Send message to every user subscribed to any of topics, and to
+        every connection of user_ids (once each), except current_user_id
+        """
+        frame = Frame.encode(message)
+        user_ids = list(user_ids)
+        self.send_to_topics_local(self.stamp(frame), topics, current_user_id, user_ids)
+        if self.remote_users:
+            await self.publish({"type": "topics", "topics": topics, "userIds": user_ids, "excludeUserId": current_user_id, "frame": frame.text})
+
+    def subscribe(self, connection: Connection, topics: Iterable[str]) -> List[str]:
+        """Subscribe connection to topics. Returns the topics it is now subscribed to
+        """
+        subscribed = []
+        for topic in topics:
+            if not can_subscribe(topic, connection.user_id):
+                continue
+            if topic not in connection.topics:
+                if len(connection.topics) >= settings.WS_MAX_TOPICS_PER_CONNECTION:
+                    break
+                connection.topics.add(topic)
+                self.topic_subscribers.setdefault(topic, set()).add(connection)
+            subscribed.append(topic)
+        return subscribed
+
+    def unsubscribe(self, connection: Connection, topics: Iterable[str]) -> List[str]:
+        """Unsubscribe connection from topics. Returns the topics it was subscribed to
+        """
+        unsubscribed = []
+        for topic in topics:
+            if topic in connection.topics:
+                connection.topics.discard(topic)
+                self.remove_subscriber(topic, connection)
+                unsubscribed.append(topic)
+        return unsubscribed
+
+    def remove_subscriber(self, topic: str, connection: Connection):
+        subscribers = self.topic_subscribers.get(topic)
+        if subscribers is None:
+            return
+        subscribers.discard(connection)
+        if not subscribers:
+            del self.topic_subscribers[topic]
+
+    def send_to_topics_local(self, frame: Frame, topics: List[str], exclude_user_id: Optional[int], to_user_ids: Iterable[int] = ()):
+        recipients: Set[Connection] = set()
+        user_ids: Set[int] = set(to_user_ids)
+        for user_id in user_ids:
+            recipients.update(self.active_connections.get(user_id, {}).values())
+        for topic in topics:
+            recipients.update(self.topic_subscribers.get(topic, ()))
+            user_ids.update(self.detached_subscribers.get(topic, ()))
+        for connection in recipients:
+            user_ids.add(connection.user_id)
+            if connection.user_id != exclude_user_id and not connection.send(frame):
+                self.dropped_messages += 1
+        user_ids.discard(exclude_user_id)
+        for user_id in user_ids:
+            self.buffer_event(frame, user_id)
+
+    def send_local(self, frame: Frame, user_id: int):
+        self.buffer_event(frame, user_id)
+        for connection in self.active_connections.get(user_id, {}).values():
+            if not connection.send(frame):
+                self.dropped_messages += 1
+
+    def broadcast_local(self, frame: Frame, exclude_user_id: int):
+        for user_id in self.active_connections:
+            if(exclude_user_id != user_id):
+                self.send_local(frame, user_id)
 
     def user_is_online(self, user_id: int):
-        return user_id in self.active_connections
+        return user_id in self.active_connections or self.user_is_online_remotely(user_id)
+
+    def user_is_online_remotely(self, user_id: int):
+        return user_id in self.remote_users
+
+    #
+    # Event ids and replay
+    #
+
+    def stamp(self, frame: Frame) -> Frame:
+        """Give frame the next event id of this worker
+        """
+        seq = self.last_event_seq = next(self.event_seq)
+        return frame.stamp(f"{self.worker_id}:{seq}", seq)
+
+    def parse_event_id(self, event_id: str) -> Tuple[Optional[str], Optional[int]]:
+        """The worker id and sequence number of event_id, or (None, None) if it is malformed
+        """
+        worker_id, _, seq = event_id.partition(":")
+        if not worker_id or not seq.isdigit():
+            return None, None
+        return worker_id, int(seq)
+
+    def buffer_event(self, frame: Frame, user_id: int):
+        buffer = self.event_buffers.get(user_id)
+        if buffer is not None and frame.seq is not None:
+            buffer.append(frame)
+
+    def resume(self, connection: Connection, last_event_id: Optional[str]):
+        """Set up the replay buffer of connection's user. With last_event_id,
+        queue the events after it (and restore the topics of the previous
+        connection), or events.resync if they cannot all be replayed.
+        """
+        buffer = self.event_buffers.get(connection.user_id)
+        if buffer is None:
+            buffer = self.event_buffers[connection.user_id] = EventBuffer(
+                settings.WS_REPLAY_BUFFER_SIZE)
+            # Nothing before now was recorded for this user (eg. the buffer
+            # was pruned), so an older lastEventId must resync
+            buffer.evicted_seq = self.last_event_seq
+        elif buffer.detached_at is not None:
+            self.attach_buffer(connection.user_id, buffer)
+        if last_event_id is None:
+            return
+        worker_id, seq = self.parse_event_id(last_event_id)
+        if worker_id is None:
+            self.send_resync(connection, EventsResyncReason.InvalidEventId, last_event_id)
+            return
+        if worker_id != self.worker_id:
+            # Sequence numbers of different workers cannot be compared
+            self.send_resync(connection, EventsResyncReason.OtherWorker, last_event_id)
+            return
+        missed = buffer.since(seq)
+        if missed is None:
+            # The buffer was overrun, or the resume window has passed
+            self.send_resync(connection, EventsResyncReason.EventsExpired, last_event_id)
+            return
+        self.subscribe(connection, buffer.topics)
+        for frame in missed:
+            if not connection.send(frame):
+                self.dropped_messages += 1
+
+    def send_resync(self, connection: Connection, reason: EventsResyncReason, last_event_id: str):
+        self.send_to_connection(connection, WSMessage[EventsResyncBody](
+            action=WSMessageAction.EventsResync,
+            body=EventsResyncBody(reason=reason, lastEventId=last_event_id, workerId=self.worker_id)
+        ))
+
+    def detach_buffer(self, connection: Connection):
+        """Keep recording events for a user whose last connection closed,
+        including the topics that connection was subscribed to
+        """
+        buffer = self.event_buffers.get(connection.user_id)
+        if buffer is None:
+            return
+        buffer.detached_at = time.monotonic()
+        buffer.topics = set(connection.topics)
+        for topic in buffer.topics:
+            self.detached_subscribers.setdefault(topic, set()).add(connection.user_id)
+
+    def attach_buffer(self, user_id: int, buffer: EventBuffer):
+        buffer.detached_at = None
+        for topic in buffer.topics:
+            users = self.detached_subscribers.get(topic)
+            if users is not None:
+                users.discard(user_id)
+                if not users:
+                    del self.detached_subscribers[topic]
+
+    def prune_event_buffers(self):
+        """Drop the buffers of users who did not come back within WS_RESUME_WINDOW_SECONDS
+        """
+        expired = time.monotonic() - settings.WS_RESUME_WINDOW_SECONDS
+        for user_id, buffer in list(self.event_buffers.items()):
+            if buffer.detached_at is not None and buffer.detached_at < expired:
+                self.attach_buffer(user_id, buffer)
+                del self.event_buffers[user_id]
+
+    #
+    # Broker events
+    #
+
+    async def publish(self, event: Dict[str, Any]):
+        if not self.broker.distributed:
+            return
+        event["node"] = self.node_id
+        await self.broker.publish(event)
+
+    async def broker_connected(self):
+        """Exchange presence with every other worker. Events may have been
+        missed while the broker was unreachable, and after a long outage the
+        others have forgotten this worker's users.
+        """
+        await self.publish_presence()
+        await self.publish({"type": "hello"})
+
+    async def handle_event(self, event: Dict[str, Any]):
+        node = event.get("node")
+        if node is None or node == self.node_id:
+            return
+        self.remote_last_seen[node] = time.monotonic()
+        event_type = event.get("type")
+
+        if event_type == "user":
+            self.send_local(self.stamp(Frame(event["frame"])), event["userId"])
+
+        elif event_type == "broadcast":
+            self.broadcast_local(self.stamp(Frame(event["frame"])), event["excludeUserId"])
+
+        elif event_type == "topics":
+            self.send_to_topics_local(self.stamp(Frame(event["frame"])), event["topics"], event["excludeUserId"], event.get("userIds", ()))
+
+        elif event_type == "presence":
+            if event["online"]:
+                self.add_remote_user(node, event["userId"])
+            else:
+                self.remove_remote_user(node, event["userId"])
+
+        elif event_type == "sync":
+            if event.get("reset"):
+                self.forget_node(node)
+                self.remote_last_seen[node] = time.monotonic()
+            for user_id in event["users"]:
+                self.add_remote_user(node, user_id)
+
+        elif event_type == "hello":
+            # A worker (re)joined: send it everyone connected here
+            await self.publish_presence()
+
+        elif event_type == "bye":
+            self.forget_node(node)
+
+    async def publish_presence(self):
+        user_ids: List[int] = list(self.active_connections.keys())
+        for start in range(0, max(len(user_ids), 1), PRESENCE_SYNC_CHUNK_SIZE):
+            await self.publish({
+                "type": "sync",
+                "reset": start == 0,
+                "users": user_ids[start:start + PRESENCE_SYNC_CHUNK_SIZE]
+            })
+
+    async def heartbeat(self):
+        """Tell the other workers this one is alive, and forget workers that
+        stopped without saying bye (their users are no longer online)
+        """
+        interval = settings.WS_PRESENCE_HEARTBEAT_SECONDS
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.publish({"type": "heartbeat"})
+                expired = time.monotonic() - 3 * interval
+                for node, last_seen in list(self.remote_last_seen.items()):
+                    if last_seen < expired:
+                        self.forget_node(node)
+            except Exception as e:
+                print("Error in presence heartbeat", e)
+
+    def add_remote_user(self, node: str, user_id: int):
+        users = self.remote_presence.setdefault(node, set())
+        if user_id not in users:
+            was_online = self.user_is_online(user_id)
+            users.add(user_id)
+            self.remote_users[user_id] = self.remote_users.get(user_id, 0) + 1
+            self.presence_changed(user_id, was_online)
+
+    def remove_remote_user(self, node: str, user_id: int):
+        users = self.remote_presence.get(node)
+        if users is None or user_id not in users:
+            return
+        users.discard(user_id)
+        self.remote_users[user_id] -= 1
+        if not self.remote_users[user_id]:
+            del self.remote_users[user_id]
+            self.presence_changed(user_id, True)
+
+    def forget_node(self, node: str):
+        for user_id in list(self.remote_presence.get(node, ())):
+            self.remove_remote_user(node, user_id)
+        self.remote_presence.pop(node, None)
+        self.remote_last_seen.pop(node, None)
+
+    #
+    # Presence and typing
+    #
+
+    def presence_changed(self, user_id: int, was_online: bool):
+        """Queue a presence update for user_id if they went online or offline
+        """
+        if user_id not in self.pending_presence and was_online != self.user_is_online(user_id):
+            self.pending_presence[user_id] = was_online
+
+    async def send_presence_periodically(self):
+        while True:
+            await asyncio.sleep(settings.WS_PRESENCE_FLUSH_MS / 1000)
+            try:
+                await self.send_presence()
+            except Exception as e:
+                print("Error sending presence updates", e)
+            self.prune_typing()
+            self.prune_event_buffers()
+
+    async def send_presence(self):
+        """Send each local user one diff of the followed users and
+        conversation partners that came online or went offline. Every worker
+        does this for its own users (remote presence events land here too).
+        """
+        pending, self.pending_presence = self.pending_presence, {}
+        changes: Dict[int, bool] = {}
+        for user_id, was_online in pending.items():
+            is_online = self.user_is_online(user_id)
+            if is_online != was_online:
+                changes[user_id] = is_online
+        if not changes or not self.active_connections:
+            return
+
+        async with database.AsyncSessionLocal() as db:
+            audiences = await async_crud.get_presence_audiences(
+                db, list(changes), list(self.active_connections))
+
+        diffs: Dict[int, ChatUsersPresenceBody] = {}
+        for user_id, viewer_ids in audiences.items():
+            for viewer_id in viewer_ids:
+                diff = diffs.setdefault(
+                    viewer_id, ChatUsersPresenceBody(online=[], offline=[]))
+                (diff.online if changes[user_id] else diff.offline).append(user_id)
+        for viewer_id, diff in diffs.items():
+            self.send_local(self.stamp(Frame.encode(WSMessage[ChatUsersPresenceBody](
+                action=WSMessageAction.ChatUsersPresence,
+                body=diff
+            ))), viewer_id)
+
+    def prune_typing(self):
+        expired = time.monotonic() - settings.WS_TYPING_THROTTLE_MS / 1000
+        self.typing_sent_at = {
+            key: sent_at for key, sent_at in self.typing_sent_at.items() if sent_at > expired
+        }
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "users": len(self.active_connections),
+            "connections": sum(len(connections) for connections in self.active_connections.values()),
+            "eventStreams": sum(
+                isinstance(connection, EventStreamConnection)
+                for connections in self.active_connections.values()
+                for connection in connections.values()
+            ),
+            "topics": len(self.topic_subscribers),
+            "queuedMessages": sum(
+                connection.queued
+                for connections in self.active_connections.values()
+                for connection in connections.values()
+            ),
+            "droppedMessages": self.dropped_messages,
+            "replayBuffers": len(self.event_buffers),
+        }
 
     async def show_all_connections(self):
         print("\n** Listing Active WebSocket Connections **")
-        for user_id, connection in self.active_connections.items():
-            print(f"\tUser ID: {user_id} |  Conn: {connection}")
+        for user_id, connections in self.active_connections.items():
+            print(f"\tUser ID: {user_id} |  Conns: {list(connections.keys())}")
         print("********************************\n")
 
 
-ws_manager = ConnectionManager()
+ws_manager = ConnectionManager(get_broker())
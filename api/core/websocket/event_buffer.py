@@ -0,0 +1,35 @@
+# Standard Library
+from collections import deque
+from typing import Deque, List, Optional, Set
+
+from .frame import Frame
+
+
+class EventBuffer:
+    """The last events sent to one user, so a client that reconnects with
+    lastEventId only gets what it missed.
+
+    It is kept for WS_RESUME_WINDOW_SECONDS after the user's last connection
+    closes, together with that connection's topics, so events published
+    while the user is away are still recorded.
+    """
+
+    def __init__(self, size: int):
+        self.events: Deque[Frame] = deque(maxlen=max(size, 1))
+        # Highest sequence number that fell out of the buffer
+        self.evicted_seq = 0
+        self.topics: Set[str] = set()
+        # When the user's last connection closed (None while connected)
+        self.detached_at: Optional[float] = None
+
+    def append(self, frame: Frame):
+        if len(self.events) == self.events.maxlen:
+            self.evicted_seq = self.events[0].seq
+        self.events.append(frame)
+
+    def since(self, seq: int) -> Optional[List[Frame]]:
+        """The events after seq, or None if some of them were already evicted
+        """
+        if seq < self.evicted_seq:
+            return None
+        return [frame for frame in self.events if frame.seq > seq]
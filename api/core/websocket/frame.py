@@ -0,0 +1,56 @@
+# Standard Library
+from typing import Any, Optional
+
+# Pydantic
+from pydantic import BaseModel
+
+# orjson
+import orjson
+
+
+def default(value: Any) -> Any:
+    """Serialize what orjson does not handle natively (WSMessage and the other schemas)
+    """
+    if isinstance(value, BaseModel):
+        return value.dict()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+class Frame:
+    """A WebSocket message serialized once.
+
+    The same text is written to every recipient, instead of running
+    jsonable_encoder and json.dumps per connection. Events sent to users are
+    stamped with an eventId (see ConnectionManager.stamp); replies to a
+    single request are not.
+    """
+    __slots__ = ("text", "seq", "event_id", "_sse")
+
+    def __init__(self, text: str, seq: Optional[int] = None, event_id: Optional[str] = None):
+        self.text = text
+        self.seq = seq
+        self.event_id = event_id
+        self._sse: Optional[str] = None
+
+    def stamp(self, event_id: str, seq: int) -> "Frame":
+        """Copy of this frame with "eventId" added, without serializing it again
+        """
+        body = self.text[1:]
+        if body.strip() != "}":
+            body = "," + body
+        return Frame(f'{{"eventId":"{event_id}"{body}', seq, event_id)
+
+    @property
+    def sse(self) -> str:
+        """This frame as a Server-Sent Event, built once for every stream
+        """
+        if self._sse is None:
+            event_id = f"id: {self.event_id}\n" if self.event_id else ""
+            self._sse = f"{event_id}data: {self.text}\n\n"
+        return self._sse
+
+    @classmethod
+    def encode(cls, message: Any) -> "Frame":
+        if isinstance(message, Frame):
+            return message
+        return cls(orjson.dumps(message, default=default).decode())
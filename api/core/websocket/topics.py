@@ -0,0 +1,39 @@
+# Standard Library
+import re
+
+#
+# Topics a WebSocket can subscribe to. Events about a tweet, a user or a
+# conversation are only delivered to the connections subscribed to it.
+#
+
+TOPIC_PATTERN = re.compile(r"^(tweet|user):(\d+)$|^conversation:(\d+)-(\d+)$")
+
+
+def tweet_topic(tweet_id: int) -> str:
+    """Likes and comments on a tweet (and likes on those comments)
+    """
+    return f"tweet:{tweet_id}"
+
+
+def user_topic(user_id: int) -> str:
+    """Follows of and by a user. Every connection is subscribed to its own user topic.
+    """
+    return f"user:{user_id}"
+
+
+def conversation_topic(user_id: int, other_user_id: int) -> str:
+    """Direct messages between two users. Same topic whichever user is first.
+    """
+    low, high = sorted((user_id, other_user_id))
+    return f"conversation:{low}-{high}"
+
+
+def can_subscribe(topic: str, user_id: int) -> bool:
+    """Whether user_id may subscribe to topic. Conversations are private to their two users.
+    """
+    match = TOPIC_PATTERN.match(topic)
+    if match is None:
+        return False
+    if match.group(3) is not None:
+        return user_id in (int(match.group(3)), int(match.group(4)))
+    return True
@@ -2,21 +2,27 @@
 from fastapi import status, HTTPException
 
 # SQLAlchemy
-from sqlalchemy.orm import Session
-from sqlalchemy import or_, func, case, column
+from sqlalchemy.orm import Session, aliased, joinedload
+from sqlalchemy import or_, func, case, column, select, literal, true, update, union, union_all, any_, bindparam, Integer
+from sqlalchemy.dialects.postgresql import insert, ARRAY
 
 # Types
-from typing import Optional, List, Union
+from typing import Optional, List, Union, Dict, Tuple
 
 # Custom Modules
 from . import models, schemas
 from .database import engine
-from .core import security
+from .core.config import settings
+from .core.pagination import paginate, keyset_filter
+from .core.counters import tweet_like_counter
+from .core.loaders import get_loader
+from .core.principal_cache import principal_cache
 import datetime
 from api.core.utilities import generate_random_uuid
 
 # Standard Library
 import os
+import heapq
 #
 # TODO : split into multiple files.
 # TODO : add return types to all functions.
@@ -24,9 +30,15 @@ import os
 
 
 def get_user_by_id(db: Session, user_id: int) -> Union[models.User, None]:
-    """Get a single user by id
+    """Get a single user by id (memoized for the life of the session)
     """
-    return db.query(models.User).filter(models.User.id == user_id).one_or_none()
+    return get_loader(db, models.User).load(user_id)
+
+
+def get_users_by_ids(db: Session, user_ids: List[int]) -> Dict[int, models.User]:
+    """Get many users by id in at most one query, as a dict of id => user
+    """
+    return get_loader(db, models.User).load_many(user_ids)
 
 
 def get_user_by_email(db: Session, email: str) -> Union[models.User, None]:
@@ -52,10 +64,12 @@ def get_user_by_username(db: Session, username: str) -> Union[models.User, None]
     return db.query(models.User).filter(func.lower(models.User.username) == func.lower(username)).first()
 
 
-def search_user_by_username_fragment(db: Session, username_fragment: str, skip: int = 0, limit: int = 100) -> List[models.User]:
+def search_user_by_username_fragment(db: Session, username_fragment: str, skip: int = 0, limit: int = 100, cursor: Optional[str] = None) -> List[models.User]:
     """Search for users by username
     """
-    return db.query(models.User).filter(models.User.username.ilike(f"%{username_fragment}%")).limit(limit).offset(skip).all()
+    query = db.query(models.User).filter(
+        models.User.username.ilike(f"%{username_fragment}%"))
+    return paginate(query, [models.User.id], cursor, skip, limit, descending=False).all()
 
 
 def get_user_by_email_or_username(db: Session, email: str):
@@ -67,16 +81,17 @@ def get_user_by_email_or_username(db: Session, email: str):
     return query.first()
 
 
-def get_users(db: Session, skip: int = 0, limit: int = 100):
+def get_users(db: Session, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
     """Get all users
     """
-    query = db.query(models.User).offset(skip).limit(limit)
+    query = paginate(db.query(models.User), [
+                     models.User.id], cursor, skip, limit, descending=False)
     # print(query.statement.compile(engine))
     return query.all()
 
 
-def create_user(db: Session, user: schemas.UserCreate, confirmation_key: str):
-    """Add a user
+def create_user(db: Session, user: schemas.UserCreate, hashed_password: str, confirmation_key: str):
+    """Add a user. The password must already be hashed (see security.get_password_hash_async)
     """
     account_verified = "dev" in os.environ.get(
         "ENV")
@@ -85,7 +100,7 @@ def create_user(db: Session, user: schemas.UserCreate, confirmation_key: str):
         username=user.username.lower(),
         bio=user.bio,
         birthdate=user.birthdate,
-        hashed_password=security.get_password_hash(user.password),
+        hashed_password=hashed_password,
         confirmation_key=confirmation_key,
         account_verified=account_verified
     )
@@ -96,32 +111,54 @@ def create_user(db: Session, user: schemas.UserCreate, confirmation_key: str):
 
 
 def update_user(db: Session, user_id: int, user_update: schemas.UserUpdateRequestBody):
-    user_db = db.query(models.User).filter(
-        models.User.id == user_id).one_or_none()
+    user_db = get_user_by_id(db, user_id)
     if user_update.newBio:
         user_db.bio = user_update.newBio
     if user_update.newUsername:
         user_db.username = user_update.newUsername
     db.commit()
     db.refresh(user_db)
+    principal_cache.invalidate(user_id)
     return user_db
 
 
 def verify_account(db: Session, user_id: int):
-    user_db = db.query(models.User).filter(
-        models.User.id == user_id).one_or_none()
+    user_db = get_user_by_id(db, user_id)
 
     user_db.confirmationKey = None
     user_db.account_verified = True
     db.commit()
     db.refresh(user_db)
+    principal_cache.invalidate(user_id)
     return user_db
 
 
 def delete_user(db: Session, user_id: int):
     try:
+        # The user's follows, likes, comments and messages are removed by ON DELETE
+        # CASCADE, so take them off the counters of the rows they point at
+        subtract_counts(db, models.User.follower_count, select(
+            models.Follows.follows_user_id, func.count(models.Follows.id)
+        ).where(models.Follows.user_id == user_id).group_by(models.Follows.follows_user_id))
+        subtract_counts(db, models.User.following_count, select(
+            models.Follows.user_id, func.count(models.Follows.id)
+        ).where(models.Follows.follows_user_id == user_id).group_by(models.Follows.user_id))
+        subtract_counts(db, models.Tweet.like_count, select(
+            models.TweetLikes.tweet_id, func.count(models.TweetLikes.id)
+        ).where(models.TweetLikes.user_id == user_id).group_by(models.TweetLikes.tweet_id))
+        subtract_counts(db, models.Tweet.comment_count, select(
+            models.Comments.tweet_id, func.count(models.Comments.id)
+        ).where(models.Comments.user_id == user_id).group_by(models.Comments.tweet_id))
+        subtract_counts(db, models.Comments.like_count, select(
+            models.CommentLikes.comment_id, func.count(models.CommentLikes.id)
+        ).where(models.CommentLikes.user_id == user_id).group_by(models.CommentLikes.comment_id))
+        subtract_counts(db, models.User.unread_message_count, select(
+            models.Messages.user_to_id, func.count(models.Messages.id)
+        ).where(models.Messages.user_from_id == user_id, models.Messages.is_read.isnot(True)).group_by(models.Messages.user_to_id))
+
         db.query(models.User).filter(models.User.id == user_id).delete()
         db.commit()
+        principal_cache.invalidate(user_id)
 
     except Exception as e:
         raise HTTPException(
@@ -132,44 +169,211 @@ def delete_user(db: Session, user_id: int):
 # TWEETS #
 ##########
 def get_tweet_by_id(db: Session, tweet_id: int):
-    return db.query(models.Tweet).filter(models.Tweet.id == tweet_id).one_or_none()
+    return get_loader(db, models.Tweet).load(tweet_id)
+
+
+def with_tweet_stats(db: Session, tweets_query, viewer_id: Optional[int] = None) -> List[models.Tweet]:
+    """Load a page of tweets together with whether viewer_id has liked them,
+    in a single query.
+
+    tweets_query must select models.Tweet ordered newest first. like_count and
+    comment_count are columns on the tweet; liked_by_me is looked up for the
+    tweets on the page only and set on each tweet.
+    """
+    page = tweets_query.cte("page")
+    tweet = aliased(models.Tweet, page)
+
+    liked = select(models.TweetLikes.tweet_id).where(
+        models.TweetLikes.user_id == viewer_id,
+        models.TweetLikes.tweet_id.in_(select(page.c.id))
+    ).distinct().subquery()
+
+    rows = db.query(
+        tweet,
+        liked.c.tweet_id.isnot(None)
+    ).options(joinedload(tweet.user)).outerjoin(
+        liked, liked.c.tweet_id == tweet.id).order_by(
+        tweet.created_at.desc(), tweet.id.desc()).all()
+
+    tweets = []
+    for db_tweet, liked_by_me in rows:
+        db_tweet.liked_by_me = liked_by_me
+        tweets.append(db_tweet)
+    return tweets
 
 
-def get_tweets(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Tweet).order_by(models.Tweet.created_at.desc()).offset(skip).limit(limit).all()
+def get_tweets(db: Session, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, viewer_id: Optional[int] = None):
+    query = paginate(db.query(models.Tweet), [
+                     models.Tweet.created_at, models.Tweet.id], cursor, skip, limit)
+    return with_tweet_stats(db, query, viewer_id)
 
 
-def get_tweets_for_user(db: Session, user_id: int, skip: int = 0, limit: int = 100):
+def get_tweets_for_user(db: Session, user_id: int, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, viewer_id: Optional[int] = None):
     # First check if user exists
-    db_user = db.query(models.User).filter(
-        models.User.id == user_id).one_or_none()
+    db_user = get_user_by_id(db, user_id)
 
     if not db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="User does not exist")
 
     # user exists - proceed to return tweets
-    tweets = db.query(models.Tweet).filter(models.Tweet.user_id == user_id).order_by(
-        models.Tweet.created_at.desc()).limit(limit).all()
-    return tweets
+    query = db.query(models.Tweet).filter(models.Tweet.user_id == user_id)
+    query = paginate(query, [models.Tweet.created_at,
+                     models.Tweet.id], cursor, skip, limit)
+    return with_tweet_stats(db, query, viewer_id)
+
 
+def get_tweets_liked_by_user(db: Session, user_id: int, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    likes = get_tweet_likes_by_user(
+        db, user_id, skip=skip, limit=limit, cursor=cursor)
+    return [like.tweet for like in likes]
 
-def get_tweets_liked_by_user(db: Session, user_id: int, skip: int = 0, limit: int = 100):
+
+def get_tweet_likes_by_user(db: Session, user_id: int, skip: int = 0, limit: int = 100, cursor: Optional[str] = None) -> List[models.TweetLikes]:
+    """Get the likes made by user_id, newest first
+    """
     # First check if user exists
 
-    db_user = db.query(models.User).filter(
-        models.User.id == user_id).one_or_none()
+    db_user = get_user_by_id(db, user_id)
 
     if not db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="User does not exist")
 
-    # user exists - proceed to return tweets
-    likes = db.query(models.TweetLikes).filter(models.TweetLikes.user_id == user_id).order_by(
-        models.TweetLikes.id.desc()).offset(skip).limit(limit).all()
+    # user exists - proceed to return likes
+    query = db.query(models.TweetLikes).options(
+        joinedload(models.TweetLikes.tweet).joinedload(models.Tweet.user)
+    ).filter(models.TweetLikes.user_id == user_id)
+    return paginate(query, [models.TweetLikes.id], cursor, skip, limit).all()
 
-    # tweets = [tweet_like.tweet for tweet_like in db_user.tweet_likes]
-    return [like.tweet for like in likes]
+
+def is_pull_author(db: Session, user_id: int) -> bool:
+    """True if user_id has more followers than the fan-out threshold, or ever had.
+
+    Tweets from these authors are not pushed into follower timelines on write,
+    they are pulled and merged in when a home timeline is read instead. The
+    first time this returns True the user is marked as a pull author for
+    good: tweets and follows skipped the timelines meanwhile, so dropping
+    back below the threshold must not stop them being pulled.
+
+    The caller is responsible for committing.
+    """
+    user = db.query(models.User.follower_count, models.User.pull_author).filter(
+        models.User.id == user_id).one()
+    if user.pull_author:
+        return True
+    if user.follower_count <= settings.TIMELINE_FANOUT_FOLLOWER_THRESHOLD:
+        return False
+    db.query(models.User).filter(models.User.id == user_id).update(
+        {models.User.pull_author: True}, synchronize_session=False)
+    return True
+
+
+def get_pull_authors_followed_by(db: Session, user_id: int) -> List[int]:
+    """Get the ids of every pull author (see is_pull_author) followed by user_id
+    """
+    authors = db.query(models.User.id).join(
+        models.Follows, models.Follows.follows_user_id == models.User.id).filter(
+        models.Follows.user_id == user_id,
+        models.User.pull_author.is_(True)
+    ).all()
+    return [author.id for author in authors]
+
+
+def get_recent_tweets_for_authors(db: Session, author_ids: List[int], limit: int = 100, cursor: Optional[str] = None) -> List[list]:
+    """Get the (created_at, id) of the newest <limit> tweets of each author
+    (older than cursor if given), as one newest-first list per author
+    """
+    if not author_ids:
+        return []
+
+    # One LATERAL subquery per author, each a LIMIT on the
+    # (user_id, created_at, id) index, instead of ranking every tweet of
+    # every author with a window function
+    authors = select(models.User.id).where(
+        models.User.id.in_(author_ids)).subquery("authors")
+    conditions = [models.Tweet.user_id == authors.c.id]
+    if cursor:
+        conditions.append(keyset_filter(
+            [models.Tweet.created_at, models.Tweet.id], cursor))
+    recent = select(models.Tweet.created_at, models.Tweet.id, models.Tweet.user_id).where(
+        *conditions).order_by(models.Tweet.created_at.desc(), models.Tweet.id.desc()).limit(limit).lateral("recent")
+
+    tweets = db.query(recent.c.created_at, recent.c.id, recent.c.user_id).select_from(authors).join(
+        recent, true()).order_by(
+        recent.c.user_id, recent.c.created_at.desc(), recent.c.id.desc()).all()
+
+    runs = {}
+    for tweet in tweets:
+        runs.setdefault(tweet.user_id, []).append((tweet.created_at, tweet.id))
+    return list(runs.values())
+
+
+def get_home_timeline(db: Session, user_id: int, skip: int = 0, limit: int = 100, cursor: Optional[str] = None) -> List[models.Tweet]:
+    """Get the newest tweets from every user that user_id follows
+
+    Tweets from most authors are read from the materialized timeline (see
+    fan_out_tweet) instead of joining follows and tweets on every request.
+    Tweets from pull authors (see is_pull_author) are pulled at read time
+    and k-way merged in by created_at.
+    """
+    if cursor:
+        skip = 0
+    timeline_key = [models.Timeline.created_at, models.Timeline.tweet_id]
+
+    pull_authors = get_pull_authors_followed_by(db, user_id)
+    if not pull_authors:
+        pushed = db.query(models.Tweet).join(
+            models.Timeline, models.Timeline.tweet_id == models.Tweet.id).filter(
+            models.Timeline.user_id == user_id)
+        return with_tweet_stats(db, paginate(pushed, timeline_key, cursor, skip, limit), user_id)
+
+    # Every run is already sorted newest first, so only the first skip + limit
+    # rows of each can end up on the requested page.
+    runs = get_recent_tweets_for_authors(
+        db, pull_authors, limit=skip + limit, cursor=cursor)
+    pushed = db.query(*timeline_key).filter(
+        models.Timeline.user_id == user_id)
+    runs.append([tuple(row) for row in paginate(
+        pushed, timeline_key, cursor, 0, skip + limit).all()])
+
+    seen = set()
+    page_ids = []
+    for _, tweet_id in heapq.merge(*runs, reverse=True):
+        # An author may have crossed the threshold after some of their tweets
+        # were already pushed
+        if tweet_id in seen:
+            continue
+        seen.add(tweet_id)
+        page_ids.append(tweet_id)
+        if len(page_ids) == skip + limit:
+            break
+    page_ids = page_ids[skip:]
+    if not page_ids:
+        return []
+
+    page = db.query(models.Tweet).filter(models.Tweet.id.in_(page_ids))
+    return with_tweet_stats(db, page, user_id)
+
+
+def fan_out_tweet(db: Session, db_tweet: models.Tweet):
+    """Push a new tweet into the home timeline of every follower of its author.
+
+    The caller is responsible for committing.
+    """
+    followers = select(
+        models.Follows.user_id,
+        models.Tweet.id,
+        models.Tweet.user_id,
+        models.Tweet.created_at
+    ).join(
+        models.Tweet, models.Tweet.user_id == models.Follows.follows_user_id
+    ).where(
+        models.Tweet.id == db_tweet.id, models.Follows.user_id.isnot(None)
+    )
+    db.execute(insert(models.Timeline).from_select(
+        ["user_id", "tweet_id", "author_id", "created_at"], followers
+    ).on_conflict_do_nothing())
 
 
 def create_user_tweet(db: Session, tweet: schemas.TweetCreate, user_id: int):
@@ -178,14 +382,17 @@ def create_user_tweet(db: Session, tweet: schemas.TweetCreate, user_id: int):
     db_tweet.user_id = user_id
 
     db.add(db_tweet)
+    # Flush to get the tweet id so the fan-out is part of the same transaction
+    db.flush()
+    if not is_pull_author(db, user_id):
+        fan_out_tweet(db, db_tweet)
     db.commit()
     db.refresh(db_tweet)
     return db_tweet
 
 
 def update_tweet(db: Session, user_id: int, tweet_id: int, new_content: str):
-    db_tweet: schemas.Tweet = db.query(models.Tweet).filter(
-        models.Tweet.id == tweet_id).one_or_none()
+    db_tweet: schemas.Tweet = get_tweet_by_id(db, tweet_id)
 
     if not db_tweet:
         raise HTTPException(status.HTTP_404_NOT_FOUND,
@@ -203,8 +410,7 @@ def update_tweet(db: Session, user_id: int, tweet_id: int, new_content: str):
 
 
 def delete_tweet(db: Session, user_id: int, tweet_id: int):
-    db_tweet: schemas.Tweet = db.query(models.Tweet).filter(
-        models.Tweet.id == tweet_id).one_or_none()
+    db_tweet: schemas.Tweet = get_tweet_by_id(db, tweet_id)
     if not db_tweet:
         raise HTTPException(status.HTTP_404_NOT_FOUND,
                             detail="Tweet not found")
@@ -213,6 +419,9 @@ def delete_tweet(db: Session, user_id: int, tweet_id: int):
         raise HTTPException(status.HTTP_401_UNAUTHORIZED,
                             detail="You are not authorized to delete that tweet")
     try:
+        # Remove the tweet from every home timeline it was pushed into
+        db.query(models.Timeline).filter(
+            models.Timeline.tweet_id == tweet_id).delete(synchronize_session=False)
         db.delete(db_tweet)
         db.commit()
 
@@ -226,8 +435,7 @@ def delete_tweet(db: Session, user_id: int, tweet_id: int):
 ############
 def create_tweet_comment(db: Session, user_id: int, comment: schemas.CommentCreate):
     # First check that tweet exists
-    db_tweet: schemas.Tweet = db.query(models.Tweet).filter(
-        models.Tweet.id == comment.tweetId).one_or_none()
+    db_tweet: schemas.Tweet = get_tweet_by_id(db, comment.tweetId)
     if not db_tweet:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Tweet does not exist")
@@ -237,6 +445,7 @@ def create_tweet_comment(db: Session, user_id: int, comment: schemas.CommentCrea
         tweet_id=comment.tweetId, user_id=user_id, content=comment.content)
     try:
         db.add(db_comment)
+        increment_count(db, models.Tweet.comment_count, comment.tweetId)
         db.commit()
         db.refresh(db_comment)
         return db_comment
@@ -246,14 +455,12 @@ def create_tweet_comment(db: Session, user_id: int, comment: schemas.CommentCrea
 
 
 def get_comment_by_id(db: Session, comment_id: int) -> models.Comments:
-    return db.query(models.Comments).filter(
-        models.Comments.id == comment_id).one_or_none()
+    return get_loader(db, models.Comments).load(comment_id)
 
 
-def get_comments_for_user(db: Session, user_id: int, skip: int = 0, limit: int = 100):
+def get_comments_for_user(db: Session, user_id: int, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
     # Check the user exists first
-    db_user = db.query(models.User).filter(
-        models.User.id == user_id).one_or_none()
+    db_user = get_user_by_id(db, user_id)
 
     if not db_user:
         raise HTTPException(
@@ -263,23 +470,27 @@ def get_comments_for_user(db: Session, user_id: int, skip: int = 0, limit: int =
     # TODO: temporarily sort list here to have newest first
     # User exists - proceed to return comments
     # db_user.comments.sort(key=lambda comment: datetime.strptime(comment.created_at, "%d-%b-%y"))
-    return db.query(models.Comments).filter(models.Comments.user_id == user_id).order_by(models.Comments.created_at.desc()).offset(skip).limit(limit).all()
+    query = db.query(models.Comments).options(joinedload(models.Comments.user)).filter(
+        models.Comments.user_id == user_id)
+    return paginate(query, [models.Comments.created_at, models.Comments.id], cursor, skip, limit).all()
 
 
-def get_comments_for_tweet(db: Session, tweet_id: int, skip: int = 0, limit: int = 100):
-    db_tweet = db.query(models.Tweet).filter(
-        models.Tweet.id == tweet_id).one_or_none()
+def get_comments_for_tweet(db: Session, tweet_id: int, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    """Get the comments on a tweet, oldest first. A limit of 0 returns every comment.
+    """
+    db_tweet = get_tweet_by_id(db, tweet_id)
 
     if not db_tweet:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Tweet does not exist")
     # return db_tweet.comments
-    return db.query(models.Comments).filter(models.Comments.tweet_id == tweet_id).order_by(models.Comments.created_at.asc()).offset(skip).all()
+    query = db.query(models.Comments).options(joinedload(models.Comments.user)).filter(
+        models.Comments.tweet_id == tweet_id)
+    return paginate(query, [models.Comments.created_at, models.Comments.id], cursor, skip, limit, descending=False).all()
 
 
 def update_comment(db: Session, user_id: int, comment: schemas.CommentUpdate) -> models.Comments:
-    db_comment: schemas.Comment = db.query(models.Comments).filter(
-        models.Comments.id == comment.commentId).one_or_none()
+    db_comment: schemas.Comment = get_comment_by_id(db, comment.commentId)
 
     if not db_comment:
         raise HTTPException(
@@ -296,8 +507,7 @@ def update_comment(db: Session, user_id: int, comment: schemas.CommentUpdate) ->
 
 
 def delete_comment(db: Session, user_id: int, comment: schemas.CommentCreate):
-    comment_db: schemas.Comment = db.query(models.Comments).filter(
-        models.Comments.id == comment.commentId).one_or_none()
+    comment_db: schemas.Comment = get_comment_by_id(db, comment.commentId)
 
     if not comment_db:
         raise HTTPException(
@@ -310,6 +520,8 @@ def delete_comment(db: Session, user_id: int, comment: schemas.CommentCreate):
 
     try:
         db.delete(comment_db)
+        increment_count(db, models.Tweet.comment_count,
+                        comment_db.tweet_id, -1)
         db.commit()
 
     except Exception as e:
@@ -321,15 +533,15 @@ def delete_comment(db: Session, user_id: int, comment: schemas.CommentCreate):
 #############
 
 
-def get_all_users_following(db: Session, user_id: int):
-    return db.query(models.Follows).filter(
-        models.Follows.user_id == user_id).all()
+def get_all_users_following(db: Session, user_id: int, skip: int = 0, limit: Optional[int] = None, cursor: Optional[str] = None):
+    query = db.query(models.Follows).options(joinedload(models.Follows.follows_user)).filter(
+        models.Follows.user_id == user_id)
+    return paginate(query, [models.Follows.id], cursor, skip, limit, descending=False).all()
 
 
 def create_follow_relationship(db: Session, user_id: int, follow_user_id: int):
     # First check if the user id is valid
-    check_user = db.query(models.User).filter(
-        models.User.id == follow_user_id).one_or_none()
+    check_user = get_user_by_id(db, follow_user_id)
 
     if not check_user:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
@@ -348,6 +560,30 @@ def create_follow_relationship(db: Session, user_id: int, follow_user_id: int):
     db_follows = models.Follows(
         user_id=user_id, follows_user_id=follow_user_id)
     db.add(db_follows)
+    increment_count(db, models.User.following_count, user_id)
+    increment_count(db, models.User.follower_count, follow_user_id)
+
+    if is_pull_author(db, follow_user_id):
+        # Tweets from this user are merged in when the timeline is read
+        db.commit()
+        db.refresh(db_follows)
+        return db_follows
+
+    # Back-fill the home timeline with the newly followed user's recent tweets
+    recent_tweets = select(
+        models.Tweet.id,
+        models.Tweet.user_id,
+        models.Tweet.created_at
+    ).where(
+        models.Tweet.user_id == follow_user_id
+    ).order_by(
+        models.Tweet.created_at.desc()
+    ).limit(settings.TIMELINE_BACKFILL_SIZE).subquery()
+    db.execute(insert(models.Timeline).from_select(
+        ["user_id", "tweet_id", "author_id", "created_at"],
+        select(literal(user_id), recent_tweets.c.id,
+               recent_tweets.c.user_id, recent_tweets.c.created_at)
+    ).on_conflict_do_nothing())
     db.commit()
     db.refresh(db_follows)
     return db_follows
@@ -355,8 +591,7 @@ def create_follow_relationship(db: Session, user_id: int, follow_user_id: int):
 
 def delete_follow_relationship(db: Session, user_id: int, follow_user_id: int):
     # First check if the user id is valid
-    check_user = db.query(models.User).filter(
-        models.User.id == user_id).one_or_none()
+    check_user = get_user_by_id(db, user_id)
 
     if not check_user:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
@@ -373,6 +608,12 @@ def delete_follow_relationship(db: Session, user_id: int, follow_user_id: int):
 
     # Follow relationship exists - proceed to un-follow
     db.delete(existing_follow)
+    increment_count(db, models.User.following_count, user_id, -1)
+    increment_count(db, models.User.follower_count, follow_user_id, -1)
+    # Remove the un-followed user's tweets from the home timeline
+    db.query(models.Timeline).filter(
+        models.Timeline.user_id == user_id,
+        models.Timeline.author_id == follow_user_id).delete(synchronize_session=False)
     db.commit()
     return
 
@@ -381,20 +622,44 @@ def delete_follow_relationship(db: Session, user_id: int, follow_user_id: int):
 #############
 
 
-def get_all_followers(db: Session, user_id: int):
+def get_all_followers(db: Session, user_id: int, skip: int = 0, limit: Optional[int] = None, cursor: Optional[str] = None):
     # Check if user_id is valid
-    existing_user = db.query(models.User.id).filter(
-        models.User.id == user_id).one_or_none()
+    existing_user = get_user_by_id(db, user_id)
 
     if not existing_user:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                             detail="Bad userId. User does not exist.")
 
     # User is valid - proceed to get all followers
-    db_followers = db.query(models.Follows).filter(
-        models.Follows.follows_user_id == user_id).all()
+    query = db.query(models.Follows).options(joinedload(models.Follows.user)).filter(
+        models.Follows.follows_user_id == user_id)
+    db_followers = paginate(
+        query, [models.Follows.id], cursor, skip, limit, descending=False).all()
     return db_followers
 
+
+def get_presence_audiences(db: Session, user_ids: List[int], viewer_ids: List[int]) -> Dict[int, List[int]]:
+    """For each of user_ids, the viewer_ids that should see that user's
+    presence: their followers and the users they have a conversation with.
+
+    viewer_ids (eg. the users online on this worker) may be long, so it is
+    sent as one array parameter instead of an IN list.
+    """
+    if not user_ids or not viewer_ids:
+        return {}
+    viewers = any_(bindparam("viewer_ids", list(viewer_ids), type_=ARRAY(Integer)))
+    followers = select(models.Follows.follows_user_id, models.Follows.user_id).where(
+        models.Follows.follows_user_id.in_(user_ids), models.Follows.user_id == viewers)
+    sent_to = select(models.Messages.user_from_id, models.Messages.user_to_id).where(
+        models.Messages.user_from_id.in_(user_ids), models.Messages.user_to_id == viewers)
+    received_from = select(models.Messages.user_to_id, models.Messages.user_from_id).where(
+        models.Messages.user_to_id.in_(user_ids), models.Messages.user_from_id == viewers)
+
+    audiences: Dict[int, List[int]] = {}
+    for user_id, viewer_id in db.execute(union(followers, sent_to, received_from)):
+        audiences.setdefault(user_id, []).append(viewer_id)
+    return audiences
+
 ###############
 # Tweet Likes #
 ###############
@@ -413,20 +678,23 @@ def get_tweet_like_by_tweet_id_and_user_id(db: Session, user_id, tweet_id: int)
         models.TweetLikes.tweet_id == tweet_id, models.TweetLikes.user_id == user_id).one_or_none()
 
 
-def get_all_tweet_likes(db: Session):
-    return db.query(models.TweetLikes).limit(2).all()
+def get_all_tweet_likes(db: Session, skip: int = 0, limit: int = 2, cursor: Optional[str] = None):
+    query = db.query(models.TweetLikes).options(
+        joinedload(models.TweetLikes.user))
+    return paginate(query, [models.TweetLikes.id], cursor, skip, limit, descending=False).all()
 
 
-def get_all_tweet_likes_for_tweet(db: Session, tweet_id: int):
+def get_all_tweet_likes_for_tweet(db: Session, tweet_id: int, skip: int = 0, limit: Optional[int] = None, cursor: Optional[str] = None):
     # First check if tweet exists
     existing_tweet = get_tweet_by_id(db, tweet_id)
     if not existing_tweet:
         raise HTTPException(status.HTTP_400_BAD_REQUEST,
                             detail="Error. Tweet does not exist")
 
-    # user exists - proceed to return tweets
-    return db.query(models.TweetLikes).filter(
-        models.TweetLikes.tweet_id == tweet_id).all()
+    # tweet exists - proceed to return likes
+    query = db.query(models.TweetLikes).options(joinedload(models.TweetLikes.user)).filter(
+        models.TweetLikes.tweet_id == tweet_id)
+    return paginate(query, [models.TweetLikes.id], cursor, skip, limit, descending=False).all()
 
 
 def create_tweet_like_for_tweet(db: Session, tweet_id: int, user_id: int):
@@ -438,7 +706,12 @@ def create_tweet_like_for_tweet(db: Session, tweet_id: int, user_id: int):
         tweet_id=tweet_id
     )
     db.add(db_tweet_like)
+    if not tweet_like_counter.enabled:
+        increment_count(db, models.Tweet.like_count, tweet_id)
     db.commit()
+    if tweet_like_counter.enabled:
+        # Batched off the (possibly very hot) tweets row
+        tweet_like_counter.mark(tweet_id)
     db.refresh(db_tweet_like)
     return db_tweet_like
 
@@ -465,7 +738,11 @@ def delete_tweet_like(db: Session, user_id: int, tweet_id: int,):
 
     # Data is valid - proceed to delete tweet like (un-like)
     db.delete(db_tweet_like)
+    if not tweet_like_counter.enabled:
+        increment_count(db, models.Tweet.like_count, tweet_id, -1)
     db.commit()
+    if tweet_like_counter.enabled:
+        tweet_like_counter.mark(tweet_id)
 
 
 # --------------------
@@ -487,11 +764,13 @@ def get_comment_like_by_comment_id_and_user_id(db: Session, user_id, comment_id:
         models.CommentLikes.comment_id == comment_id, models.CommentLikes.user_id == user_id).one_or_none()
 
 
-def get_all_comment_likes(db: Session) -> List[models.CommentLikes]:
-    return db.query(models.CommentLikes).all()
+def get_all_comment_likes(db: Session, skip: int = 0, limit: Optional[int] = None, cursor: Optional[str] = None) -> List[models.CommentLikes]:
+    query = db.query(models.CommentLikes).options(
+        joinedload(models.CommentLikes.user))
+    return paginate(query, [models.CommentLikes.id], cursor, skip, limit, descending=False).all()
 
 
-def get_all_comment_likes_for_comment(db: Session, comment_id: int) -> List[models.CommentLikes]:
+def get_all_comment_likes_for_comment(db: Session, comment_id: int, skip: int = 0, limit: Optional[int] = None, cursor: Optional[str] = None) -> List[models.CommentLikes]:
     # First check if comment exists
 
     existing_comment = get_comment_by_id(db, comment_id)
@@ -499,9 +778,10 @@ def get_all_comment_likes_for_comment(db: Session, comment_id: int) -> List[mode
         raise HTTPException(status.HTTP_400_BAD_REQUEST,
                             detail="Error. Comment does not exist")
 
-    # user exists - proceed to return comments
-    return db.query(models.CommentLikes).filter(
-        models.CommentLikes.comment_id == comment_id).all()
+    # comment exists - proceed to return likes
+    query = db.query(models.CommentLikes).options(joinedload(models.CommentLikes.user)).filter(
+        models.CommentLikes.comment_id == comment_id)
+    return paginate(query, [models.CommentLikes.id], cursor, skip, limit, descending=False).all()
 
 
 def create_comment_like_for_comment(db: Session, comment_id: int, user_id: int):
@@ -527,6 +807,7 @@ def create_comment_like_for_comment(db: Session, comment_id: int, user_id: int):
     )
 
     db.add(db_comment_like)
+    increment_count(db, models.Comments.like_count, comment_id)
     db.commit()
     db.refresh(db_comment_like)
     return db_comment_like
@@ -544,6 +825,7 @@ def delete_comment_like_by_user_and_comment_id(db: Session, user_id: int, commen
 
     # Data is valid - proceed to delete comment like (un-like)
     db.delete(db_comment_like)
+    increment_count(db, models.Comments.like_count, comment_id, -1)
     db.commit()
     return
 
@@ -552,20 +834,97 @@ def delete_comment_like_by_user_and_comment_id(db: Session, user_id: int, commen
 #    Counts   #
 ###############
 
+# Every denormalized counter column, with the column that references its row
+# from the counted table (and optionally which of those rows are counted).
+# Used to repair drift in reconcile_counters.
+COUNTERS = [
+    (models.Tweet.like_count, models.TweetLikes.tweet_id),
+    (models.Tweet.comment_count, models.Comments.tweet_id),
+    (models.User.follower_count, models.Follows.follows_user_id),
+    (models.User.following_count, models.Follows.user_id),
+    (models.Comments.like_count, models.CommentLikes.comment_id),
+    (models.User.unread_message_count, models.Messages.user_to_id,
+     models.Messages.is_read.isnot(True)),
+]
+
+
+def increment_count(db: Session, counter, row_id: int, amount: int = 1):
+    """Atomically add amount to a counter column (eg. models.Tweet.like_count)
+    of a single row. The caller is responsible for committing.
+    """
+    model = counter.class_
+    db.execute(update(model).where(model.id == row_id).values(
+        {counter: counter + amount}).execution_options(synchronize_session=False))
+
+
+def subtract_counts(db: Session, counter, grouped_counts):
+    """Subtract grouped_counts, a select of (row id, count) pairs, from a
+    counter column in one UPDATE ... FROM. The caller is responsible for committing.
+    """
+    model = counter.class_
+    counts = grouped_counts.subquery()
+    row_id, count = counts.c
+    db.execute(update(model).where(model.id == row_id).values(
+        {counter: counter - count}).execution_options(synchronize_session=False))
+
+
+def reconcile_counters(db: Session) -> Dict[str, int]:
+    """Recount every counter column from its source table and fix the rows that
+    have drifted. Returns the number of repaired rows per counter.
+    """
+    repaired = {}
+    for counter, foreign_key, *condition in COUNTERS:
+        model = counter.class_
+        actual = select(func.count()).select_from(foreign_key.class_).where(
+            foreign_key == model.id, *condition).scalar_subquery()
+        result = db.execute(update(model).where(counter != actual).values(
+            {counter: actual}).execution_options(synchronize_session=False))
+        repaired[f"{model.__tablename__}.{counter.key}"] = result.rowcount
+    db.commit()
+    return repaired
+
+
 def get_comment_count_for_tweet(db: Session, tweet_id: int):
-    return db.query(models.Comments).filter(models.Comments.tweet_id == tweet_id).count()
+    return db.query(models.Tweet.comment_count).filter(models.Tweet.id == tweet_id).scalar() or 0
 
 
 def get_like_count_for_tweet(db: Session, tweet_id: int):
-    return db.query(models.Comments).filter(models.Comments.tweet_id == tweet_id).count()
+    return db.query(models.Tweet.like_count).filter(models.Tweet.id == tweet_id).scalar() or 0
 
 
 def get_followers_for_user(db: Session, user_id: int):
-    return db.query(models.Follows).filter(models.Follows.follows_user_id == user_id).count()
+    return db.query(models.User.follower_count).filter(models.User.id == user_id).scalar() or 0
 
 
 def get_following_for_user(db: Session, user_id: int):
-    return db.query(models.Follows).filter(models.Follows.user_id == user_id).count()
+    return db.query(models.User.following_count).filter(models.User.id == user_id).scalar() or 0
+
+
+def get_counts_for_tweets(db: Session, tweet_ids: List[int]):
+    """Get (id, like_count, comment_count) for many tweets in one query
+    """
+    if not tweet_ids:
+        return []
+    return db.query(models.Tweet.id, models.Tweet.like_count, models.Tweet.comment_count).filter(
+        models.Tweet.id.in_(set(tweet_ids))).all()
+
+
+def get_counts_for_comments(db: Session, comment_ids: List[int]):
+    """Get (id, like_count) for many comments in one query
+    """
+    if not comment_ids:
+        return []
+    return db.query(models.Comments.id, models.Comments.like_count).filter(
+        models.Comments.id.in_(set(comment_ids))).all()
+
+
+def get_counts_for_users(db: Session, user_ids: List[int]):
+    """Get (id, follower_count, following_count) for many users in one query
+    """
+    if not user_ids:
+        return []
+    return db.query(models.User.id, models.User.follower_count, models.User.following_count).filter(
+        models.User.id.in_(set(user_ids))).all()
 
 
 #################
@@ -575,26 +934,86 @@ def get_following_for_user(db: Session, user_id: int):
 def get_message_by_id(db: Session, message_id):
     return db.query(models.Messages).filter_by(id=message_id).one_or_none()
 
-# !TODO: Need to actually implement the limit and skip...
-
-
-def get_messages_for_user(db: Session, user_id: int, skip: int = 0, limit: int = 10000):
+def get_messages_for_user(db: Session, user_id: int, skip: int = 0, limit: int = 10000, cursor: Optional[str] = None):
     # Check the user exists first
-    db_user = db.query(models.User).filter(
-        models.User.id == user_id).one_or_none()
+    db_user = get_user_by_id(db, user_id)
 
     if not db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="User does not exist")
-    return db.query(models.Messages).filter(or_(models.Messages.user_from_id == user_id, models.Messages.user_to_id == user_id)).order_by(models.Messages.created_at.asc()).offset(skip).limit(limit).all()
+    query = db.query(models.Messages).options(
+        joinedload(models.Messages.user_from),
+        joinedload(models.Messages.user_to)
+    ).filter(or_(models.Messages.user_from_id == user_id, models.Messages.user_to_id == user_id))
+    return paginate(query, [models.Messages.created_at, models.Messages.id], cursor, skip, limit, descending=False).all()
+
+
+def get_conversation_messages(db: Session, user_id: int, other_user_id: int, limit: int = 50, cursor: Optional[str] = None) -> List[models.Messages]:
+    """Messages between user_id and other_user_id, newest first. cursor
+    (the X-Next-Cursor of the previous page) selects older messages.
+
+    Filtering on least/greatest of the two ids matches both directions with
+    one range of ix_messages_conversation_created_at_id.
+    """
+    query = db.query(models.Messages).options(
+        joinedload(models.Messages.user_from),
+        joinedload(models.Messages.user_to)
+    ).filter(
+        func.least(models.Messages.user_from_id, models.Messages.user_to_id) == min(user_id, other_user_id),
+        func.greatest(models.Messages.user_from_id, models.Messages.user_to_id) == max(user_id, other_user_id)
+    )
+    return paginate(query, [models.Messages.created_at, models.Messages.id], cursor, limit=limit).all()
 
-    # User exists - proceed to return Messages
-    # TODO - there might be a better way to acheive this same result -> since I have to re-shape the data on the client
-    # TODO      anyway (mandatory traversal - 0(n)), I might as well just return all the messages and manually aggregate the conversations
-    # TODO      on the client... Need to think about this one a bit more.
-    # conversation_id = case([(models.Messages.user_from_id == user_id, models.Messages.user_to_id),
-    #                         (models.Messages.user_to_id == user_id, models.Messages.user_from_id)]).label("conversation_id")
-    # return db.query(column("content"), column("id"), column("user_from_id"), column("user_to_id"), conversation_id).filter(or_(models.Messages.user_from_id == user_id, models.Messages.user_to_id == user_id)).all()
+
+def mark_conversation_read(db: Session, user_id: int, other_user_id: int, up_to_message_id: int) -> int:
+    """Mark the messages other_user_id sent to user_id, up to and including
+    up_to_message_id, as read in one UPDATE. Returns how many were unread.
+    """
+    result = db.execute(update(models.Messages).where(
+        models.Messages.user_to_id == user_id,
+        models.Messages.user_from_id == other_user_id,
+        models.Messages.id <= up_to_message_id,
+        models.Messages.is_read.isnot(True)
+    ).values(is_read=True).execution_options(synchronize_session=False))
+    if result.rowcount:
+        increment_count(db, models.User.unread_message_count, user_id, -result.rowcount)
+    db.commit()
+    return result.rowcount
+
+
+def get_unread_message_count(db: Session, user_id: int) -> int:
+    return db.query(models.User.unread_message_count).filter(models.User.id == user_id).scalar() or 0
+
+
+def get_conversations_for_user(db: Session, user_id: int) -> List[Tuple[models.Messages, int]]:
+    """The last message of each of user_id's conversations (most recent
+    first), with the number of unread messages the other user sent.
+
+    The grouping happens in Postgres (DISTINCT ON the other user), so only
+    one row per conversation is sent back, however long the history is.
+    """
+    sent = select(models.Messages.id, models.Messages.user_to_id.label("other_user_id"), models.Messages.created_at).where(
+        models.Messages.user_from_id == user_id)
+    received = select(models.Messages.id, models.Messages.user_from_id.label("other_user_id"), models.Messages.created_at).where(
+        models.Messages.user_to_id == user_id)
+    both = union_all(sent, received).subquery()
+    last_message_ids = select(both.c.id).distinct(both.c.other_user_id).order_by(
+        both.c.other_user_id, both.c.created_at.desc(), both.c.id.desc())
+
+    last_messages = db.query(models.Messages).options(
+        joinedload(models.Messages.user_from),
+        joinedload(models.Messages.user_to)
+    ).filter(models.Messages.id.in_(last_message_ids)).order_by(
+        models.Messages.created_at.desc(), models.Messages.id.desc()).all()
+
+    unread_counts = dict(db.query(models.Messages.user_from_id, func.count()).filter(
+        models.Messages.user_to_id == user_id, models.Messages.is_read.isnot(True)
+    ).group_by(models.Messages.user_from_id).all())
+
+    return [
+        (message, unread_counts.get(message.user_from_id if message.user_to_id == user_id else message.user_to_id, 0))
+        for message in last_messages
+    ]
 
 
 def create_message(db: Session, user_id, body: schemas.MessageCreateRequestBody):
@@ -604,6 +1023,7 @@ def create_message(db: Session, user_id, body: schemas.MessageCreateRequestBody)
         user_to_id=body.userToId
     )
     db.add(db_message)
+    increment_count(db, models.User.unread_message_count, body.userToId)
     db.commit()
     db.refresh(db_message)
     return db_message
@@ -641,6 +1061,8 @@ def delete_message(db: Session, user_id: int, message: schemas.MessageDeleteRequ
                             detail="You are not authorized to delete that message")
 
     try:
+        if not message_db.is_read:
+            increment_count(db, models.User.unread_message_count, message_db.user_to_id, -1)
         db.delete(message_db)
         db.commit()
 
@@ -1,28 +1,97 @@
+import uuid
+
+import asyncpg
 from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 
-from .core.config import get_db_connection_url
-
-import time
-import os
+from .core.config import settings, get_db_connection_url, get_async_db_connection_url
+from .core.db_pool import InstrumentedQueuePool, InstrumentedAsyncQueuePool
 
 engine = None
 SessionLocal = None
-Base = None
-
-retries = 5
-while retries > 0:
-    try:
-        engine = create_engine(
-            get_db_connection_url()
-        )
-        SessionLocal = sessionmaker(
-            autocommit=False, autoflush=False, bind=engine)
-        Base = declarative_base()
-        print("DB Connected")
-        break
-    except Exception as e:
-        print("Error connecting..." + str(e))
-        retries -= 1
-        time.sleep(3)
+async_engine = None
+AsyncSessionLocal = None
+Base = declarative_base()
+
+# Each worker process gets its own pools, so the most connections a
+# deployment can open is workers * 2 engines * (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+pool_options = dict(
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+)
+
+# PgBouncer pool modes. In transaction mode every transaction may run on a
+# different server connection, shared with the other workers.
+PGBOUNCER_POOL_MODES = ("session", "transaction")
+
+
+class PgBouncerConnection(asyncpg.Connection):
+    """asyncpg connection for PgBouncer in transaction pooling mode.
+
+    asyncpg names prepared statements from a per-process counter
+    (__asyncpg_stmt_1__, ...), so two workers sharing a server connection
+    would collide on the same name. A random name never does. (asyncpg 0.25+
+    uses unnamed statements once its statement cache is off, and never gets
+    here for them.)
+    """
+
+    def _get_unique_id(self, prefix: str) -> str:
+        return f"__asyncpg_{prefix}_{uuid.uuid4().hex}__"
+
+
+def transaction_pooling() -> bool:
+    if settings.DB_PGBOUNCER and settings.DB_PGBOUNCER_POOL_MODE not in PGBOUNCER_POOL_MODES:
+        raise RuntimeError(
+            f"DB_PGBOUNCER_POOL_MODE must be one of {PGBOUNCER_POOL_MODES} "
+            f"(got {settings.DB_PGBOUNCER_POOL_MODE!r})")
+    return settings.DB_PGBOUNCER and settings.DB_PGBOUNCER_POOL_MODE == "transaction"
+
+
+def make_engine(url: str) -> Engine:
+    """psycopg2 engine for sync routes. Behind transaction pooling PgBouncer
+    is the pool, so connections are not kept here (psycopg2 never prepares
+    statements, nothing else needs changing).
+    """
+    if transaction_pooling():
+        return create_engine(url, poolclass=NullPool)
+    # Engines connect lazily, so a database that is not up yet only fails
+    # the first request (and pool_pre_ping replaces dead connections)
+    return create_engine(url, poolclass=InstrumentedQueuePool, **pool_options)
+
+
+def make_async_engine(url: str) -> AsyncEngine:
+    """asyncpg engine for async routes (see async_crud).
+
+    Behind transaction pooling nothing prepared may outlive its transaction:
+    the statement caches of asyncpg and of the SQLAlchemy dialect are turned
+    off, so every query is prepared (under a unique name) and run in the
+    same transaction.
+    """
+    if transaction_pooling():
+        return create_async_engine(url, poolclass=NullPool, connect_args=dict(
+            statement_cache_size=0,
+            prepared_statement_cache_size=0,
+            connection_class=PgBouncerConnection,
+        ))
+    return create_async_engine(url, poolclass=InstrumentedAsyncQueuePool, **pool_options)
+
+
+if get_db_connection_url():
+    engine = make_engine(get_db_connection_url())
+    SessionLocal = sessionmaker(
+        autocommit=False, autoflush=False, bind=engine)
+    # Objects are not expired on commit because reloading them would need IO
+    # outside of an await.
+    async_engine = make_async_engine(get_async_db_connection_url())
+    AsyncSessionLocal = sessionmaker(
+        autocommit=False, autoflush=False, expire_on_commit=False,
+        bind=async_engine, class_=AsyncSession)
+else:
+    print("No database url configured. Check ENV and the *_POSTGRES_URL variables.")
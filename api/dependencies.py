@@ -10,6 +10,7 @@ from starlette.requests import Request
 
 # SQLAlchemy
 from sqlalchemy.orm.session import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 # JWT
 from jose import JWTError, jwt
@@ -18,9 +19,10 @@ from typing import Optional
 
 # Custom Modules
 from . import crud, schemas
-from .database import SessionLocal
+from .database import SessionLocal, AsyncSessionLocal
 from .core import security
 from .core.config import settings
+from .core.principal_cache import principal_cache
 
 
 class OAuth2PasswordBearerCookie(OAuth2):
@@ -79,6 +81,8 @@ class OAuth2PasswordBearerCookie(OAuth2):
 
 # oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 oauth2_scheme = OAuth2PasswordBearerCookie(tokenUrl="/token")
+oauth2_scheme_optional = OAuth2PasswordBearerCookie(
+    tokenUrl="/token", auto_error=False)
 
 
 def get_db():
@@ -91,8 +95,19 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    """Yield a SQLAlchemy AsyncSession (asyncpg), for async routes. Use it through async_crud.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    """Decode the provided jwt and extract the user using the [sub] field.
+    """Decode the provided jwt and extract the user using the [uid] field (or
+    [sub] for tokens issued before [uid] was added).
+
+    Returns a cached snapshot of the user (schemas.UserWithPassword), so an
+    authenticated request normally costs no database round trip.
     """
     token_data: schemas.TokenData = None
 
@@ -109,14 +124,49 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
         if email is None:
             # Something wrong with the token
             raise credentials_exception
-        token_data = schemas.TokenData(email=email)
+        token_data = schemas.TokenData(email=email, userId=payload.get("uid"))
     except JWTError:
         # Something wrong with the token
         raise credentials_exception
     #
-    # Get user from database
+    # Get user from the cache, or from the database
     #
-    user = crud.get_user_by_email(db, token_data.email)
+    if token_data.userId is not None:
+        cached_user = principal_cache.get(token_data.userId)
+        if cached_user is not None:
+            return cached_user
+        user = crud.get_user_by_id(db, token_data.userId)
+    else:
+        user = crud.get_user_by_email(db, token_data.email)
     if user is None:
         raise credentials_exception
-    return user
+
+    principal = schemas.UserWithPassword.from_orm(user)
+    principal_cache.set(user.id, principal)
+    return principal
+
+
+def get_websocket_user(token: str = Depends(oauth2_scheme)) -> Optional[schemas.UserWithPassword]:
+    """get_current_user for WebSocket and event stream endpoints. Returns None when authentication fails.
+
+    A session from get_db would stay open (holding a pooled connection after
+    its first query) for as long as the socket does. This one is only used on
+    a principal cache miss and is closed before the socket starts.
+    """
+    db = SessionLocal()
+    try:
+        return get_current_user(token, db)
+    except HTTPException:
+        return None
+    finally:
+        db.close()
+
+
+def get_optional_current_user(token: str = Depends(oauth2_scheme_optional), db: Session = Depends(get_db)):
+    """Same as get_current_user, but returns None instead of failing when no
+    token was sent or it is expired/invalid (eg. a stale cookie on a public page).
+    """
+    try:
+        return get_current_user(token, db)
+    except (HTTPException, JWTError):
+        return None
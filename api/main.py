@@ -2,7 +2,8 @@
 import os
 import time
 import json
-from typing import List, Dict, Union
+import asyncio
+from typing import List, Dict, Optional, Union
 
 # FastAPI
 from fastapi import (
@@ -19,6 +20,11 @@ from fastapi import (
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.encoders import jsonable_encoder
 
+# Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
 # Routers
 from .routers import (
     auth,
@@ -30,6 +36,9 @@ from .routers import (
     tweet_likes,
     comment_likes,
     messages,
+    counts,
+    metrics,
+    events,
 )
 
 # SQLAlchemy
@@ -39,6 +48,8 @@ from sqlalchemy.orm import Session
 from .core import security
 from .core.config import settings
 from .core.cors import cors_origins
+from .core.pagination import NEXT_CURSOR_HEADER
+from .core.counters import tweet_like_counter
 from .core.websocket.connection_manager import ws_manager
 
 # Database
@@ -48,6 +59,9 @@ from . import crud, models, schemas, dependencies
 # Schema
 from .schemas.websockets import WSMessage, WSMessageAction, WSMessageError
 
+# Background Jobs
+from .background_functions.reconcile_counters import reconcile_counters_periodically
+
 # Instantiate Main FastAPI Instance
 app = FastAPI(
     # root_path=settings.API_V1_STR,
@@ -63,7 +77,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
-    expose_headers=["set-cookie"],
+    expose_headers=["set-cookie", NEXT_CURSOR_HEADER],
 )
 
 # Include All Routers
@@ -76,24 +90,66 @@ app.include_router(followers.router)
 app.include_router(tweet_likes.router)
 app.include_router(comment_likes.router)
 app.include_router(messages.router)
+app.include_router(counts.router)
+app.include_router(metrics.router)
+app.include_router(events.router)
+
+
+@app.on_event("startup")
+async def start_background_jobs():
+    await ws_manager.start()
+    if settings.COUNTER_RECONCILE_INTERVAL_SECONDS > 0:
+        asyncio.create_task(reconcile_counters_periodically(
+            settings.COUNTER_RECONCILE_INTERVAL_SECONDS))
+    if tweet_like_counter.enabled:
+        asyncio.create_task(tweet_like_counter.run())
+
+
+@app.on_event("shutdown")
+async def flush_counters():
+    await run_in_threadpool(tweet_like_counter.flush_with_new_session)
+
+
+@app.on_event("shutdown")
+async def stop_websocket_broker():
+    await ws_manager.stop()
+
 
 # Needed to resolve an unknown http bug
 
 
-@app.middleware("http")
-async def modify_location_header(request: Request, call_next):
+class ModifyLocationHeaderMiddleware:
     """This is a very hacky fix for a glitch in the "location" response header
     For some reason it sends back http instead of https so I manually
     overwrite it here. Definitely something that should be fixed upstream in
     configuration but this will work temporarily until I find the correct location.
+
+    Plain ASGI rather than @app.middleware("http"): that one pipes every
+    response body through an extra task and queue, which each open event
+    stream would keep for as long as it is connected.
     """
-    response: Response = await call_next(request)
 
-    # Check for location response header
-    location = response.headers.get("location")
-    if location and os.environ.get("ENV") != "development":
-        response.headers["location"] = location.replace("http:", "https:")
-    return response
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or os.environ.get("ENV") == "development":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_https_location(message: Message):
+            if message["type"] == "http.response.start":
+                # Check for location response header
+                headers = MutableHeaders(scope=message)
+                location = headers.get("location")
+                if location:
+                    headers["location"] = location.replace("http:", "https:")
+            await send(message)
+
+        await self.app(scope, receive, send_with_https_location)
+
+
+app.add_middleware(ModifyLocationHeaderMiddleware)
 
 # Dummy route at the index
 
@@ -108,8 +164,8 @@ def index(request: Request):
 async def websocket_endpoint(
     websocket: WebSocket,
     user_id: int,
-    db: Session = Depends(dependencies.get_db),
-    current_user: schemas.User = Depends(dependencies.get_current_user)
+    lastEventId: Optional[str] = None,
+    current_user: schemas.User = Depends(dependencies.get_websocket_user)
 ):
     """
     Websocket endpoint for authenticated users.
@@ -119,6 +175,16 @@ async def websocket_endpoint(
 
     Listens for incoming MESSAGES and handles them accordingly
 
+    A client reconnecting with ?lastEventId=<eventId of the last event it
+    received> gets the events it missed, or an events.resync message (with
+    the reason, eg. other_worker) if it has to reload instead.
+
+    Holds no database session: the user comes from the principal cache (or a
+    short-lived session), so an idle socket uses no pooled connection.
+
+    Clients that only receive events can use GET /events/stream (Server-Sent
+    Events) instead.
+
     TODO: This should be moved to its own websocket module
     TODO: The /user_id param should not be needed anymore since it gets it from the token
     """
@@ -126,10 +192,6 @@ async def websocket_endpoint(
     # print("user_id: ", user_id)
     # print("current user", current_user)
     # await ws_manager.show_all_connections()
-    #
-    # Attempt to connect new client
-    #
-    await ws_manager.connect(websocket, user_id)
     if not current_user:
         # print("No authenticated user - Alert client and close connection...")
         auth_failed_message = WSMessage[None](
@@ -140,20 +202,22 @@ async def websocket_endpoint(
                 code=401
             )
         )
-        await ws_manager.send_personal_message(auth_failed_message, user_id)
-        await ws_manager.disconnect(user_id)
+        await websocket.accept()
+        await websocket.send_text(json.dumps(jsonable_encoder(auth_failed_message)))
+        await websocket.close()
         return
     #
-    # New client has connected
+    # Attempt to connect new client
+    #
+    # The token decides who this is, not the url
+    user_id = current_user.id
+    connection = await ws_manager.connect(websocket, user_id, lastEventId)
+    if connection is None:
+        return
+    #
+    # New client has connected. ws_manager sends the presence change to the
+    # user's followers and conversation partners (chat.users.presence).
     #
-    # user: schemas.User = crud.get_user_by_id(db, user_id)
-    await ws_manager.broadcast({"action": "chat.user.online", "body": jsonable_encoder(
-        schemas.ChatUserOnlineResponseBody(
-            isOnline=True,
-            userId=user_id,
-            username=current_user.username
-        )
-    )}, user_id)
 
     try:
         while True:
@@ -162,8 +226,6 @@ async def websocket_endpoint(
             # ! Note: so far the client does not send any WS messages - instead relies on the http rest api
             data = await websocket.receive_json()
 
-            user: schemas.User = crud.get_user_by_id(db, user_id)
-
             # data = json.loads(data)
             # print("\n*************** New Websocket Message *************")
             # print(data)
@@ -178,29 +240,38 @@ async def websocket_endpoint(
                     userId=body.userId
                 )
                 # Send a message back to notify if the other user is online or not
-                await websocket.send_json(
-                    {"action": action, "body": jsonable_encoder(response_body)})
+                ws_manager.send_to_connection(
+                    connection, {"action": action, "body": jsonable_encoder(response_body)})
 
             elif (action == "chat.user.typing"):
                 body = schemas.ChatUserTypingRequestBody(**data.get("body"))
                 response_body = schemas.ChatUserTypingResponseBody(
-                    isTyping=True
+                    isTyping=True,
+                    userId=user_id
                 )
+                # Sent once per WS_TYPING_THROTTLE_MS, not on every keystroke
+                await ws_manager.send_typing(
+                    user_id, body.userId, {"action": action, "body": jsonable_encoder(response_body)})
 
-                await ws_manager.send_personal_message(
-                    {"action": action, "body": jsonable_encoder(response_body)}, body.userId)
+            elif (action == WSMessageAction.TopicsSubscribe or action == WSMessageAction.TopicsUnsubscribe):
+                # Likes, comments and follows are only sent to the
+                # connections subscribed to their tweet:{id} / user:{id} topic.
+                # conversation:{a}-{b} gets the messages, deletions and typing
+                # events of a conversation (its recipient gets them regardless)
+                body = schemas.WSTopicsRequestBody(**data.get("body"))
+                if action == WSMessageAction.TopicsSubscribe:
+                    topics = ws_manager.subscribe(connection, body.topics)
+                else:
+                    topics = ws_manager.unsubscribe(connection, body.topics)
+                ws_manager.send_to_connection(
+                    connection, {"action": action, "body": jsonable_encoder(schemas.WSTopicsResponseBody(topics=topics))})
 
     except WebSocketDisconnect as error:
         #
         # Client has disconnected
         #
         # print("Client Disconnected !: ", error)
-        await ws_manager.broadcast({"action": "chat.user.online", "body": jsonable_encoder(
-            schemas.ChatUserOnlineResponseBody(
-                isOnline=False,
-                userId=user_id,
-                username=current_user.username
-            )
-        )}, user_id)
-        await ws_manager.disconnect(user_id)
+        pass
+    finally:
+        await ws_manager.disconnect(connection)
         # await ws_manager.broadcast({"action": "notification", "message": f"{user.username} disconnected"})
@@ -1,6 +1,6 @@
-from sqlalchemy import Boolean, Column, Integer, String, DateTime, Date, ForeignKey
+from sqlalchemy import Boolean, Column, Integer, String, DateTime, Date, ForeignKey, Index
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 # from sqlalchemy.dialects.postgresql import JSONB
 
 from .database import Base
@@ -22,6 +22,17 @@ class User(Base):
     account_verified = Column(Boolean, nullable=False, default=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now())
+    follower_count = Column(Integer, nullable=False,
+                            default=0, server_default="0")
+    following_count = Column(Integer, nullable=False,
+                             default=0, server_default="0")
+    # Messages received and not read yet (badge count)
+    unread_message_count = Column(Integer, nullable=False,
+                                  default=0, server_default="0")
+    # Set once the user's tweets are pulled into home timelines instead of
+    # pushed (see crud.is_pull_author), and never cleared
+    pull_author = Column(Boolean, nullable=False,
+                         default=False, server_default="false")
 
     tweets = relationship("Tweet", back_populates="user")
     followers = relationship(
@@ -37,6 +48,11 @@ class User(Base):
     outbox = relationship("Messages", back_populates="user_to",
                           foreign_keys="Messages.user_to_id")
 
+    __table_args__ = (
+        Index("ix_users_lower_email", func.lower(email)),
+        Index("ix_users_lower_username", func.lower(username)),
+    )
+
     def __repr__(self):
         return f"{self.id} | {self.username}"
 
@@ -55,6 +71,13 @@ class Follows(Base):
     follows_user = relationship(
         "User", back_populates="followers", foreign_keys=[follows_user_id])
 
+    __table_args__ = (
+        Index("ix_follows_follows_user_id_user_id",
+              "follows_user_id", "user_id"),
+        Index("ix_follows_user_id_id", "user_id", "id"),
+        Index("ix_follows_follows_user_id_id", "follows_user_id", "id"),
+    )
+
 
 class Tweet(Base):
     __tablename__ = "tweets"
@@ -63,12 +86,21 @@ class Tweet(Base):
     content = Column(String, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     user_id = Column(Integer, ForeignKey("users.id"))
+    like_count = Column(Integer, nullable=False, default=0, server_default="0")
+    comment_count = Column(Integer, nullable=False,
+                           default=0, server_default="0")
 
     user = relationship("User", back_populates="tweets",
                         foreign_keys=[user_id])
     comments = relationship("Comments", back_populates="tweet")
     likes = relationship("TweetLikes", back_populates="tweet")
 
+    __table_args__ = (
+        Index("ix_tweets_created_at_id", "created_at", "id"),
+        Index("ix_tweets_user_id_created_at_id",
+              "user_id", "created_at", "id"),
+    )
+
 
 class TweetLikes(Base):
     __tablename__ = "tweet_likes"
@@ -82,6 +114,11 @@ class TweetLikes(Base):
     tweet = relationship("Tweet", back_populates="likes",
                          foreign_keys=[tweet_id])
 
+    __table_args__ = (
+        Index("ix_tweet_likes_user_id_id", "user_id", "id"),
+        Index("ix_tweet_likes_tweet_id_id", "tweet_id", "id"),
+    )
+
 
 class Comments(Base):
     __tablename__ = "comments"
@@ -91,6 +128,7 @@ class Comments(Base):
     tweet_id = Column(Integer, ForeignKey("tweets.id"))
     content = Column(String, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    like_count = Column(Integer, nullable=False, default=0, server_default="0")
 
     user = relationship("User", back_populates="comments",
                         foreign_keys=[user_id])
@@ -99,6 +137,13 @@ class Comments(Base):
     likes = relationship("CommentLikes", back_populates="comment",
                          foreign_keys="CommentLikes.comment_id")
 
+    __table_args__ = (
+        Index("ix_comments_user_id_created_at_id",
+              "user_id", "created_at", "id"),
+        Index("ix_comments_tweet_id_created_at_id",
+              "tweet_id", "created_at", "id"),
+    )
+
 
 class CommentLikes(Base):
     __tablename__ = "comment_likes"
@@ -112,6 +157,10 @@ class CommentLikes(Base):
     comment = relationship(
         "Comments", back_populates="likes", foreign_keys=[comment_id])
 
+    __table_args__ = (
+        Index("ix_comment_likes_comment_id_id", "comment_id", "id"),
+    )
+
 
 class Messages(Base):
     __tablename__ = "messages"
@@ -128,3 +177,42 @@ class Messages(Base):
 
     user_to = relationship(
         "User", back_populates="outbox", foreign_keys=[user_to_id])
+
+    __table_args__ = (
+        Index("ix_messages_user_from_id_created_at_id",
+              "user_from_id", "created_at", "id"),
+        Index("ix_messages_user_to_id_created_at_id",
+              "user_to_id", "created_at", "id"),
+        # One conversation (either direction) in created_at order
+        Index("ix_messages_conversation_created_at_id",
+              func.least(user_from_id, user_to_id), func.greatest(user_from_id, user_to_id),
+              "created_at", "id"),
+        # Unread counts per conversation only visit unread messages
+        Index("ix_messages_unread", "user_to_id", "user_from_id",
+              postgresql_where=text("is_read IS NOT TRUE")),
+    )
+
+
+class Timeline(Base):
+    """<tweet_id> (written by <author_id>) appears in the home timeline of <user_id>
+
+    Rows are written when a tweet is created (fan-out-on-write) so reading a
+    home timeline is a single range scan over (user_id, created_at, tweet_id).
+    """
+    __tablename__ = "timelines"
+
+    user_id = Column(Integer, ForeignKey(
+        "users.id", ondelete="CASCADE"), primary_key=True)
+    tweet_id = Column(Integer, ForeignKey(
+        "tweets.id", ondelete="CASCADE"), primary_key=True)
+    author_id = Column(Integer, ForeignKey(
+        "users.id", ondelete="CASCADE"), nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        Index("ix_timelines_user_id_created_at_tweet_id",
+              "user_id", "created_at", "tweet_id"),
+        Index("ix_timelines_user_id_author_id", "user_id", "author_id"),
+    )
+
+    tweet = relationship("Tweet", foreign_keys=[tweet_id])
@@ -7,16 +7,17 @@ from starlette.responses import RedirectResponse, Response, JSONResponse
 from starlette.requests import Request
 
 # SQLAlchemy
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 # Types
 from typing import List
 
 # Custom Modules
-from .. import schemas, crud
+from .. import schemas
 from ..core import security
 from ..core.config import settings
-from ..dependencies import get_db, get_current_user
+from ..dependencies import get_async_db, get_current_user
+from ..core.principal_cache import principal_cache
 
 import os
 
@@ -24,11 +25,11 @@ router = APIRouter(tags=['auth'])
 
 
 @router.post("/token")
-async def login(response: Response, form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(response: Response, form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
     """User will attempt to authenticate with a email/password flow
     """
 
-    user = security.authenticate_user(
+    user = await security.authenticate_user_async(
         db, form_data.username, form_data.password)
     if not user:
         # Wrong email or password provided
@@ -39,7 +40,8 @@ async def login(response: Response, form_data: OAuth2PasswordRequestForm = Depen
         raise HTTPException(
             status_code=400, detail="Email is not verified. Please check your email.")
 
-    token = security.create_access_token(data={"sub": user.email})
+    token = security.create_access_token(
+        data={"sub": user.email, "uid": user.id})
     response.set_cookie(
         key="Authorization",
         value=f'Bearer {token}',
@@ -58,6 +60,7 @@ async def login(response: Response, form_data: OAuth2PasswordRequestForm = Depen
 
 @router.post("/logout")
 async def logout_and_expire_cookie(response: Response, current_user: schemas.User = Depends(get_current_user)):
+    principal_cache.invalidate(current_user.id)
     # response.delete_cookie("Authorization")
     response.set_cookie(
         key="Authorization",
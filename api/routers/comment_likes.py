@@ -1,18 +1,21 @@
 # FastAPI
-from fastapi import APIRouter, HTTPException, Request, Depends, status
+from fastapi import APIRouter, HTTPException, Request, Response, Depends, status
 
 # SQLAlchemy
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 # Types
 from typing import List, Optional
 
 # Custom Modules
-from .. import schemas, crud, models
-from ..dependencies import get_db, get_current_user
+from .. import schemas, crud, models, async_crud
+from ..dependencies import get_db, get_async_db, get_current_user
 from ..core import security
 from ..core.config import settings
+from ..core.pagination import set_next_cursor, id_key
 from ..core.websocket.connection_manager import ws_manager
+from ..core.websocket.topics import tweet_topic
 from ..schemas.websockets import WSMessage, WSMessageAction
 
 # FastAPI router object
@@ -20,7 +23,13 @@ router = APIRouter(prefix="/comment-likes", tags=['comment-likes'])
 
 
 @router.get("", response_model=List[schemas.CommentLikeResponseBody])
-def get_all_comment_likes(commentId: Optional[int] = None, db: Session = Depends(get_db)):
+def get_all_comment_likes(
+        response: Response,
+        commentId: Optional[int] = None,
+        skip: int = 0,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        db: Session = Depends(get_db)):
     """
     The GET method for this endpoint will send back either all, or specific likes based on comment. This endpoint will always return an array of objects.
 
@@ -32,10 +41,13 @@ def get_all_comment_likes(commentId: Optional[int] = None, db: Session = Depends
     """
     comment_likes: List[models.CommentLikes] = []
     if commentId:
-        comment_likes = crud.get_all_comment_likes_for_comment(db, commentId)
+        comment_likes = crud.get_all_comment_likes_for_comment(
+            db, commentId, skip=skip, limit=limit, cursor=cursor)
 
     else:
-        comment_likes = crud.get_all_comment_likes(db)
+        comment_likes = crud.get_all_comment_likes(
+            db, skip=skip, limit=limit, cursor=cursor)
+    set_next_cursor(response, comment_likes, limit, key=id_key)
 
     return [
         schemas.CommentLikeResponseBody(
@@ -50,11 +62,11 @@ def get_all_comment_likes(commentId: Optional[int] = None, db: Session = Depends
 @router.post("", response_model=schemas.CommentLikeResponseBody)
 async def like_a_comment(
     comment_body: schemas.CommentLikeCreateRequestBody,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: schemas.User = Depends(get_current_user)
 ):
     # validate & create the like record
-    comment_like = crud.create_comment_like_for_comment(
+    comment_like = await async_crud.create_comment_like_for_comment(
         db=db, comment_id=comment_body.commentId, user_id=current_user.id)
 
     return_like = schemas.CommentLikeResponseBody(
@@ -71,7 +83,8 @@ async def like_a_comment(
             commentLike=return_like
         )
     )
-    await ws_manager.broadcast(message, current_user.id)
+    await ws_manager.publish_to_topics(
+        [tweet_topic(comment_like.comment.tweet_id)], message, current_user.id)
 
     return return_like
 
@@ -79,13 +92,13 @@ async def like_a_comment(
 @router.delete("", response_model=schemas.EmptyResponse)
 async def delete_comment_like(
         request_body: schemas.CommentLikeDeleteRequestBody,
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_async_db),
         current_user: schemas.User = Depends(get_current_user)):
 
-    comment_like = crud.get_comment_like_by_comment_id_and_user_id(
+    comment_like = await async_crud.get_comment_like_by_comment_id_and_user_id(
         db, current_user.id, request_body.commentId)
 
-    delete_successful = crud.delete_comment_like_by_user_and_comment_id(
+    delete_successful = await async_crud.delete_comment_like_by_user_and_comment_id(
         db, current_user.id, request_body.commentId)
 
     message = WSMessage[schemas.WSCommentLikeUpdated](
@@ -100,7 +113,8 @@ async def delete_comment_like(
             )
         )
     )
-    await ws_manager.broadcast(message, current_user.id)
+    await ws_manager.publish_to_topics(
+        [tweet_topic(comment_like.comment.tweet_id)], message, current_user.id)
 
     # TODO return status for delete?
     return schemas.EmptyResponse()
@@ -1,12 +1,15 @@
-from fastapi import APIRouter, HTTPException, Request, Depends, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Request, Response, Depends, BackgroundTasks
 from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 
-from .. import schemas, crud
+from .. import schemas, crud, async_crud
 from ..core import security
 from ..core.config import settings
+from ..core.pagination import set_next_cursor
 from ..core.websocket.connection_manager import ws_manager
-from ..dependencies import get_db, get_current_user
+from ..core.websocket.topics import tweet_topic
+from ..dependencies import get_db, get_async_db, get_current_user
 from ..background_functions.email_notifications import send_new_comment_notification_email
 from ..schemas.websockets import WSMessage, WSMessageAction
 
@@ -15,13 +18,16 @@ router = APIRouter(prefix="/comments", tags=['comments'])
 
 @router.get("/user/{userId}", response_model=List[schemas.Comment])
 def get_comments_for_user(
+    response: Response,
     userId: int,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
     comments = crud.get_comments_for_user(
-        db, user_id=userId, skip=skip, limit=limit)
+        db, user_id=userId, skip=skip, limit=limit, cursor=cursor)
+    set_next_cursor(response, comments, limit)
     return [
         schemas.Comment(
             id=comment.id,
@@ -36,13 +42,18 @@ def get_comments_for_user(
 
 @router.get("/tweet/{tweetId}", response_model=List[schemas.Comment])
 def get_comments_for_tweet(
+    response: Response,
     tweetId: int,
     skip: int = 0,
     limit: int = 0,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
+    """Return the comments on a tweet, oldest first. limit=0 returns all of them.
+    """
     comments = crud.get_comments_for_tweet(
-        db, tweet_id=tweetId, skip=skip, limit=limit)
+        db, tweet_id=tweetId, skip=skip, limit=limit, cursor=cursor)
+    set_next_cursor(response, comments, limit)
     return [
         schemas.Comment(
             id=comment.id,
@@ -71,10 +82,10 @@ def get_comment_count_for_tweet(
 async def create_comment_for_tweet(
     request_body: schemas.CommentCreate,
     bg_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: schemas.User = Depends(get_current_user)
 ):
-    newComment = crud.create_tweet_comment(db, current_user.id, request_body)
+    newComment = await async_crud.create_tweet_comment(db, current_user.id, request_body)
 
     # Broadcast a WS message so users can see the new comment get updated in real-time
     return_comment = schemas.Comment(
@@ -96,18 +107,19 @@ async def create_comment_for_tweet(
         bg_tasks.add_task(send_new_comment_notification_email,
                           tweet_owner=newComment.tweet.user, commenter=newComment.user, comment=newComment)
 
-    # Push the new comment to all online users
-    await ws_manager.broadcast(message, current_user.id)
+    # Push the new comment to everyone looking at the tweet
+    await ws_manager.publish_to_topics(
+        [tweet_topic(newComment.tweet_id)], message, current_user.id)
     return return_comment
 
 
 @router.put("", response_model=schemas.Comment)
 async def update_comment(
     request_body: schemas.CommentUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: schemas.User = Depends(get_current_user)
 ):
-    comment = crud.update_comment(db, current_user.id, request_body)
+    comment = await async_crud.update_comment(db, current_user.id, request_body)
     return_comment = schemas.Comment(
         id=comment.id,
         userId=comment.user_id,
@@ -126,7 +138,8 @@ async def update_comment(
             comment=return_comment
         )
     )
-    await ws_manager.broadcast(message, current_user.id)
+    await ws_manager.publish_to_topics(
+        [tweet_topic(comment.tweet_id)], message, current_user.id)
 
     return return_comment
 
@@ -134,11 +147,13 @@ async def update_comment(
 @router.delete("", response_model=schemas.EmptyResponse)
 async def delete_comment(
     request_body: schemas.CommentDelete,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: schemas.User = Depends(get_current_user)
 ):
 
-    comment = crud.get_comment_by_id(db, request_body.commentId)
+    comment = await async_crud.get_comment_by_id(db, request_body.commentId)
+    # Fails (400/401) for a missing comment or someone else's, before anything is sent
+    result = await async_crud.delete_comment(db, current_user.id, request_body)
     # Broadcast a WS message so users can see the new comment get updated in real-time
     message = WSMessage[schemas.WSCommentDeleted](
         action=WSMessageAction.DeletedComment,
@@ -147,5 +162,6 @@ async def delete_comment(
             commentId=request_body.commentId
         )
     )
-    await ws_manager.broadcast(message, current_user.id)
-    return crud.delete_comment(db, current_user.id, request_body)
+    await ws_manager.publish_to_topics(
+        [tweet_topic(comment.tweet_id)], message, current_user.id)
+    return result
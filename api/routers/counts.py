@@ -0,0 +1,48 @@
+# FastAPI
+from fastapi import APIRouter, Depends
+
+# SQLAlchemy
+from sqlalchemy.orm import Session
+
+# Custom Modules
+from .. import schemas, crud
+from ..dependencies import get_db
+
+# FastAPI router object
+router = APIRouter(prefix="/counts", tags=['counts'])
+
+
+@router.post("/batch", response_model=schemas.BatchCountsResponse)
+def get_counts_in_batch(
+    request_body: schemas.BatchCountsRequestBody,
+    db: Session = Depends(get_db)
+):
+    """
+    Return the like/comment counts of many tweets, the like counts of many
+    comments and the follower/following counts of many users in one request.
+
+    Ids that do not exist are left out of the response.
+    """
+    tweets = crud.get_counts_for_tweets(db, request_body.tweetIds)
+    comments = crud.get_counts_for_comments(db, request_body.commentIds)
+    users = crud.get_counts_for_users(db, request_body.userIds)
+
+    return schemas.BatchCountsResponse(
+        tweets={
+            tweet.id: schemas.TweetCounts(
+                likeCount=tweet.like_count,
+                commentCount=tweet.comment_count
+            ) for tweet in tweets
+        },
+        comments={
+            comment.id: schemas.CommentCounts(
+                likeCount=comment.like_count
+            ) for comment in comments
+        },
+        users={
+            user.id: schemas.UserCounts(
+                followerCount=user.follower_count,
+                followingCount=user.following_count
+            ) for user in users
+        }
+    )
@@ -0,0 +1,60 @@
+# FastAPI
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from fastapi.responses import StreamingResponse
+
+# Types
+from typing import Optional
+
+# Custom Modules
+from .. import schemas
+from ..core.config import settings
+from ..core.websocket.connection_manager import ws_manager
+from ..dependencies import get_websocket_user
+
+# FastAPI router object
+router = APIRouter(prefix="/events", tags=['events'])
+
+
+@router.get("/stream")
+async def stream_events(
+    topics: Optional[str] = None,
+    lastEventId: Optional[str] = None,
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID"),
+    current_user: schemas.User = Depends(get_websocket_user)
+):
+    """Server-Sent Events alternative to /ws, for clients that only receive.
+
+    Delivers the same events as /ws: the user's own events plus those of the
+    comma separated topics (eg. tweet:1,user:2). EventSource sends the
+    Last-Event-ID header when it reconnects, so missed events are replayed
+    the same way as /ws?lastEventId=.
+    """
+    if current_user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    topic_list = [topic for topic in (topics or "").split(",") if topic]
+    last_event_id = last_event_id_header or lastEventId
+
+    async def stream():
+        # Registered here rather than before the response starts, so a
+        # stream that never runs leaves nothing behind
+        connection = await ws_manager.connect_stream(current_user.id, topic_list, last_event_id)
+        try:
+            yield f"retry: {settings.SSE_RETRY_MS}\n\n"
+            async for chunk in connection.events():
+                yield chunk
+        finally:
+            await ws_manager.disconnect(connection)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # Stop nginx from buffering the stream
+            "X-Accel-Buffering": "no",
+        },
+    )
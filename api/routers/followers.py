@@ -1,5 +1,5 @@
 # FastAPI
-from fastapi import APIRouter, HTTPException, Request, Depends, status
+from fastapi import APIRouter, HTTPException, Request, Response, Depends, status
 
 # SQLAlchemy
 from sqlalchemy.orm import Session
@@ -12,20 +12,29 @@ from .. import schemas, crud
 from ..dependencies import get_db, get_current_user
 from ..core import security
 from ..core.config import settings
+from ..core.pagination import set_next_cursor, id_key
 
 # FastAPI router object
 router = APIRouter(prefix="/followers", tags=['followers'])
 
 
 @router.get("/{userId}", response_model=List[schemas.FollowersResponse])
-def get_all_tweets(userId: int, db: Session = Depends(get_db)):
+def get_all_tweets(
+        response: Response,
+        userId: int,
+        skip: int = 0,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        db: Session = Depends(get_db)):
     """
     The GET method for this endpoint requires a userId and will send 
     back information about all users the follow that user. 
 
     This endpoint will always return an array of objects. 
     """
-    followers: List[schemas.Follower] = crud.get_all_followers(db, userId)
+    followers: List[schemas.Follower] = crud.get_all_followers(
+        db, userId, skip=skip, limit=limit, cursor=cursor)
+    set_next_cursor(response, followers, limit, key=id_key)
     return [
         schemas.FollowersResponse(
             userId=follower.user.id,
@@ -1,20 +1,23 @@
 # FastAPI
-from fastapi import APIRouter, HTTPException, Request, Depends, status, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Request, Response, Depends, status, BackgroundTasks
 
 # SQLAlchemy
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 # Types
 from typing import List, Optional
 
 # Custom Modules
-from .. import schemas, crud
-from ..dependencies import get_db, get_current_user
+from .. import schemas, crud, async_crud
+from ..dependencies import get_db, get_async_db, get_current_user
 from ..background_functions.email_notifications import send_new_follower_notification_email
 from ..core import security
 from ..core.config import settings
+from ..core.pagination import set_next_cursor, id_key
 
 from ..core.websocket.connection_manager import ws_manager
+from ..core.websocket.topics import user_topic
 
 
 # FastAPI router object
@@ -22,7 +25,13 @@ router = APIRouter(prefix="/follows", tags=['follows'])
 
 
 @router.get("/{userId}", response_model=List[schemas.FollowsResponse])
-def get_follows(userId: int, db: Session = Depends(get_db)):
+def get_follows(
+        response: Response,
+        userId: int,
+        skip: int = 0,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        db: Session = Depends(get_db)):
     """
     The GET method for this endpoint requires a userId and will send 
     back information about all users the userId follows . 
@@ -40,7 +49,9 @@ def get_follows(userId: int, db: Session = Depends(get_db)):
         raise HTTPException(status.HTTP_404_NOT_FOUND,
                             detail="User does not exist")
 
-    follows = crud.get_all_users_following(db, userId)
+    follows = crud.get_all_users_following(
+        db, userId, skip=skip, limit=limit, cursor=cursor)
+    set_next_cursor(response, follows, limit, key=id_key)
     return [
         schemas.FollowsResponse(
             userId=following.follows_user.id,
@@ -68,7 +79,7 @@ def get_follows_count_for_user(
 async def create_follow_record_for_user(
     request_body: schemas.FollowsCreateRequestBody,
     bg_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: schemas.User = Depends(get_current_user)
 ):
     """
@@ -77,7 +88,7 @@ async def create_follow_record_for_user(
     current_user requests to follow a new user
 
     """
-    crud.create_follow_relationship(
+    await async_crud.create_follow_relationship(
         db, current_user.id, request_body.followUserId)
 
     #
@@ -93,11 +104,12 @@ async def create_follow_record_for_user(
 
     if not ws_manager.user_is_online(request_body.followUserId):
         # Send a notification email
-        new_follower = crud.get_user_by_id(db, request_body.followUserId)
+        new_follower = await async_crud.get_user_by_id(db, request_body.followUserId)
         bg_tasks.add_task(send_new_follower_notification_email,
                           new_follower, current_user)
 
-    await ws_manager.broadcast(message, current_user.id)
+    await ws_manager.publish_to_topics(
+        [user_topic(current_user.id), user_topic(request_body.followUserId)], message, current_user.id)
 
     return schemas.EmptyResponse()
 
@@ -105,10 +117,10 @@ async def create_follow_record_for_user(
 @router.delete('', response_model=schemas.EmptyResponse)
 async def delete_follow_relationship(
     request_body: schemas.FollowsDeleteRequestBody,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: schemas.User = Depends(get_current_user)
 ):
-    delete_successful = crud.delete_follow_relationship(
+    delete_successful = await async_crud.delete_follow_relationship(
         db, current_user.id, request_body.followUserId)
 
     #
@@ -121,6 +133,7 @@ async def delete_follow_relationship(
             followUserId=request_body.followUserId
         )
     )
-    await ws_manager.broadcast(message, current_user.id)
+    await ws_manager.publish_to_topics(
+        [user_topic(current_user.id), user_topic(request_body.followUserId)], message, current_user.id)
 
     return schemas.EmptyResponse()
@@ -1,7 +1,7 @@
 # FastAPI
 from fastapi import (
     APIRouter, HTTPException, status,
-    Request, Depends, BackgroundTasks,
+    Request, Response, Depends, BackgroundTasks,
     WebSocket, WebSocketDisconnect, Cookie, Query
 )
 from fastapi.responses import HTMLResponse
@@ -9,18 +9,20 @@ from fastapi.encoders import jsonable_encoder
 
 # SQLAlchemy
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 # Types
 from typing import List, Optional
 
 # Custom Modules
-from .. import schemas, crud, models
+from .. import schemas, crud, models, async_crud
 from ..background_functions.email_notifications import send_new_message_notification_email
-from ..dependencies import get_db, get_current_user
+from ..dependencies import get_db, get_async_db, get_current_user
 from ..core import security
 from ..core.config import settings
 from ..core.utilities import generate_random_uuid
 from ..core.websocket.connection_manager import ws_manager
+from ..core.pagination import set_next_cursor
 
 # Schema
 from ..schemas.websockets import WSMessage, WSMessageAction
@@ -29,43 +31,121 @@ from ..core.sendgrid.schema import EmailSender
 router = APIRouter(prefix="/messages", tags=['messages'])
 
 
-@router.get("/conversations")
-# respone_model=schemas.MessageResponse
-def messages(
+def to_message_schema(message: models.Messages) -> schemas.Message:
+    return schemas.Message(
+        id=message.id,
+        userFromId=message.user_from_id,
+        userFromUsername=message.user_from.username,
+        userToId=message.user_to_id,
+        userToUsername=message.user_to.username,
+        content=message.content,
+        createdAt=message.created_at
+    )
+
+
+async def send_unread_count(db: AsyncSession, user_id: int) -> int:
+    """Push user_id's unread message count to their websocket connections
+    """
+    unread_count = await async_crud.get_unread_message_count(db, user_id)
+    await ws_manager.send_personal_message(WSMessage[schemas.UnreadMessageCount](
+        action=WSMessageAction.ChatMessagesUnread,
+        body=schemas.UnreadMessageCount(unreadCount=unread_count)
+    ), user_id)
+    return unread_count
+
+
+@router.get("/unread", response_model=schemas.UnreadMessageCount)
+def unread_count(
     db: Session = Depends(get_db),
     current_user: schemas.User = Depends(get_current_user)
 ):
+    """Badge count: read from users.unread_message_count, not counted from messages
+    """
+    return schemas.UnreadMessageCount(unreadCount=crud.get_unread_message_count(db, current_user.id))
+
+
+@router.post("/read", response_model=schemas.MessagesReadResponseBody)
+async def mark_read(
+    request_body: schemas.MessagesReadRequestBody,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.User = Depends(get_current_user)
+):
+    """Mark the messages received from userId, up to upToMessageId, as read
+    """
+    marked_read = await async_crud.mark_conversation_read(
+        db, current_user.id, request_body.userId, request_body.upToMessageId)
+    if marked_read:
+        # The user's other tabs and devices update their badge too
+        unread_count = await send_unread_count(db, current_user.id)
+    else:
+        unread_count = await async_crud.get_unread_message_count(db, current_user.id)
+    return schemas.MessagesReadResponseBody(markedRead=marked_read, unreadCount=unread_count)
 
-    return crud.get_messages_for_user(db, current_user.id)
+
+@router.get("/conversations", response_model=List[schemas.ConversationSummary])
+def conversations(
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(get_current_user)
+):
+    """One entry per conversation (last message and unread count), most recent first.
+    Use GET /messages/conversation/{otherUserId} for the messages themselves.
+    """
+    summaries = []
+    for message, unread_count in crud.get_conversations_for_user(db, current_user.id):
+        other_user = message.user_to if message.user_from_id == current_user.id else message.user_from
+        summaries.append(schemas.ConversationSummary(
+            userId=other_user.id,
+            username=other_user.username,
+            lastMessage=to_message_schema(message),
+            unreadCount=unread_count
+        ))
+    return summaries
+
+
+@router.get("/conversation/{otherUserId}", response_model=List[schemas.Message])
+def conversation_messages(
+    otherUserId: int,
+    response: Response,
+    before: Optional[str] = None,
+    limit: int = 50,
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(get_current_user)
+):
+    """A page of the conversation with otherUserId, newest first. Pass the
+    X-Next-Cursor header as before to get the page of older messages.
+    """
+    limit = max(1, min(limit, 100))
+    messages = crud.get_conversation_messages(
+        db, current_user.id, otherUserId, limit=limit, cursor=before)
+    set_next_cursor(response, messages, limit)
+    return [to_message_schema(message) for message in messages]
 
 
 @router.get("")
 # respone_model=schemas.MessageResponse
 def messages(
+    response: Response,
+    skip: int = 0,
+    limit: int = 10000,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: schemas.User = Depends(get_current_user)
 ):
 
-    messages = crud.get_messages_for_user(db, current_user.id)
-    return [schemas.Message(
-        id=message.id,
-        userFromId=message.user_from_id,
-        userFromUsername=message.user_from.username,
-        userToId=message.user_to_id,
-        userToUsername=message.user_to.username,
-        content=message.content,
-        createdAt=message.created_at
-    ) for message in messages]
+    messages = crud.get_messages_for_user(
+        db, current_user.id, skip=skip, limit=limit, cursor=cursor)
+    set_next_cursor(response, messages, limit)
+    return [to_message_schema(message) for message in messages]
 
 
 @router.post("", response_model=schemas.Message)
 async def create_message(
     request_body: schemas.MessageCreateRequestBody,
     bg_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: schemas.User = Depends(get_current_user)
 ):
-    newMessage = crud.create_message(db, current_user.id, request_body)
+    newMessage = await async_crud.create_message(db, current_user.id, request_body)
     return_value = schemas.Message(
         id=newMessage.id,
         userFromId=newMessage.user_from_id,
@@ -75,16 +155,18 @@ async def create_message(
         content=newMessage.content,
         createdAt=newMessage.created_at
     )
-    other_user = crud.get_user_by_id(db, newMessage.user_to_id)
-    # Send a websocket message to the user who this message is sent to
+    other_user = await async_crud.get_user_by_id(db, newMessage.user_to_id)
+    # Send a websocket message to the user who this message is sent to, and
+    # to the connections subscribed to the conversation (the sender's other tabs)
     # If that user is not online, they will not receive the websocket message.
     wsMessage = WSMessage[schemas.Message](
         action=WSMessageAction.ChatMessageNew,
         body=return_value
     )
+    await ws_manager.send_to_conversation(current_user.id, request_body.userToId, wsMessage)
     if ws_manager.user_is_online(request_body.userToId):
         print('user is online')
-        await ws_manager.send_personal_message(wsMessage, request_body.userToId)
+        await send_unread_count(db, request_body.userToId)
     else:
         print("sending a notification email")
         # Send an email notification to the user.
@@ -100,12 +182,12 @@ async def create_message(
 @router.delete("/", response_model=schemas.EmptyResponse)
 async def delete_message(
     request_body: schemas.MessageDeleteRequestBody,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: schemas.User = Depends(get_current_user)
 ):
-    message: models.Messages = crud.get_message_by_id(
+    message: models.Messages = await async_crud.get_message_by_id(
         db, request_body.messageId)
-    result = crud.delete_message(db, current_user.id, request_body)
+    result = await async_crud.delete_message(db, current_user.id, request_body)
 
     # Send a websocket message to the user who this message is sent to
     # If that user is not online, they will not receive the websocket message.
@@ -117,7 +199,8 @@ async def delete_message(
         )
     )
 
-    if ws_manager.user_is_online(message.user_from_id):
-        await ws_manager.send_personal_message(wsMessage, message.user_to_id)
+    await ws_manager.send_to_conversation(message.user_from_id, message.user_to_id, wsMessage)
+    if not message.is_read and ws_manager.user_is_online(message.user_to_id):
+        await send_unread_count(db, message.user_to_id)
 
     return result
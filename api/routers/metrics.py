@@ -0,0 +1,49 @@
+# FastAPI
+from fastapi import APIRouter, Depends, HTTPException, status
+
+# Types
+from typing import Dict
+
+# Custom Modules
+from ..core.config import settings
+from ..core.principal_cache import principal_cache
+from ..core.db_pool import get_pool_stats
+from ..core.websocket.connection_manager import ws_manager
+from ..database import engine, async_engine
+
+
+
+def metrics_enabled():
+    """The metrics endpoints do not exist unless METRICS_ENABLED is set
+    """
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+
+
+# FastAPI router object
+router = APIRouter(prefix="/metrics", tags=['metrics'],
+                   dependencies=[Depends(metrics_enabled)])
+
+
+@router.get("/auth-cache", response_model=Dict[str, int])
+def get_auth_cache_metrics():
+    """Hit/miss counters of this worker's authenticated user cache
+    """
+    return principal_cache.stats()
+
+
+@router.get("/db-pool", response_model=Dict[str, Dict[str, float]])
+def get_db_pool_metrics():
+    """Checkout and wait statistics of this worker's connection pools
+    """
+    return {
+        "sync": get_pool_stats(engine) if engine else {},
+        "async": get_pool_stats(async_engine) if async_engine else {},
+    }
+
+
+@router.get("/websockets", response_model=Dict[str, int])
+def get_websocket_metrics():
+    """Connections and outbound queue depth on this worker
+    """
+    return ws_manager.stats()
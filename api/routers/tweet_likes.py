@@ -1,19 +1,21 @@
 # FastAPI
-from fastapi import APIRouter, HTTPException, Request, Depends, status
+from fastapi import APIRouter, HTTPException, Request, Response, Depends, status
 
 # SQLAlchemy
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 # Types
 from typing import List, Optional
 
 # Custom Modules
-from .. import schemas, crud
-from ..dependencies import get_db, get_current_user
+from .. import schemas, async_crud
+from ..dependencies import get_async_db, get_current_user
 from ..core import security
 from ..core.config import settings
+from ..core.pagination import set_next_cursor, id_key
 
 from ..core.websocket.connection_manager import ws_manager
+from ..core.websocket.topics import tweet_topic
 from ..schemas.websockets import WSMessage, WSMessageAction
 
 # FastAPI router object
@@ -21,7 +23,13 @@ router = APIRouter(prefix="/tweet-likes", tags=['tweet-likes'])
 
 
 @router.get("", response_model=List[schemas.TweetLikeResponseBody])
-async def get_all_tweet_likes(tweetId: Optional[int] = None, db: Session = Depends(get_db)):
+async def get_all_tweet_likes(
+        response: Response,
+        tweetId: Optional[int] = None,
+        skip: int = 0,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        db: AsyncSession = Depends(get_async_db)):
     """
     The GET method for this endpoint will send back either all, or specific likes based on tweet. This endpoint will always return an array of objects.
 
@@ -33,10 +41,16 @@ async def get_all_tweet_likes(tweetId: Optional[int] = None, db: Session = Depen
     """
     tweet_likes = []
     if tweetId:
-        tweet_likes = crud.get_all_tweet_likes_for_tweet(db, tweetId)
+        tweet_likes = await async_crud.get_all_tweet_likes_for_tweet(
+            db, tweetId, skip=skip, limit=limit, cursor=cursor)
+
+    elif limit:
+        tweet_likes = await async_crud.get_all_tweet_likes(
+            db, skip=skip, limit=limit, cursor=cursor)
 
     else:
-        tweet_likes = crud.get_all_tweet_likes(db)
+        tweet_likes = await async_crud.get_all_tweet_likes(db, skip=skip, cursor=cursor)
+    set_next_cursor(response, tweet_likes, limit, key=id_key)
 
     return [
         schemas.TweetLikeResponseBody(
@@ -50,11 +64,11 @@ async def get_all_tweet_likes(tweetId: Optional[int] = None, db: Session = Depen
 @router.post("", response_model=schemas.EmptyResponse)
 async def like_a_tweet(
     tweet_body: schemas.TweetLikeCreateRequestBody,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: schemas.User = Depends(get_current_user)
 ):
     # validate & create the like record
-    tweet_like = crud.create_tweet_like_for_tweet(
+    tweet_like = await async_crud.create_tweet_like_for_tweet(
         db=db, tweet_id=tweet_body.tweetId, user_id=current_user.id)
 
     message = WSMessage[schemas.WSTweetLikeUpdated](
@@ -69,7 +83,8 @@ async def like_a_tweet(
         )
     )
 
-    await ws_manager.broadcast(message, current_user.id)
+    await ws_manager.publish_to_topics(
+        [tweet_topic(tweet_like.tweet_id)], message, current_user.id)
 
     return schemas.EmptyResponse()
 
@@ -77,13 +92,13 @@ async def like_a_tweet(
 @router.delete("", response_model=schemas.EmptyResponse)
 async def delete_tweet_like(
         request_body: schemas.TweetLikeDeleteRequestBody,
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_async_db),
         current_user: schemas.User = Depends(get_current_user)):
 
-    tweet_like = crud.get_tweet_like_by_tweet_id_and_user_id(
+    tweet_like = await async_crud.get_tweet_like_by_tweet_id_and_user_id(
         db, current_user.id, request_body.tweetId)
 
-    crud.delete_tweet_like(
+    await async_crud.delete_tweet_like(
         db, current_user.id, request_body.tweetId)
 
     message = WSMessage[schemas.WSTweetLikeUpdated](
@@ -98,6 +113,7 @@ async def delete_tweet_like(
         )
     )
 
-    await ws_manager.broadcast(message, current_user.id)
+    await ws_manager.publish_to_topics(
+        [tweet_topic(tweet_like.tweet_id)], message, current_user.id)
 
     return schemas.EmptyResponse()
@@ -1,5 +1,5 @@
 # FastAPI
-from fastapi import APIRouter, HTTPException, Request, Depends, status
+from fastapi import APIRouter, HTTPException, Request, Response, Depends, status
 
 # SQLAlchemy
 from sqlalchemy.orm import Session
@@ -9,48 +9,98 @@ from typing import List, Optional
 
 # Custom Modules
 from .. import schemas, crud
-from ..dependencies import get_db, get_current_user
+from ..dependencies import get_db, get_current_user, get_optional_current_user
 from ..core import security
 from ..core.config import settings
+from ..core.pagination import set_next_cursor, id_key
 
 # FastAPI router object
 router = APIRouter(prefix="/tweets", tags=['tweets'])
 
 
 @router.get("", response_model=List[schemas.TweetResponse])
-def get_all_tweets(userId: Optional[int] = None, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    """The GET method for this endpoint will send back all tweets     
+def get_all_tweets(
+        response: Response,
+        userId: Optional[int] = None,
+        skip: int = 0,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        db: Session = Depends(get_db),
+        current_user: Optional[schemas.User] = Depends(get_optional_current_user)):
+    """The GET method for this endpoint will send back all tweets, with their
+    like and comment counts (and likedByMe when authenticated)
+
+    Pass the X-Next-Cursor response header back as cursor to get the next page.
     """
+    viewer_id = current_user.id if current_user else None
     if userId:
         user = crud.get_user_by_id(db, userId)
         if not user:
             raise HTTPException(status.HTTP_400_BAD_REQUEST,
                                 detail="Error.Bad userId. User does not exist.")
-        tweets = crud.get_tweets_for_user(db, userId, skip=skip, limit=limit)
+        tweets = crud.get_tweets_for_user(
+            db, userId, skip=skip, limit=limit, cursor=cursor, viewer_id=viewer_id)
     else:
-        tweets = crud.get_tweets(db, skip=skip, limit=limit)
+        tweets = crud.get_tweets(
+            db, skip=skip, limit=limit, cursor=cursor, viewer_id=viewer_id)
+    set_next_cursor(response, tweets, limit)
+    return [
+        schemas.TweetResponse(
+            tweetId=tweet.id,
+            content=tweet.content,
+            createdAt=tweet.created_at,
+            userId=tweet.user.id,
+            username=tweet.user.username,
+            likeCount=tweet.like_count,
+            commentCount=tweet.comment_count,
+            likedByMe=tweet.liked_by_me
+        ) for tweet in tweets
+    ]
+
+
+@router.get("/home", response_model=List[schemas.TweetResponse])
+def get_home_timeline(
+        response: Response,
+        skip: int = 0,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        db: Session = Depends(get_db),
+        current_user: schemas.User = Depends(get_current_user)):
+    """Return the newest tweets from every user the authenticated user follows
+    """
+    tweets = crud.get_home_timeline(
+        db, current_user.id, skip=skip, limit=limit, cursor=cursor)
+    set_next_cursor(response, tweets, limit)
+
     return [
         schemas.TweetResponse(
             tweetId=tweet.id,
             content=tweet.content,
             createdAt=tweet.created_at,
             userId=tweet.user.id,
-            username=tweet.user.username
+            username=tweet.user.username,
+            likeCount=tweet.like_count,
+            commentCount=tweet.comment_count,
+            likedByMe=tweet.liked_by_me
         ) for tweet in tweets
     ]
 
 
 @router.get("/liked", response_model=List[schemas.TweetResponse])
 def get_all_tweets_liked_by_user(
+        response: Response,
         skip: int = 0,
         limit: int = 100,
+        cursor: Optional[str] = None,
         db: Session = Depends(get_db),
         current_user: schemas.User = Depends(get_current_user)):
     """Return all tweets liked by the authenticated user
     """
 
-    tweets = crud.get_tweets_liked_by_user(
-        db, current_user.id, skip=skip, limit=limit)
+    likes = crud.get_tweet_likes_by_user(
+        db, current_user.id, skip=skip, limit=limit, cursor=cursor)
+    set_next_cursor(response, likes, limit, key=id_key)
+    tweets = [like.tweet for like in likes]
 
     return [
         schemas.TweetResponse(
@@ -58,7 +108,10 @@ def get_all_tweets_liked_by_user(
             content=tweet.content,
             createdAt=tweet.created_at,
             userId=tweet.user.id,
-            username=tweet.user.username
+            username=tweet.user.username,
+            likeCount=tweet.like_count,
+            commentCount=tweet.comment_count,
+            likedByMe=True
         ) for tweet in tweets
     ]
 
@@ -78,7 +131,9 @@ def get_single_tweet_by_id(
         content=tweet.content,
         createdAt=tweet.created_at,
         userId=tweet.user.id,
-        username=tweet.user.username
+        username=tweet.user.username,
+        likeCount=tweet.like_count,
+        commentCount=tweet.comment_count
     )
 
 
@@ -93,7 +148,9 @@ def create_tweet_for_user(tweet_body: schemas.TweetCreate,
         content=tweet.content,
         createdAt=tweet.created_at,
         userId=tweet.user.id,
-        username=tweet.user.username
+        username=tweet.user.username,
+        likeCount=tweet.like_count,
+        commentCount=tweet.comment_count
     )
 
 
@@ -1,21 +1,23 @@
 # FastAPI
-from fastapi import APIRouter, HTTPException, status, Request, Depends, BackgroundTasks
+from fastapi import APIRouter, HTTPException, status, Request, Response, Depends, BackgroundTasks
 
 # SQLAlchemy
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 # Types
 from typing import List, Optional
 
 # Custom Modules
-from .. import schemas, crud
+from .. import schemas, crud, async_crud
 from ..background_functions.email_notifications import send_registration_confirmation_email
-from ..dependencies import get_db, get_current_user
+from ..dependencies import get_db, get_async_db, get_current_user
 
 # Core Modules
 from ..core import security
 from ..core.config import settings
 from ..core.utilities import generate_random_uuid
+from ..core.pagination import set_next_cursor, id_key
 
 # Standard Library
 import os
@@ -24,13 +26,20 @@ router = APIRouter(prefix="/users", tags=['users'])
 
 
 @router.get("", response_model=List[schemas.UserResponse])
-def get_one_or_all_users(userId: Optional[int] = None, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def get_one_or_all_users(
+        response: Response,
+        userId: Optional[int] = None,
+        skip: int = 0,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        db: Session = Depends(get_db)):
     """Return either all users, or a single user with id == userId. Always returns a list.
     """
     if userId:
         users = [crud.get_user_by_id(db, userId)]
     else:
-        users = crud.get_users(db, skip=skip, limit=limit)
+        users = crud.get_users(db, skip=skip, limit=limit, cursor=cursor)
+        set_next_cursor(response, users, limit, key=id_key)
 
     # TODO perhaps there is a better way of returning this model.
     # It seems like its trying to immidate graphql
@@ -45,11 +54,18 @@ def get_one_or_all_users(userId: Optional[int] = None, skip: int = 0, limit: int
 
 
 @router.get("/search/{usernameFragment}", response_model=List[schemas.UserResponse])
-def get_one_or_all_users(usernameFragment: str = None, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def get_one_or_all_users(
+        response: Response,
+        usernameFragment: str = None,
+        skip: int = 0,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        db: Session = Depends(get_db)):
     """Search for a user based on username.
     """
     users = crud.search_user_by_username_fragment(
-        db, usernameFragment, skip, limit)
+        db, usernameFragment, skip, limit, cursor=cursor)
+    set_next_cursor(response, users, limit, key=id_key)
 
     # TODO perhaps there is a better way of returning this model.
     # It seems like its trying to immidate graphql
@@ -71,21 +87,22 @@ def get_authenticated_user(db: Session = Depends(get_db), current_user: schemas.
 
 
 @router.post("", response_model=schemas.User)
-async def create_user(user: schemas.UserCreate, bg_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+async def create_user(user: schemas.UserCreate, bg_tasks: BackgroundTasks, db: AsyncSession = Depends(get_async_db)):
     """Create a new user record in the database and send a registration confirmation email
     """
-    db_user = crud.get_user_by_email(db, email=user.email)
+    db_user = await async_crud.get_user_by_email(db, email=user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     #
     # Generate a random uuid to email to the user
     #
     confirmation_key = generate_random_uuid()
+    hashed_password = await security.get_password_hash_async(user.password)
     #
     # Create the new user
     #
-    newUser: schemas.User = crud.create_user(
-        db=db, user=user, confirmation_key=confirmation_key)
+    newUser: schemas.User = await async_crud.create_user(
+        db=db, user=user, hashed_password=hashed_password, confirmation_key=confirmation_key)
     bg_tasks.add_task(
         send_registration_confirmation_email,
         username=newUser.username,
@@ -102,7 +119,7 @@ def update_user(request_body: schemas.UserUpdateRequestBody,
     """Update an authenticated user's username and/or bio.
     """
     # Check that password is correct
-    if not security.verify_password(request_body.password, current_user.hashed_password):
+    if not security.verify_password_bounded(request_body.password, current_user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Wrong password")
 
@@ -124,7 +141,7 @@ def update_user(request_body: schemas.UserUpdateRequestBody,
 def delete_user(request_body: schemas.UserDeleteRequestBody,
                 db: Session = Depends(get_db),
                 current_user: schemas.UserWithPassword = Depends(get_current_user)):
-    if not security.verify_password(request_body.password, current_user.hashed_password):
+    if not security.verify_password_bounded(request_body.password, current_user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Wrong password")
     delete_successful = crud.delete_user(db, current_user.id)
@@ -133,8 +150,8 @@ def delete_user(request_body: schemas.UserDeleteRequestBody,
 
 
 @router.post('/confirm-account/', response_model=schemas.EmptyResponse)
-async def confirm_account(request_body: schemas.UserAccountConfirmationRequestBody, db: Session = Depends(get_db)):
-    user: schemas.User = crud.get_user_by_confirmation_key(
+async def confirm_account(request_body: schemas.UserAccountConfirmationRequestBody, db: AsyncSession = Depends(get_async_db)):
+    user: schemas.User = await async_crud.get_user_by_confirmation_key(
         db, request_body.confirmationKey)
 
     if not user:
@@ -143,6 +160,6 @@ async def confirm_account(request_body: schemas.UserAccountConfirmationRequestBo
 
     # correct confirmation key was passed
 
-    crud.verify_account(db, user.id)
+    await async_crud.verify_account(db, user.id)
 
     return schemas.EmptyResponse()
@@ -22,6 +22,13 @@ class ChatUserTypingRequestBody(BaseModel):
 
 class ChatUserTypingResponseBody(BaseModel):
     isTyping: bool
+    userId: Optional[int]  # user who is typing
+
+
+class ChatUsersPresenceBody(BaseModel):
+    # Users that came online / went offline since the last update
+    online: List[int]
+    offline: List[int]
 
 
 class NewChatMessageResponseBody(Message):
@@ -2,8 +2,8 @@
 from datetime import datetime, date
 
 # Types
-from typing import List, Optional, Any
-from pydantic import BaseModel, validator
+from typing import List, Optional, Any, Dict
+from pydantic import BaseModel, validator, conlist
 
 
 class CountBase(BaseModel):
@@ -14,3 +14,31 @@ class TweetCommentCount(CountBase):
     """The number of comments for a given tweet
     """
     pass
+
+
+class BatchCountsRequestBody(BaseModel):
+    tweetIds: conlist(int, max_items=500) = []
+    commentIds: conlist(int, max_items=500) = []
+    userIds: conlist(int, max_items=500) = []
+
+
+class TweetCounts(BaseModel):
+    likeCount: int
+    commentCount: int
+
+
+class CommentCounts(BaseModel):
+    likeCount: int
+
+
+class UserCounts(BaseModel):
+    followerCount: int
+    followingCount: int
+
+
+class BatchCountsResponse(BaseModel):
+    """Counts keyed by id. Ids that do not exist are left out.
+    """
+    tweets: Dict[int, TweetCounts]
+    comments: Dict[int, CommentCounts]
+    users: Dict[int, UserCounts]
@@ -22,11 +22,36 @@ class MessageResponse(BaseModel):
     conversations: List[Conversation]
 
 
+class ConversationSummary(BaseModel):
+    """One conversation of the current user: the other user, the last
+    message either of them sent, and how many messages they sent that are unread
+    """
+    userId: int
+    username: str
+    lastMessage: Message
+    unreadCount: int
+
+
 class MessageCreateRequestBody(BaseModel):
     content: str
     userToId: int
 
 
+class MessagesReadRequestBody(BaseModel):
+    userId: int  # other user
+    upToMessageId: int
+
+
+class MessagesReadResponseBody(BaseModel):
+    markedRead: int
+    unreadCount: int
+
+
+class UnreadMessageCount(BaseModel):
+    # Also sent over the websocket (chat.messages.unread) when it changes
+    unreadCount: int
+
+
 class MessageDeleteRequestBody(BaseModel):
     messageId: int
 
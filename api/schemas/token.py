@@ -13,3 +13,4 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     email: Optional[str] = None
+    userId: Optional[int] = None
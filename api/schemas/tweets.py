@@ -30,4 +30,8 @@ class TweetResponse(BaseModel):
     userId: int
     username: str
     content: str
-    createdAt: datetime
\ No newline at end of file
+    createdAt: datetime
+    likeCount: Optional[int]
+    commentCount: Optional[int]
+    # Only sent by endpoints that know who is asking
+    likedByMe: Optional[bool]
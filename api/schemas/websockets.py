@@ -9,8 +9,10 @@ from pydantic.generics import GenericModel
 class WSMessageAction(str, Enum):
     ChatMessageNew = "chat.message.new"
     ChatMessageDeleted = "chat.message.deleted"
+    ChatMessagesUnread = "chat.messages.unread"
     ChatUserOnline = "chat.user.online"
     ChatUserTyping = "chat.user.typing"
+    ChatUsersPresence = "chat.users.presence"
     AuthRequired = "auth.required"
     NewFollower = "followers.followed"
     LostFollower = "followers.unfollowed"
@@ -19,6 +21,11 @@ class WSMessageAction(str, Enum):
     UpdatedComment = "comments.updated"
     UpdatedCommentLike = "comments.likes.changed"
     UpdatedTweetLike = "tweets.likes.changed"
+    TopicsSubscribe = "topics.subscribe"
+    TopicsUnsubscribe = "topics.unsubscribe"
+    # Sent on connect when the events after lastEventId cannot be replayed:
+    # the client must reload its state through the REST api
+    EventsResync = "events.resync"
 
 
 WSMessageBody = TypeVar("WSBody")
@@ -28,6 +35,30 @@ class WSMessageError(BaseModel):
     code: int
     message: str
 
+
+class EventsResyncReason(str, Enum):
+    # lastEventId was issued by another worker (or by this one before it restarted)
+    OtherWorker = "other_worker"
+    # Some of the missed events are no longer kept (too many, or the
+    # client was away longer than WS_RESUME_WINDOW_SECONDS)
+    EventsExpired = "events_expired"
+    InvalidEventId = "invalid_event_id"
+
+
+class EventsResyncBody(BaseModel):
+    reason: EventsResyncReason
+    lastEventId: str
+    # Worker this connection landed on (the first part of every eventId)
+    workerId: str
+
+
+class WSTopicsRequestBody(BaseModel):
+    topics: List[str]
+
+
+class WSTopicsResponseBody(BaseModel):
+    topics: List[str]
+
 # WSAction =
 
 
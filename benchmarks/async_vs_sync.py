@@ -0,0 +1,146 @@
+"""The same request (GET /tweet-likes/?tweetId=) from 500 concurrent
+connections, run three ways on one event loop:
+
+- blocking: sync crud called from an async route (what like_a_tweet and the
+  /ws loop used to do). Every query blocks the event loop.
+- threadpool: sync crud from a sync route, in Starlette's threadpool.
+- async: async_crud on an AsyncSession (asyncpg).
+
+Both engines use the app's pool settings (DB_POOL_SIZE + DB_MAX_OVERFLOW
+connections). A probe task records how late it wakes up from 10 ms sleeps,
+which is how long every other request and WebSocket on the worker waits.
+Blocking requests look fast on their own because the time spent waiting for
+the event loop is not part of them: compare when the connections finished.
+
+    BENCH_DATABASE_URL=postgresql://postgres@localhost/twitter_bench python -m benchmarks.async_vs_sync
+"""
+# Standard Library
+import asyncio
+import re
+import statistics
+import time
+
+# SQLAlchemy
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+# Starlette
+from starlette.concurrency import run_in_threadpool
+
+# Custom Modules
+from api import async_crud, crud, models
+from api.core.config import settings
+from api.database import pool_options
+from benchmarks.common import BENCH_DATABASE_URL, bench_engine, bench_sessionmaker, create_users, print_table, summary_ms
+
+CONNECTIONS = 500
+REQUESTS_PER_CONNECTION = 10
+LIKES = 20
+PROBE_INTERVAL_MS = 10
+
+
+async def probe(lags: list, stop: asyncio.Event):
+    interval = PROBE_INTERVAL_MS / 1000
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+
+
+def get_likes(SessionLocal, tweet_id: int):
+    db = SessionLocal()
+    try:
+        return crud.get_all_tweet_likes_for_tweet(db, tweet_id)
+    finally:
+        db.close()
+
+
+async def run(mode: str, request):
+    lags = []
+    latencies = []
+    finished = []
+    errors = 0
+    stop = asyncio.Event()
+    probe_task = asyncio.ensure_future(probe(lags, stop))
+
+    async def connection():
+        nonlocal errors
+        for _ in range(REQUESTS_PER_CONNECTION):
+            started = time.perf_counter()
+            try:
+                await request()
+            except Exception as e:
+                # Pool timeouts
+                print(mode, "request failed:", repr(e))
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+        finished.append(time.perf_counter() - run_started)
+
+    run_started = time.perf_counter()
+    await asyncio.gather(*(connection() for _ in range(CONNECTIONS)))
+    elapsed = time.perf_counter() - run_started
+    stop.set()
+    await probe_task
+
+    return [
+        mode,
+        f"{elapsed:.2f}",
+        f"{len(latencies) / elapsed:.0f}",
+        errors,
+        summary_ms(latencies),
+        f"{statistics.median(finished):.2f} / {max(finished):.2f}",
+        summary_ms(lags),
+    ]
+
+
+async def main():
+    engine = bench_engine(**pool_options)
+    SessionLocal = bench_sessionmaker(engine)
+    async_engine = create_async_engine(re.sub(
+        r"^postgres(ql)?(\+\w+)?://", "postgresql+asyncpg://", BENCH_DATABASE_URL), **pool_options)
+    AsyncSessionLocal = sessionmaker(
+        autocommit=False, autoflush=False, expire_on_commit=False,
+        bind=async_engine, class_=AsyncSession)
+
+    db = SessionLocal()
+    users = create_users(db, LIKES, "user")
+    tweet = models.Tweet(content="tweet", user_id=users[0])
+    db.add(tweet)
+    db.commit()
+    tweet_id = tweet.id
+    db.execute(insert(models.TweetLikes).values(
+        [dict(user_id=user_id, tweet_id=tweet_id) for user_id in users]))
+    db.commit()
+    db.close()
+
+    async def blocking():
+        get_likes(SessionLocal, tweet_id)
+
+    async def threadpool():
+        await run_in_threadpool(get_likes, SessionLocal, tweet_id)
+
+    async def async_session():
+        async with AsyncSessionLocal() as db:
+            await async_crud.get_all_tweet_likes_for_tweet(db, tweet_id)
+
+    # Open the pool connections before timing
+    await threadpool()
+    await async_session()
+
+    rows = [
+        await run("blocking", blocking),
+        await run("threadpool", threadpool),
+        await run("async", async_session),
+    ]
+    print(f"{CONNECTIONS} concurrent connections x {REQUESTS_PER_CONNECTION} requests, "
+          f"{LIKES} likes per response, pools of {settings.DB_POOL_SIZE} + {settings.DB_MAX_OVERFLOW}")
+    print_table(["mode", "total s", "requests/s", "errors", "request ms p50/p95/max",
+                 "connection done s p50/max", "loop lag ms p50/p95/max"], rows)
+    await async_engine.dispose()
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,117 @@
+"""Broadcast latency to 5000 simulated WebSockets, SLOW_SOCKETS of which take
+SLOW_SEND_MS to accept every message.
+
+- sequential: each socket's send is awaited in turn (how broadcast worked
+  before connections had their own queue and writer task).
+- queued: ConnectionManager.broadcast, which only enqueues.
+
+"caller" is how long the broadcast call itself took (what the HTTP request
+that triggered it waits for). Delivery latency is from the start of the
+broadcast until a socket received the message.
+
+    python -m benchmarks.broadcast_latency
+"""
+# Standard Library
+import asyncio
+import time
+
+# orjson
+import orjson
+
+# Custom Modules
+from api.core.websocket.broker import InMemoryBroker
+from api.core.websocket.connection_manager import ConnectionManager
+from api.core.websocket.frame import Frame
+from benchmarks.common import print_table, summary_ms
+
+SOCKETS = 5000
+SLOW_SOCKETS = 50
+SLOW_SEND_MS = 50
+MESSAGES = 5
+MESSAGE_INTERVAL_MS = 100
+
+
+class FakeWebSocket:
+    """Records when each message arrived
+    """
+
+    def __init__(self, delay: float, received: list):
+        self.delay = delay
+        self.received = received
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        await asyncio.sleep(self.delay)
+        self.received.append((orjson.loads(text)["n"], time.perf_counter()))
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+def make_sockets():
+    fast_received, slow_received = [], []
+    sockets = [FakeWebSocket(SLOW_SEND_MS / 1000, slow_received) if i < SLOW_SOCKETS
+               else FakeWebSocket(0, fast_received) for i in range(SOCKETS)]
+    return sockets, fast_received, slow_received
+
+
+async def wait_for(received: list, count: int):
+    while len(received) < count:
+        await asyncio.sleep(0.01)
+
+
+def latencies(received: list, sent_at: dict) -> list:
+    return [at - sent_at[n] for n, at in received]
+
+
+async def run_sequential():
+    sockets, fast_received, slow_received = make_sockets()
+    sent_at = {}
+    caller = []
+    for n in range(MESSAGES):
+        sent_at[n] = started = time.perf_counter()
+        text = Frame.encode({"n": n}).text
+        for websocket in sockets:
+            await websocket.send_text(text)
+        caller.append(time.perf_counter() - started)
+        await asyncio.sleep(MESSAGE_INTERVAL_MS / 1000)
+    return ["sequential", summary_ms(caller),
+            summary_ms(latencies(fast_received, sent_at)),
+            summary_ms(latencies(slow_received, sent_at))]
+
+
+async def run_queued():
+    sockets, fast_received, slow_received = make_sockets()
+    manager = ConnectionManager(InMemoryBroker())
+    # User 0 sends, so it is not a recipient
+    for user_id, websocket in enumerate(sockets, start=1):
+        await manager.connect(websocket, user_id)
+    sent_at = {}
+    caller = []
+    for n in range(MESSAGES):
+        sent_at[n] = started = time.perf_counter()
+        await manager.broadcast({"n": n}, 0)
+        caller.append(time.perf_counter() - started)
+        await asyncio.sleep(MESSAGE_INTERVAL_MS / 1000)
+    await wait_for(fast_received, (SOCKETS - SLOW_SOCKETS) * MESSAGES)
+    await wait_for(slow_received, SLOW_SOCKETS * MESSAGES)
+    for user_connections in list(manager.active_connections.values()):
+        for connection in list(user_connections.values()):
+            await manager.disconnect(connection)
+    return ["queued", summary_ms(caller),
+            summary_ms(latencies(fast_received, sent_at)),
+            summary_ms(latencies(slow_received, sent_at))]
+
+
+async def main():
+    rows = [await run_sequential(), await run_queued()]
+    print(f"{SOCKETS} sockets ({SLOW_SOCKETS} taking {SLOW_SEND_MS} ms per message), "
+          f"{MESSAGES} broadcasts {MESSAGE_INTERVAL_MS} ms apart")
+    print_table(["mode", "caller ms p50/p95/max", "fast socket ms p50/p95/max",
+                 "slow socket ms p50/p95/max"], rows)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,76 @@
+# Standard Library
+import os
+import statistics
+import sys
+
+# Types
+from typing import List, Sequence
+
+# SQLAlchemy
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+# Custom Modules
+from api import models
+from api.database import Base
+
+#
+# The database benchmarks need a Postgres database of their own. It is dropped
+# and recreated on every run:
+#
+#   BENCH_DATABASE_URL=postgresql://postgres@localhost/twitter_bench python -m benchmarks.fanout_thresholds
+#
+BENCH_DATABASE_URL = os.environ.get("BENCH_DATABASE_URL")
+
+
+def bench_engine(**options):
+    """An engine on an empty BENCH_DATABASE_URL database
+    """
+    if not BENCH_DATABASE_URL:
+        sys.exit("BENCH_DATABASE_URL is not set")
+    engine = create_engine(BENCH_DATABASE_URL, **options)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    return engine
+
+
+def bench_sessionmaker(engine):
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def create_users(db, count: int, prefix: str = "user") -> List[int]:
+    """Insert count users in one statement and return their ids
+    """
+    rows = [dict(
+        username=f"{prefix}{i}",
+        email=f"{prefix}{i}@example.com",
+        hashed_password="x",
+        bio="",
+        account_verified=True,
+    ) for i in range(count)]
+    ids = db.execute(insert(models.User).values(rows).returning(
+        models.User.id)).scalars().all()
+    db.commit()
+    return ids
+
+
+def percentile(values: Sequence[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def summary_ms(seconds: Sequence[float]) -> str:
+    """p50 / p95 / max of a list of durations, in milliseconds
+    """
+    return " / ".join(f"{value * 1000:.2f}" for value in (
+        statistics.median(seconds), percentile(seconds, 0.95), max(seconds)))
+
+
+def print_table(columns: Sequence[str], rows: Sequence[Sequence]):
+    widths = [max(len(str(value)) for value in [column, *(row[i] for row in rows)])
+              for i, column in enumerate(columns)]
+    print("  ".join(str(column).rjust(width)
+          for column, width in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(str(value).rjust(width)
+              for value, width in zip(row, widths)))
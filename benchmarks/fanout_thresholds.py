@@ -0,0 +1,98 @@
+"""Write amplification and home timeline read latency at several fan-out
+thresholds (TIMELINE_FANOUT_FOLLOWER_THRESHOLD).
+
+Authors at or below the threshold push each tweet into every follower's
+timeline (timeline rows written per tweet), authors above it are pulled and
+merged in when a timeline is read.
+
+    BENCH_DATABASE_URL=postgresql://postgres@localhost/twitter_bench python -m benchmarks.fanout_thresholds
+"""
+# Standard Library
+import random
+import time
+
+# SQLAlchemy
+from sqlalchemy import delete, func, insert, update
+
+# Custom Modules
+from api import crud, models, schemas
+from api.core.config import settings
+from benchmarks.common import bench_engine, bench_sessionmaker, create_users, print_table, summary_ms
+
+READERS = 2000
+# (followers each, number of authors)
+AUTHORS = [(10, 100), (100, 20), (500, 6), (2000, 2)]
+TWEETS_PER_AUTHOR = 10
+SAMPLED_READERS = 200
+PAGE_SIZE = 50
+THRESHOLDS = [0, 50, 250, 1000, 10000]
+
+
+def seed(db):
+    random.seed(0)
+    readers = create_users(db, READERS, "reader")
+    authors = []
+    follows = []
+    for followers, count in AUTHORS:
+        for author_id in create_users(db, count, f"author{followers}_"):
+            authors.append(author_id)
+            follows += [dict(user_id=reader_id, follows_user_id=author_id)
+                        for reader_id in random.sample(readers, followers)]
+    db.execute(insert(models.Follows).values(follows))
+    db.commit()
+    crud.reconcile_counters(db)
+    return readers, authors
+
+
+def run(db, readers, authors, threshold):
+    settings.TIMELINE_FANOUT_FOLLOWER_THRESHOLD = threshold
+    db.execute(delete(models.Timeline))
+    db.execute(delete(models.Tweet))
+    # Authors stay pull authors once they were (see crud.is_pull_author)
+    db.execute(update(models.User).values(pull_author=False))
+    db.commit()
+
+    writes = []
+    for i in range(TWEETS_PER_AUTHOR):
+        for author_id in authors:
+            started = time.perf_counter()
+            crud.create_user_tweet(db, schemas.TweetCreate(
+                content=f"tweet {i}"), author_id)
+            writes.append(time.perf_counter() - started)
+    tweets = TWEETS_PER_AUTHOR * len(authors)
+    timeline_rows = db.query(func.count(models.Timeline.tweet_id)).scalar()
+
+    reads = []
+    for reader_id in random.sample(readers, SAMPLED_READERS):
+        started = time.perf_counter()
+        crud.get_home_timeline(db, reader_id, limit=PAGE_SIZE)
+        reads.append(time.perf_counter() - started)
+        db.expunge_all()
+
+    pull_authors = sum(1 for followers, count in AUTHORS
+                       if followers > threshold for _ in range(count))
+    return [
+        threshold,
+        pull_authors,
+        f"{timeline_rows / tweets:.1f}",
+        summary_ms(writes),
+        summary_ms(reads),
+    ]
+
+
+def main():
+    engine = bench_engine()
+    db = bench_sessionmaker(engine)()
+    readers, authors = seed(db)
+    rows = [run(db, readers, authors, threshold)
+            for threshold in THRESHOLDS]
+    print(f"{READERS} readers, {len(authors)} authors x {TWEETS_PER_AUTHOR} tweets, "
+          f"{SAMPLED_READERS} home timeline reads of {PAGE_SIZE}")
+    print_table(["threshold", "pull authors", "rows/tweet",
+                 "write ms p50/p95/max", "read ms p50/p95/max"], rows)
+    db.close()
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
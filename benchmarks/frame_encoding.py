@@ -0,0 +1,101 @@
+"""Cost of serializing one WebSocket message (a comments.new event) for 10k
+connections:
+
+- per recipient, json: jsonable_encoder + json.dumps for every connection
+  (how send_personal_message and broadcast worked before Frame).
+- per recipient, orjson: Frame.encode for every connection.
+- once: Frame.encode and stamp once, the same text for everyone.
+- once + enqueue: the above, plus queueing the frame on 10k connections
+  (everything broadcast_local does besides the replay buffers).
+
+    python -m benchmarks.frame_encoding
+"""
+# Standard Library
+import datetime
+import json
+import statistics
+import time
+
+# FastAPI
+from fastapi.encoders import jsonable_encoder
+
+# Custom Modules
+from api import schemas
+from api.core.websocket.connection import Connection
+from api.core.websocket.frame import Frame
+from api.schemas.websockets import WSMessage, WSMessageAction
+from benchmarks.common import print_table
+
+CONNECTIONS = 10000
+REPEAT = 7
+
+
+def message():
+    return WSMessage[schemas.WSCommentCreated](
+        action=WSMessageAction.NewComment,
+        body=schemas.WSCommentCreated(comment=schemas.Comment(
+            id=1234,
+            userId=42,
+            tweetId=987,
+            content="Replying to a viral tweet with a comment of a typical length.",
+            username="someone",
+            createdAt=datetime.datetime.now(datetime.timezone.utc),
+        ))
+    )
+
+
+def per_recipient_json(msg, connections):
+    for _ in connections:
+        json.dumps(jsonable_encoder(msg))
+
+
+def per_recipient_orjson(msg, connections):
+    for _ in connections:
+        Frame.encode(msg)
+
+
+def once(msg, connections):
+    Frame.encode(msg).stamp("0123456789ab:1", 1)
+
+
+def once_and_enqueue(msg, connections):
+    frame = Frame.encode(msg).stamp("0123456789ab:1", 1)
+    for connection in connections:
+        connection.send(frame)
+
+
+def run(name, fn, msg, connections):
+    timings = []
+    for _ in range(REPEAT):
+        for connection in connections:
+            while not connection.queue.empty():
+                connection.queue.get_nowait()
+        started = time.perf_counter()
+        fn(msg, connections)
+        timings.append(time.perf_counter() - started)
+    median = statistics.median(timings)
+    return name, median, [name, f"{min(timings) * 1000:.2f}", f"{median * 1000:.2f}",
+                          f"{median / CONNECTIONS * 1e9:.0f}"]
+
+
+def main():
+    connections = [Connection(user_id, user_id)
+                   for user_id in range(CONNECTIONS)]
+    msg = message()
+    results = [run(name, fn, msg, connections) for name, fn in [
+        ("per recipient, json", per_recipient_json),
+        ("per recipient, orjson", per_recipient_orjson),
+        ("once", once),
+        ("once + enqueue", once_and_enqueue),
+    ]]
+    baseline = results[0][1]
+    rows = [row + [f"{baseline / median:.0f}x"]
+            for _, median, row in results]
+    print(f"One comments.new message ({len(Frame.encode(msg).text)} bytes) "
+          f"for {CONNECTIONS} connections, best / median of {REPEAT}")
+    print_table(["mode", "best ms", "median ms",
+                 "ns per connection", "speedup"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""Server memory and CPU per idle subscriber: 10k WebSockets (/ws) versus
+10k Server-Sent Events streams (/events/stream).
+
+For each kind, a fresh uvicorn worker is started on BENCH_DATABASE_URL and
+SUBSCRIBERS clients (one user each) connect from this process and stay idle.
+Memory is the growth of the worker's resident set, CPU is what the worker
+used over IDLE_SECONDS with nothing to send: SSE heartbeats
+(SSE_HEARTBEAT_SECONDS) and WebSocket pings.
+
+Needs uvicorn and enough file descriptors (ulimit -n) for SUBSCRIBERS
+sockets on both ends.
+
+    BENCH_DATABASE_URL=postgresql://postgres@localhost/twitter_bench python -m benchmarks.idle_subscribers
+"""
+# Standard Library
+import asyncio
+import base64
+import os
+import socket
+import subprocess
+import sys
+import time
+
+# Custom Modules
+from api.core import security
+from api.core.config import settings
+from benchmarks.common import BENCH_DATABASE_URL, bench_engine, bench_sessionmaker, create_users, print_table
+
+SUBSCRIBERS = 10000
+# Handshakes in flight at once
+CONNECT_CONCURRENCY = 100
+SETTLE_SECONDS = 5
+IDLE_SECONDS = 60
+WARMUP = 100
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_kb(pid: int) -> int:
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def cpu_seconds(pid: int) -> float:
+    with open(f"/proc/{pid}/stat") as stat:
+        fields = stat.read().rsplit(")", 1)[1].split()
+    # utime and stime, in clock ticks
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+async def read_headers(reader: asyncio.StreamReader) -> str:
+    return (await reader.readuntil(b"\r\n\r\n")).decode()
+
+
+async def idle_websocket(port: int, user_id: int, token: str, connected: asyncio.Event, open_clients: set):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    key = base64.b64encode(os.urandom(16)).decode()
+    writer.write((
+        f"GET /ws/{user_id} HTTP/1.1\r\nHost: localhost\r\n"
+        "Upgrade: websocket\r\nConnection: Upgrade\r\n"
+        f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n"
+        f"Authorization: Bearer {token}\r\n\r\n").encode())
+    headers = await read_headers(reader)
+    if " 101 " not in headers.split("\r\n", 1)[0]:
+        raise RuntimeError(headers)
+    connected.set()
+    open_clients.add(writer)
+    try:
+        while True:
+            first, second = await reader.readexactly(2)
+            length = second & 0x7f
+            if length == 126:
+                length = int.from_bytes(await reader.readexactly(2), "big")
+            elif length == 127:
+                length = int.from_bytes(await reader.readexactly(8), "big")
+            payload = await reader.readexactly(length)
+            opcode = first & 0x0f
+            if opcode == 0x9:
+                # Answer pings (masked with a zero key, so the payload is unchanged)
+                writer.write(bytes([0x8a, 0x80 | length]) +
+                             b"\0\0\0\0" + payload)
+            elif opcode == 0x8:
+                break
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        open_clients.discard(writer)
+        writer.close()
+
+
+async def idle_event_stream(port: int, user_id: int, token: str, connected: asyncio.Event, open_clients: set):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write((
+        "GET /events/stream HTTP/1.1\r\nHost: localhost\r\n"
+        "Accept: text/event-stream\r\n"
+        f"Authorization: Bearer {token}\r\n\r\n").encode())
+    headers = await read_headers(reader)
+    if " 200 " not in headers.split("\r\n", 1)[0]:
+        raise RuntimeError(headers)
+    connected.set()
+    open_clients.add(writer)
+    try:
+        while await reader.read(4096):
+            pass
+    except ConnectionError:
+        pass
+    finally:
+        open_clients.discard(writer)
+        writer.close()
+
+
+async def open_clients_of(kind: str, port: int, subscribers, open_clients: set, tasks: list):
+    client = idle_websocket if kind == "websocket" else idle_event_stream
+    slots = asyncio.Semaphore(CONNECT_CONCURRENCY)
+
+    async def connect(user_id: int, token: str):
+        async with slots:
+            connected = asyncio.Event()
+            task = asyncio.ensure_future(client(
+                port, user_id, token, connected, open_clients))
+            tasks.append(task)
+            done, _ = await asyncio.wait(
+                [task, asyncio.ensure_future(connected.wait())], return_when=asyncio.FIRST_COMPLETED)
+            if task in done:
+                # Failed before connecting
+                task.result()
+
+    await asyncio.gather(*(connect(user_id, token) for user_id, token in subscribers))
+
+
+async def close_all(tasks: list):
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def run(kind: str, subscribers):
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.main:app", "--port", str(port),
+         "--loop", "asyncio", "--http", "h11", "--ws", "websockets", "--log-level", "warning"],
+        env={**os.environ, "ENV": "localhost-development", "LOCAL_POSTGRES_URL": BENCH_DATABASE_URL,
+             "SECRET_KEY": settings.SECRET_KEY},
+    )
+    try:
+        while True:
+            try:
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                writer.close()
+                break
+            except ConnectionError:
+                await asyncio.sleep(0.2)
+
+        # Warm up with a few clients so imports and caches are not counted
+        warmup_clients, warmup_tasks = set(), []
+        await open_clients_of(kind, port, subscribers[:WARMUP], warmup_clients, warmup_tasks)
+        await close_all(warmup_tasks)
+        await asyncio.sleep(SETTLE_SECONDS)
+        rss_before = rss_kb(server.pid)
+
+        open_clients, tasks = set(), []
+        started = time.perf_counter()
+        await open_clients_of(kind, port, subscribers, open_clients, tasks)
+        connect_seconds = time.perf_counter() - started
+        await asyncio.sleep(SETTLE_SECONDS)
+        rss_after = rss_kb(server.pid)
+
+        cpu_before = cpu_seconds(server.pid)
+        await asyncio.sleep(IDLE_SECONDS)
+        cpu_idle = cpu_seconds(server.pid) - cpu_before
+        still_open = len(open_clients)
+
+        await close_all(tasks)
+    finally:
+        server.terminate()
+        server.wait()
+
+    count = len(subscribers)
+    return [
+        kind,
+        f"{connect_seconds:.1f}",
+        f"{still_open}/{count}",
+        f"{(rss_after - rss_before) / 1024:.1f}",
+        f"{(rss_after - rss_before) / count:.1f}",
+        f"{cpu_idle / IDLE_SECONDS * 100:.2f}",
+        f"{cpu_idle / IDLE_SECONDS / count * 1e6:.2f}",
+    ]
+
+
+async def main():
+    engine = bench_engine()
+    db = bench_sessionmaker(engine)()
+    users = create_users(db, SUBSCRIBERS, "subscriber")
+    db.close()
+    engine.dispose()
+    # The same claims as a login (see create_users for the emails)
+    subscribers = [(user_id, security.create_access_token({"sub": f"subscriber{i}@example.com", "uid": user_id}))
+                   for i, user_id in enumerate(users)]
+
+    rows = [await run("websocket", subscribers), await run("event stream", subscribers)]
+    print(f"{SUBSCRIBERS} idle subscribers, CPU over {IDLE_SECONDS} s "
+          f"(SSE heartbeat every {settings.SSE_HEARTBEAT_SECONDS} s)")
+    print_table(["kind", "connect s", "open at end", "RSS growth MB", "KB per subscriber",
+                 "idle CPU % of a core", "CPU us/s per subscriber"], rows)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
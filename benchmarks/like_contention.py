@@ -0,0 +1,149 @@
+"""Row lock contention on a viral tweet: 1000 users like the same tweet at
+once, with like_count updated in every like's transaction (direct) and with
+the updates batched by the CounterBuffer (buffered).
+
+Each liker is a thread (like a sync route in the threadpool) sharing a pool
+of CONNECTIONS connections. Lock wait is the time spent in UPDATE tweets
+statements, which block while another transaction holds the row, and the
+most transactions seen waiting on a lock at once (sampled from pg_locks).
+
+    BENCH_DATABASE_URL=postgresql://postgres@localhost/twitter_bench python -m benchmarks.like_contention
+"""
+# Standard Library
+import threading
+import time
+
+# SQLAlchemy
+from sqlalchemy import event, text
+
+# Custom Modules
+from api import crud, models
+from api.core.counters import tweet_like_counter
+from benchmarks.common import bench_engine, bench_sessionmaker, create_users, print_table, summary_ms
+
+LIKERS = 1000
+# Stay below the server's max_connections (100 by default)
+CONNECTIONS = 80
+FLUSH_INTERVAL_MS = 500
+
+
+class UpdateTimer:
+    """Sums the time spent in UPDATE tweets statements
+    """
+
+    def __init__(self):
+        self.durations = []
+        self.lock = threading.Lock()
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info["started"] = time.perf_counter()
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("UPDATE tweets"):
+            with self.lock:
+                self.durations.append(
+                    time.perf_counter() - conn.info["started"])
+
+
+def sample_lock_waiters(engine, stop: threading.Event, peak: list):
+    with engine.connect() as conn:
+        while not stop.is_set():
+            waiting = conn.execute(text(
+                "SELECT count(*) FROM pg_locks WHERE NOT granted")).scalar()
+            peak[0] = max(peak[0], waiting)
+            time.sleep(0.005)
+
+
+def flush_periodically(SessionLocal, stop: threading.Event):
+    db = SessionLocal()
+    while not stop.wait(FLUSH_INTERVAL_MS / 1000):
+        tweet_like_counter.flush(db)
+    db.close()
+
+
+def run(mode: str):
+    engine = bench_engine(pool_size=CONNECTIONS,
+                          max_overflow=0, pool_timeout=120)
+    SessionLocal = bench_sessionmaker(engine)
+    db = SessionLocal()
+    author_id = create_users(db, 1, "author")[0]
+    likers = create_users(db, LIKERS, "liker")
+    tweet = models.Tweet(content="viral", user_id=author_id)
+    db.add(tweet)
+    db.commit()
+    tweet_id = tweet.id
+    db.close()
+
+    tweet_like_counter.flush_interval_ms = FLUSH_INTERVAL_MS if mode == "buffered" else 0
+    timer = UpdateTimer()
+    event.listen(engine, "before_cursor_execute", timer.before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", timer.after_cursor_execute)
+
+    stop = threading.Event()
+    peak = [0]
+    sampler = threading.Thread(
+        target=sample_lock_waiters, args=(engine, stop, peak))
+    sampler.start()
+    if mode == "buffered":
+        flusher = threading.Thread(
+            target=flush_periodically, args=(SessionLocal, stop))
+        flusher.start()
+
+    start = threading.Barrier(LIKERS + 1)
+    latencies = []
+
+    def like(user_id):
+        db = SessionLocal()
+        start.wait()
+        started = time.perf_counter()
+        crud.create_tweet_like_for_tweet(db, tweet_id, user_id)
+        latencies.append(time.perf_counter() - started)
+        db.close()
+
+    threads = [threading.Thread(target=like, args=(user_id,))
+               for user_id in likers]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    sampler.join()
+    if mode == "buffered":
+        flusher.join()
+        db = SessionLocal()
+        tweet_like_counter.flush(db)
+        db.close()
+
+    with engine.connect() as conn:
+        like_count = conn.execute(text(
+            "SELECT like_count FROM tweets WHERE id = :id"), {"id": tweet_id}).scalar()
+    engine.dispose()
+
+    return [
+        mode,
+        f"{elapsed:.2f}",
+        f"{LIKERS / elapsed:.0f}",
+        summary_ms(latencies),
+        len(timer.durations),
+        f"{sum(timer.durations) * 1000:.0f}",
+        summary_ms(timer.durations),
+        peak[0],
+        like_count,
+    ]
+
+
+def main():
+    rows = [run("direct"), run("buffered")]
+    print(f"{LIKERS} concurrent likers of one tweet, {CONNECTIONS} connections, "
+          f"flush every {FLUSH_INTERVAL_MS} ms when buffered")
+    print_table(["mode", "total s", "likes/s", "like ms p50/p95/max", "updates",
+                 "update ms total", "update ms p50/p95/max", "peak lock waiters",
+                 "like_count"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Event loop lag while logins are running, with bcrypt called on the event
+loop (inline, as before) and through the bounded password hash pool.
+
+A probe task sleeps for PROBE_INTERVAL_MS in a loop and records how late it
+wakes up: that is how long every WebSocket and async route on the worker
+would have been stalled. Logins arrive every ARRIVAL_INTERVAL_MS.
+
+    python -m benchmarks.login_loop_lag
+"""
+# Standard Library
+import asyncio
+import time
+
+# FastAPI
+from fastapi import HTTPException
+
+# Custom Modules
+from api.core import security
+from api.core.config import settings
+from benchmarks.common import print_table, summary_ms
+
+LOGINS = 100
+ARRIVAL_INTERVAL_MS = 10
+PROBE_INTERVAL_MS = 10
+PASSWORD = "correct horse battery staple"
+
+
+async def probe(lags: list, stop: asyncio.Event):
+    interval = PROBE_INTERVAL_MS / 1000
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+
+
+async def run(mode: str, hashed_password: str):
+    lags = []
+    logins = []
+    rejected = 0
+    stop = asyncio.Event()
+    probe_task = asyncio.ensure_future(probe(lags, stop))
+
+    async def login():
+        nonlocal rejected
+        started = time.perf_counter()
+        try:
+            if mode == "inline":
+                security.verify_password(PASSWORD, hashed_password)
+            else:
+                await security.verify_password_async(PASSWORD, hashed_password)
+        except HTTPException:
+            rejected += 1
+            return
+        logins.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    tasks = []
+    for _ in range(LOGINS):
+        tasks.append(asyncio.ensure_future(login()))
+        await asyncio.sleep(ARRIVAL_INTERVAL_MS / 1000)
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await probe_task
+
+    return [
+        mode,
+        f"{elapsed:.2f}",
+        len(logins),
+        rejected,
+        summary_ms(logins),
+        summary_ms(lags),
+    ]
+
+
+async def main():
+    hashed_password = security.get_password_hash(PASSWORD)
+    started = time.perf_counter()
+    security.verify_password(PASSWORD, hashed_password)
+    hash_ms = (time.perf_counter() - started) * 1000
+
+    rows = [await run("inline", hashed_password), await run("pool", hashed_password)]
+    print(f"{LOGINS} logins, one every {ARRIVAL_INTERVAL_MS} ms, one bcrypt verify takes {hash_ms:.0f} ms, "
+          f"pool of {settings.PASSWORD_HASH_WORKERS} workers + {settings.PASSWORD_HASH_QUEUE_SIZE} queued")
+    print_table(["mode", "total s", "logins", "rejected (503)", "login ms p50/p95/max",
+                 "loop lag ms p50/p95/max"], rows)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,138 @@
+# Standard Library
+import datetime
+import os
+from contextlib import contextmanager
+
+# Types
+from typing import List
+
+# Pytest
+import pytest
+
+# FastAPI
+from fastapi.testclient import TestClient
+
+# SQLAlchemy
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+# Custom Modules
+from api import crud, dependencies, models, schemas
+from api.database import Base
+from api.main import app
+
+#
+# The tests run against a real Postgres database (the queries use
+# Postgres-only features), which is dropped and recreated on every run:
+#
+#   TEST_DATABASE_URL=postgresql://postgres@localhost/twitter_test python -m pytest
+#
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+
+
+class QueryCounter:
+    """Records every statement sent to the database while it is active
+    """
+
+    def __init__(self):
+        self.statements: List[str] = []
+        self.active = False
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self.active:
+            self.statements.append(statement)
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    @contextmanager
+    def __call__(self):
+        self.statements = []
+        self.active = True
+        try:
+            yield self
+        finally:
+            self.active = False
+
+
+@pytest.fixture(scope="session")
+def engine():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    engine = create_engine(TEST_DATABASE_URL)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    yield engine
+    Base.metadata.drop_all(engine)
+    engine.dispose()
+
+
+@pytest.fixture(scope="session")
+def session_factory(engine):
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture(scope="session")
+def seed(session_factory):
+    """Three users following each other, each with 20 tweets. Every tweet has
+    a comment and a like from the other users, and there are messages
+    between alice and bob.
+    """
+    db = session_factory()
+    users = [
+        models.User(email=f"{name}@example.com", username=name, bio="",
+                    birthdate=datetime.date(2000, 1, 1),
+                    hashed_password="hashed", account_verified=True)
+        for name in ("alice", "bob", "carol")
+    ]
+    db.add_all(users)
+    db.commit()
+    for user in users:
+        for other in users:
+            if other.id != user.id:
+                crud.create_follow_relationship(db, user.id, other.id)
+    for i in range(20):
+        for user in users:
+            tweet = crud.create_user_tweet(
+                db, schemas.TweetCreate(content=f"tweet {i}"), user.id)
+            for other in users:
+                if other.id != user.id:
+                    crud.create_tweet_comment(db, other.id, schemas.CommentCreate(
+                        tweetId=tweet.id, content=f"comment on {i}"))
+                    crud.create_tweet_like_for_tweet(db, tweet.id, other.id)
+    alice, bob, carol = users
+    for i in range(20):
+        crud.create_message(db, alice.id, schemas.MessageCreateRequestBody(
+            content=f"hi {i}", userToId=bob.id))
+        crud.create_message(db, bob.id, schemas.MessageCreateRequestBody(
+            content=f"hello {i}", userToId=alice.id))
+    crud.create_message(db, carol.id, schemas.MessageCreateRequestBody(
+        content="hey", userToId=alice.id))
+    seed = {user.username: schemas.UserWithPassword.from_orm(user) for user in users}
+    db.close()
+    return seed
+
+
+@pytest.fixture
+def queries(engine):
+    counter = QueryCounter()
+    event.listen(engine, "before_cursor_execute", counter.before_cursor_execute)
+    yield counter
+    event.remove(engine, "before_cursor_execute", counter.before_cursor_execute)
+
+
+@pytest.fixture
+def client(session_factory, seed):
+    def get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[dependencies.get_db] = get_db
+    # Authenticate as alice without a token (the principal is normally cached)
+    app.dependency_overrides[dependencies.get_current_user] = lambda: seed["alice"]
+    yield TestClient(app)
+    app.dependency_overrides.clear()
@@ -0,0 +1,40 @@
+# Custom Modules
+from api import crud, models, schemas
+from api.core.counters import CounterBuffer
+
+
+def like_count(db, tweet_id: int) -> int:
+    db.expire_all()
+    return crud.get_like_count_for_tweet(db, tweet_id)
+
+
+def test_buffered_like_counts_survive_reconciliation(session_factory, seed):
+    """A recount while a worker still has the tweet marked must not make
+    the next flush count those likes twice, and a lost flush is repaired
+    """
+    buffer = CounterBuffer(models.Tweet.like_count,
+                           models.TweetLikes.tweet_id, 500)
+    db = session_factory()
+    tweet = crud.create_user_tweet(db, schemas.TweetCreate(
+        content="counted"), seed["alice"].id)
+
+    for user in ("bob", "carol"):
+        db.add(models.TweetLikes(tweet_id=tweet.id, user_id=seed[user].id))
+        db.commit()
+        buffer.mark(tweet.id)
+    assert like_count(db, tweet.id) == 0
+
+    crud.reconcile_counters(db)
+    assert like_count(db, tweet.id) == 2
+    buffer.flush(db)
+    assert like_count(db, tweet.id) == 2
+
+    # A worker died before flushing an unlike
+    db.query(models.TweetLikes).filter(
+        models.TweetLikes.tweet_id == tweet.id,
+        models.TweetLikes.user_id == seed["bob"].id).delete()
+    db.commit()
+    assert like_count(db, tweet.id) == 2
+    crud.reconcile_counters(db)
+    assert like_count(db, tweet.id) == 1
+    db.close()
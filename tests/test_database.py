@@ -0,0 +1,79 @@
+# Standard Library
+import asyncio
+import re
+
+# Pytest
+import pytest
+
+# SQLAlchemy
+from sqlalchemy import select, text
+from sqlalchemy.pool import NullPool
+
+# Custom Modules
+from api import database, models
+from api.core.config import settings
+from api.core.db_pool import InstrumentedQueuePool
+
+from .conftest import TEST_DATABASE_URL
+
+ASYNC_TEST_DATABASE_URL = TEST_DATABASE_URL and re.sub(
+    r"^postgres(ql)?(\+\w+)?://", "postgresql+asyncpg://", TEST_DATABASE_URL)
+
+
+@pytest.fixture
+def transaction_pooling(monkeypatch):
+    monkeypatch.setattr(settings, "DB_PGBOUNCER", True)
+    monkeypatch.setattr(settings, "DB_PGBOUNCER_POOL_MODE", "transaction")
+
+
+def test_engines_keep_no_connections_in_transaction_mode(transaction_pooling):
+    engine = database.make_engine("postgresql://localhost/twitter")
+    async_engine = database.make_async_engine(
+        "postgresql+asyncpg://localhost/twitter")
+
+    assert isinstance(engine.pool, NullPool)
+    assert isinstance(async_engine.sync_engine.pool, NullPool)
+
+
+def test_engines_are_pooled_without_pgbouncer(monkeypatch):
+    monkeypatch.setattr(settings, "DB_PGBOUNCER", False)
+    engine = database.make_engine("postgresql://localhost/twitter")
+
+    assert isinstance(engine.pool, InstrumentedQueuePool)
+
+
+def test_unknown_pool_mode_is_refused(monkeypatch):
+    monkeypatch.setattr(settings, "DB_PGBOUNCER", True)
+    monkeypatch.setattr(settings, "DB_PGBOUNCER_POOL_MODE", "statement")
+
+    with pytest.raises(RuntimeError):
+        database.make_engine("postgresql://localhost/twitter")
+
+
+def test_async_engine_prepares_nothing_that_outlives_a_transaction(transaction_pooling, engine):
+    """Runs queries through the transaction mode engine, then checks that
+    the server connection holds no prepared statement a later transaction
+    (possibly another worker's) could trip over
+    """
+    async_engine = database.make_async_engine(ASYNC_TEST_DATABASE_URL)
+
+    async def run():
+        async with async_engine.connect() as conn:
+            for _ in range(3):
+                await conn.execute(select(models.User.id).where(models.User.id == 1))
+                await conn.commit()
+            # Statements asyncpg still holds were created with unique names
+            names = (await conn.execute(text("SELECT name FROM pg_prepared_statements"))).scalars().all()
+            connection = (await conn.get_raw_connection()).connection._connection
+        await async_engine.dispose()
+        return names, connection
+
+    names, connection = asyncio.run(run())
+
+    assert isinstance(connection, database.PgBouncerConnection)
+    # asyncpg < 0.25 names every prepared statement with this
+    name = connection._get_unique_id("stmt")
+    assert re.fullmatch(r"__asyncpg_stmt_[0-9a-f]{32}__", name)
+    assert name != connection._get_unique_id("stmt")
+    assert all(not re.fullmatch(r"__asyncpg_stmt_[0-9a-f]{1,8}__", name)
+               for name in names)
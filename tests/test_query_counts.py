@@ -0,0 +1,78 @@
+# Pytest
+import pytest
+
+# Custom Modules
+from api import crud, models
+from api.core.config import settings
+
+#
+# Every list endpoint must load a page in a fixed number of queries, however
+# long the page is (no lazy load per row). Each case is requested with two
+# page sizes and must cost exactly `expected` queries both times.
+#
+# (url with {limit}, expected queries)
+ENDPOINTS = [
+    # Tweets (with like/comment counts and likedByMe)
+    ("/tweets?limit={limit}", 1),
+    # + user existence check
+    ("/tweets?userId=2&limit={limit}", 2),
+    # pull-mode authors lookup + materialized timeline
+    ("/tweets/home?limit={limit}", 2),
+    # user existence check + likes (with tweets and authors)
+    ("/tweets/liked?limit={limit}", 2),
+    # Comments: tweet/user existence check + comments with authors
+    ("/comments/tweet/1?limit={limit}", 2),
+    ("/comments/user/2?limit={limit}", 2),
+    # Follows and followers: user check + rows with users
+    ("/follows/1?limit={limit}", 2),
+    ("/followers/1?limit={limit}", 2),
+    # Messages: user check + messages with both users
+    ("/messages?limit={limit}", 2),
+    ("/messages/conversation/2?limit={limit}", 1),
+]
+
+
+@pytest.mark.parametrize("url, expected", ENDPOINTS)
+def test_list_endpoint_query_count(client, queries, url, expected):
+    counts = []
+    for limit in (2, 20):
+        with queries():
+            response = client.get(url.format(limit=limit))
+        assert response.status_code == 200, response.text
+        counts.append(queries.count)
+    assert counts == [expected, expected], queries.statements
+
+
+def test_home_timeline_with_pull_authors(client, queries, monkeypatch, session_factory, seed):
+    """Authors above the fan-out threshold are read at request time: pull-mode
+    authors, their recent tweets (one LATERAL query for all of them), the
+    materialized timeline and the page itself
+    """
+    monkeypatch.setattr(settings, "TIMELINE_FANOUT_FOLLOWER_THRESHOLD", 0)
+    db = session_factory()
+    for user in seed.values():
+        crud.is_pull_author(db, user.id)
+    db.commit()
+    try:
+        counts = []
+        for limit in (2, 20):
+            with queries():
+                response = client.get(f"/tweets/home?limit={limit}")
+            assert response.status_code == 200, response.text
+            assert len(response.json()) == limit
+            counts.append(queries.count)
+        assert counts == [4, 4], queries.statements
+    finally:
+        db.query(models.User).update({models.User.pull_author: False})
+        db.commit()
+        db.close()
+
+
+def test_conversation_list_query_count(client, queries):
+    """Last message per conversation + unread counts, whatever the history length
+    """
+    with queries():
+        response = client.get("/messages/conversations")
+    assert response.status_code == 200, response.text
+    assert [conversation["username"] for conversation in response.json()] == ["carol", "bob"]
+    assert queries.count == 2, queries.statements
@@ -0,0 +1,37 @@
+# Standard Library
+import datetime
+
+# Custom Modules
+from api import crud, models, schemas
+from api.core.config import settings
+
+
+def test_pull_author_tweets_stay_in_timelines_below_the_threshold(session_factory, monkeypatch):
+    """An author crosses the fan-out threshold and drops back below it: the
+    tweets (and the follow) that skipped the timelines meanwhile still show
+    """
+    monkeypatch.setattr(settings, "TIMELINE_FANOUT_FOLLOWER_THRESHOLD", 1)
+    db = session_factory()
+    author, first_reader, second_reader = users = [
+        models.User(email=f"{name}@example.com", username=name, bio="",
+                    birthdate=datetime.date(2000, 1, 1),
+                    hashed_password="hashed", account_verified=True)
+        for name in ("dana", "erin", "frank")
+    ]
+    db.add_all(users)
+    db.commit()
+
+    crud.create_follow_relationship(db, first_reader.id, author.id)
+    pushed = crud.create_user_tweet(db, schemas.TweetCreate(content="pushed"), author.id)
+    # Above the threshold: no back-fill for this follow, and no fan-out
+    crud.create_follow_relationship(db, second_reader.id, author.id)
+    pulled = crud.create_user_tweet(db, schemas.TweetCreate(content="pulled"), author.id)
+    assert db.query(models.Timeline).filter(models.Timeline.tweet_id == pulled.id).count() == 0
+
+    crud.delete_follow_relationship(db, first_reader.id, author.id)
+    assert crud.get_followers_for_user(db, author.id) == 1
+    assert crud.is_pull_author(db, author.id)
+
+    timeline = crud.get_home_timeline(db, second_reader.id)
+    assert [tweet.id for tweet in timeline] == [pulled.id, pushed.id]
+    db.close()
@@ -0,0 +1,99 @@
+# Standard Library
+import asyncio
+import json
+
+# Pytest
+import pytest
+
+# Custom Modules
+from api.core.config import settings
+from api.core.websocket.broker import Broker, InMemoryBroker, PostgresBroker, RedisBroker
+from api.core.websocket.connection_manager import ConnectionManager
+from api.core.websocket.topics import conversation_topic
+from api.schemas.websockets import WSMessageAction
+
+ALICE, BOB, CAROL = 1, 2, 3
+
+
+def received(connection):
+    actions = []
+    while not connection.queue.empty():
+        actions.append(json.loads(connection.queue.get_nowait().text)["action"])
+    return actions
+
+
+def test_conversation_subscribers_receive_messages_and_typing():
+    """Bob gets the conversation's events without subscribing, alice's tab
+    subscribed to conversation:1-2 gets them too (except her own typing)
+    """
+    async def run():
+        manager = ConnectionManager(InMemoryBroker())
+        topic = conversation_topic(BOB, ALICE)
+        subscribed = await manager.connect_stream(ALICE, [topic])
+        other_tab = await manager.connect_stream(ALICE)
+        bob = await manager.connect_stream(BOB)
+        carol = await manager.connect_stream(CAROL, [topic])
+        assert topic in subscribed.topics and topic not in carol.topics
+
+        for action in (WSMessageAction.ChatMessageNew, WSMessageAction.ChatMessageDeleted):
+            await manager.send_to_conversation(ALICE, BOB, {"action": action})
+        assert await manager.send_typing(ALICE, BOB, {"action": WSMessageAction.ChatUserTyping})
+        assert await manager.send_typing(BOB, ALICE, {"action": WSMessageAction.ChatUserTyping})
+        return [received(connection) for connection in (subscribed, other_tab, bob, carol)]
+
+    subscribed, other_tab, bob, carol = asyncio.run(run())
+
+    assert subscribed == ["chat.message.new", "chat.message.deleted", "chat.user.typing"]
+    assert other_tab == ["chat.user.typing"]
+    assert bob == ["chat.message.new", "chat.message.deleted", "chat.user.typing"]
+    assert carol == []
+
+
+def test_resume_on_another_worker_says_why_it_must_resync(monkeypatch):
+    """The worker id in eventId tells a worker that a lastEventId is not its
+    own, whatever the sequence numbers. The same worker replays the missed events.
+    """
+    monkeypatch.setattr(settings, "WS_REPLAY_BUFFER_SIZE", 2)
+
+    async def run():
+        first, second = ConnectionManager(InMemoryBroker()), ConnectionManager(InMemoryBroker())
+        # Both workers are at the same sequence numbers
+        for manager in (first, second):
+            connection = await manager.connect_stream(ALICE)
+            # One more than the buffer keeps
+            for action in (WSMessageAction.NewFollower, WSMessageAction.LostFollower, WSMessageAction.NewComment):
+                await manager.send_personal_message({"action": action}, ALICE)
+            await manager.disconnect(connection)
+        last_event_id = json.loads(connection.queue.get_nowait().text)["eventId"]
+        assert last_event_id == f"{second.worker_id}:1"
+
+        resumed = [
+            await manager.connect_stream(ALICE, last_event_id=event_id)
+            for manager, event_id in ((second, last_event_id), (first, last_event_id),
+                                      (second, f"{second.worker_id}:0"), (second, "1"))
+        ]
+        return [json.loads(connection.queue.get_nowait().text) for connection in resumed]
+
+    replayed, other_worker, expired, invalid = asyncio.run(run())
+
+    assert replayed["action"] == "followers.unfollowed"
+    assert other_worker["action"] == "events.resync"
+    assert other_worker["body"]["reason"] == "other_worker"
+    assert other_worker["body"]["lastEventId"].split(":")[0] != other_worker["body"]["workerId"]
+    assert expired["body"]["reason"] == "events_expired"
+    assert invalid["body"]["reason"] == "invalid_event_id"
+
+
+def test_brokers_implement_every_broker_method():
+    class NoPublish(Broker):
+        async def start(self, on_event, on_connect):
+            pass
+
+        async def stop(self):
+            pass
+
+    for broker in (Broker, NoPublish):
+        with pytest.raises(TypeError):
+            broker()
+    for broker in (InMemoryBroker, PostgresBroker, RedisBroker):
+        assert not broker.__abstractmethods__